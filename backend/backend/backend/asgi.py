@@ -3,6 +3,10 @@ ASGI config for backend project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Serve it with an ASGI server (e.g. ``uvicorn backend.asgi:application``) so the
+async message endpoint (chatbot_backend.views.async_conversation_views) can keep
+many conversations in flight per process.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -14,3 +18,9 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
 application = get_asgi_application()
+
+from chatbot_backend.services.query_processing import warmup_pipeline  # noqa: E402 (needs the app registry)
+from chatbot_backend.services.job_workers import start_job_workers  # noqa: E402
+
+warmup_pipeline()
+start_job_workers()
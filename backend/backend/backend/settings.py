@@ -84,6 +84,27 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Background response generation (chatbot_backend/services/generation_jobs.py)
+GENERATION_QUEUE = {
+    'mode': 'sync',  # 'background': new messages are answered by queued jobs, the endpoint returns 202
+    'workers': 4,  # worker threads per process, 0 when a separate `manage.py run_job_workers` serves the queue
+    'max_queued': 200,
+    'max_queued_per_user': 5,
+    'max_running_per_user': 1,
+    'poll_interval': 1.0,  # seconds
+}
+
+# Background indexing of uploaded documents (chatbot_backend/services/ingestion_jobs.py)
+INGESTION_QUEUE = {
+    # uploads are indexed one at a time anyway (the index is locked while it is updated)
+    'workers': 1,  # worker threads per process, 0 when a separate `manage.py run_job_workers --queue ingestion` serves the queue
+    'max_queued': 100,
+    'max_queued_per_user': 20,
+    'max_running_per_user': 1,
+    'poll_interval': 1.0,  # seconds
+    'max_upload_size': DATA_UPLOAD_MAX_MEMORY_SIZE,  # bytes per request, checked before the body is read
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator',
@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
 application = get_wsgi_application()
+
+from chatbot_backend.services.query_processing import warmup_pipeline  # noqa: E402 (needs the app registry)
+from chatbot_backend.services.job_workers import start_job_workers  # noqa: E402
+
+warmup_pipeline()
+start_job_workers()
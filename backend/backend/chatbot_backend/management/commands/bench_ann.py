@@ -0,0 +1,95 @@
+import statistics
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from chatbot_backend.services.processing_pipeline import response_pipeline
+from chatbot_backend.services.processing_pipeline.custom.ivf_index import IVFIndex, normalize
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def synthetic_embeddings(count, dimension, clusters, seed=0):
+    """Unit vectors around random topics, closer to real embeddings than uniform noise"""
+    rng = np.random.default_rng(seed)
+    topics = rng.normal(size=(clusters, dimension)).astype(np.float32)
+    embeddings = topics[rng.integers(clusters, size=count)]
+    embeddings += rng.normal(scale=0.6, size=embeddings.shape).astype(np.float32)
+    return normalize(embeddings)
+
+
+class Command(BaseCommand):
+    help = (
+        "Recall against exact search and latency (p50/p99) of IVF index settings, on the embeddings of the "
+        "document store (numpy_store, exported from Chroma on first use) or on --synthetic ones. "
+        "Every combination of --nlist and --pq-m is built once and searched with every --nprobe."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--synthetic', type=int, default=0,
+                            help='benchmark this many synthetic embeddings instead of the store, e.g. 1000000')
+        parser.add_argument('--dimension', type=int, default=1024, help='of the synthetic embeddings')
+        parser.add_argument('--nlist', type=int, nargs='+', default=[None],
+                            help='lists of the index, the default is 4 * sqrt(documents)')
+        parser.add_argument('--pq-m', type=int, nargs='+', default=[0], help='0 for IVF-Flat')
+        parser.add_argument('--nprobe', type=int, nargs='+', default=[1, 4, 16, 64])
+        parser.add_argument('--rerank', type=int, default=200)
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--top-k', type=int, default=5)
+        parser.add_argument('--train-sample', type=int, default=40000)
+
+    def handle(self, *args, synthetic, dimension, nlist, pq_m, nprobe, rerank, queries, top_k, train_sample, **options):
+        if synthetic:
+            embeddings = synthetic_embeddings(synthetic, dimension, clusters=max(1, synthetic // 1000))
+        else:
+            documents = response_pipeline.build_numpy_store().filter_documents()
+            if not documents:
+                raise CommandError("The document store is empty")
+            embeddings = np.array([document.embedding for document in documents], dtype=np.float32)
+        norms = np.linalg.norm(embeddings, axis=1)
+        unit_embeddings = normalize(embeddings, norms)
+
+        rng = np.random.default_rng(1)
+        query_embeddings = unit_embeddings[rng.integers(len(embeddings), size=queries)]
+        query_embeddings = normalize(query_embeddings + rng.normal(scale=0.02, size=query_embeddings.shape))
+
+        exact, exact_latencies = [], []
+        for query in query_embeddings:
+            start = time.perf_counter()
+            scores = unit_embeddings @ query
+            k = min(top_k, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+            exact_latencies.append(time.perf_counter() - start)
+            exact.append(set(top.tolist()))
+        self.stdout.write(f"{len(embeddings)} embeddings, dimension {embeddings.shape[1]}, {queries} queries, top_k {top_k}")
+        self.stdout.write(f"[exact] p50: {statistics.median(exact_latencies) * 1000:.3f}ms, "
+                          f"p99: {percentile(exact_latencies, 0.99) * 1000:.3f}ms")
+
+        for index_nlist in nlist:
+            index_nlist = index_nlist or max(1, min(int(4 * np.sqrt(len(embeddings))), len(embeddings) // 39))
+            for index_pq_m in pq_m:
+                start = time.perf_counter()
+                index = IVFIndex(index_nlist, pq_m=index_pq_m or None, rerank=rerank)
+                sample = rng.choice(len(embeddings), size=min(len(embeddings), max(train_sample, 39 * index_nlist)),
+                                    replace=False)
+                index.train(unit_embeddings[np.sort(sample)])
+                index.set_rows(*index.encode(unit_embeddings))
+                build_time = time.perf_counter() - start
+                name = f"nlist={index.nlist} " + (f"pq_m={index_pq_m} rerank={rerank}" if index_pq_m else "flat")
+                self.stdout.write(f"[{name}] built in {build_time:.1f}s, index {index.nbytes() / 1e6:.1f}MB")
+
+                for probes in nprobe:
+                    latencies, recalls = [], []
+                    for query, expected in zip(query_embeddings, exact):
+                        start = time.perf_counter()
+                        rows, _ = index.search(query, top_k, embeddings, norms, nprobe=probes)
+                        latencies.append(time.perf_counter() - start)
+                        recalls.append(len(expected & set(rows.tolist())) / len(expected))
+                    self.stdout.write(
+                        f"    nprobe={probes}: recall@{top_k} {statistics.mean(recalls):.3f}, "
+                        f"p50: {statistics.median(latencies) * 1000:.3f}ms, p99: {percentile(latencies, 0.99) * 1000:.3f}ms"
+                    )
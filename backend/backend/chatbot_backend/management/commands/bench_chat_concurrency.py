@@ -0,0 +1,94 @@
+import os
+import statistics
+import tempfile
+import threading
+import time
+from unittest import mock
+
+from django.core.management.base import BaseCommand
+from django.db import connection, connections, transaction
+from django.test import Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from chatbot_backend.models import User, Conversation
+from chatbot_backend.views import conversation_views
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures message throughput with N users chatting at the same time against a throwaway copy "
+        "of the database schema. Generation is simulated with a sleep so only the request/DB path is measured."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chatters', type=int, default=8, help='number of simultaneous users')
+        parser.add_argument('--messages', type=int, default=5, help='messages sent by each user')
+        parser.add_argument('--latency', type=float, default=1.0, help='simulated generation time in seconds')
+        parser.add_argument('--hold-transaction', action='store_true',
+                            help='run generation inside transaction.atomic as the view used to, for comparison')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            if connection.vendor == 'sqlite':
+                # threads need a file database, the default sqlite test database lives in memory
+                connection.settings_dict['TEST']['NAME'] = os.path.join(tmp_dir, 'bench.sqlite3')
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+            try:
+                self.run_benchmark(**options)
+            finally:
+                connections.close_all()
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+                teardown_test_environment()
+
+    def run_benchmark(self, chatters, messages, latency, hold_transaction, **options):
+        conversations = []
+        for i in range(chatters):
+            user = User.objects.create_user(username=f'bench{i}', email=f'bench{i}@example.com', password='bench')
+            conversations.append(Conversation.objects.create(user=user, title='Benchmark'))
+
+        latencies = []
+        failures = []
+        lock = threading.Lock()
+
+        def chatter(conversation):
+            client = Client(raise_request_exception=False)
+            client.force_login(conversation.user)
+            url = f'/api/conversations/{conversation.id}/messages/'
+            for i in range(messages):
+                start = time.perf_counter()
+                response = client.post(url, {'content': f'question {i}'}, content_type='application/json')
+                elapsed = time.perf_counter() - start
+                with lock:
+                    if response.status_code == 201:
+                        latencies.append(elapsed)
+                    else:
+                        failures.append(response.status_code)
+            connection.close()
+
+        def fake_generate_response(conversation, query, scope=None):
+            time.sleep(latency)
+            return 'answer'
+
+        create = conversation_views.MessageListView.create
+        if hold_transaction:
+            create = transaction.atomic(create)
+
+        with mock.patch.object(conversation_views, 'generate_response', fake_generate_response), \
+             mock.patch.object(conversation_views.MessageListView, 'create', create):
+            threads = [threading.Thread(target=chatter, args=(conversation,)) for conversation in conversations]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            wall_time = time.perf_counter() - start
+
+        self.stdout.write(f"chatters: {chatters}, messages each: {messages}, simulated generation: {latency}s, "
+                          f"transaction held during generation: {hold_transaction}")
+        self.stdout.write(f"succeeded: {len(latencies)}, failed: {len(failures)} {sorted(set(failures)) or ''}")
+        self.stdout.write(f"wall time: {wall_time:.2f}s, throughput: {len(latencies) / wall_time:.2f} messages/s")
+        if latencies:
+            latencies.sort()
+            p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            self.stdout.write(f"latency p50: {statistics.median(latencies):.2f}s, p95: {p95:.2f}s")
@@ -0,0 +1,129 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from chatbot_backend.services.processing_pipeline import response_pipeline
+from chatbot_backend.services.processing_pipeline.config import PROCESSING_CONFIG
+from chatbot_backend.services.processing_pipeline.custom.batching import search_embeddings
+
+STORES = ['chroma', 'numpy']
+
+
+def resident_memory():
+    """Resident set size of this process in bytes"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares the document stores on the same query embeddings: cold start (open + first query), "
+        "resident memory, top-k latency (p50/p99), batched throughput and how many of the exact top-k "
+        "results each one returns. Every store is measured in a fresh process."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stores', nargs='+', choices=STORES, default=STORES)
+        parser.add_argument('--queries', type=int, default=500, help='queries searched per store')
+        parser.add_argument('--top-k', type=int, default=5)
+        parser.add_argument('--batch-size', type=int, default=32, help='queries per batched search')
+        parser.add_argument('--noise', type=float, default=0.05,
+                            help='queries are stored embeddings plus gaussian noise of this scale')
+        # internal: measures one store and prints its results as json
+        parser.add_argument('--child', choices=STORES, help=None)
+        parser.add_argument('--queries-path', help=None)
+
+    def handle(self, *args, stores, queries, top_k, batch_size, noise, child, queries_path, **options):
+        if child:
+            self.stdout.write(json.dumps(self.measure(child, np.load(queries_path), top_k, batch_size)))
+            return
+
+        # exported once here so the numpy cold start measures loading, not the export
+        exact_store = response_pipeline.build_numpy_store()
+        documents = exact_store.filter_documents()
+        if not documents:
+            raise CommandError("The document store is empty")
+        embeddings = np.array([document.embedding for document in documents], dtype=np.float32)
+        rng = np.random.default_rng(0)
+        query_embeddings = embeddings[rng.integers(len(embeddings), size=queries)]
+        query_embeddings += rng.normal(scale=noise, size=query_embeddings.shape).astype(np.float32)
+        query_embeddings /= np.linalg.norm(query_embeddings, axis=1, keepdims=True)
+        exact_ids = [[document.id for document in result]
+                     for result in exact_store.search_embeddings(query_embeddings.tolist(), top_k)]
+
+        with tempfile.NamedTemporaryFile(suffix='.npy', delete=False) as f:
+            np.save(f, query_embeddings)
+        try:
+            self.stdout.write(f"{len(documents)} documents, dimension {embeddings.shape[1]}, "
+                              f"{queries} queries, top_k {top_k}")
+            for store in stores:
+                results = self.run_child(store, f.name, top_k, batch_size)
+                recall = statistics.mean(len(set(ids) & set(exact)) / len(exact)
+                                         for ids, exact in zip(results['ids'], exact_ids) if exact)
+                self.stdout.write(
+                    f"[{store}] cold start: {results['cold_start_ms']:.1f}ms, "
+                    f"memory: {results['memory_bytes'] / 1e6:.1f}MB, "
+                    f"latency p50: {results['p50_ms']:.3f}ms, p99: {results['p99_ms']:.3f}ms, "
+                    f"batched: {results['batched_qps']:.0f} queries/s, recall@{top_k} vs exact: {recall:.3f}"
+                )
+        finally:
+            os.remove(f.name)
+
+    def run_child(self, store, queries_path, top_k, batch_size):
+        command = [sys.executable, str(settings.BASE_DIR / 'manage.py'), 'bench_document_stores',
+                   '--child', store, '--queries-path', queries_path,
+                   '--top-k', str(top_k), '--batch-size', str(batch_size)]
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        # the last line, the store may print while it loads
+        return json.loads(output.strip().splitlines()[-1])
+
+    def measure(self, store, query_embeddings, top_k, batch_size):
+        PROCESSING_CONFIG["response_config"]["document_store"] = store
+        queries = query_embeddings.tolist()
+
+        memory_before = resident_memory()
+        start = time.perf_counter()
+        document_store = response_pipeline.build_document_store()
+        retriever = response_pipeline.build_retriever(document_store, top_k)
+        retriever.run(query_embedding=queries[0])
+        cold_start = time.perf_counter() - start
+
+        latencies = []
+        ids = []
+        for query in queries:
+            start = time.perf_counter()
+            documents = retriever.run(query_embedding=query)['documents']
+            latencies.append(time.perf_counter() - start)
+            ids.append([document.id for document in documents])
+
+        start = time.perf_counter()
+        for batch_start in range(0, len(queries), batch_size):
+            search_embeddings(document_store, [(query, None, top_k)
+                                               for query in queries[batch_start:batch_start + batch_size]])
+        batched_time = time.perf_counter() - start
+
+        return {
+            'cold_start_ms': cold_start * 1000,
+            'memory_bytes': resident_memory() - memory_before,
+            'p50_ms': statistics.median(latencies) * 1000,
+            'p99_ms': percentile(latencies, 0.99) * 1000,
+            'batched_qps': len(queries) / batched_time,
+            'ids': ids,
+        }
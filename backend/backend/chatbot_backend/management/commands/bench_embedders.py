@@ -0,0 +1,78 @@
+import statistics
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+
+from chatbot_backend.services.processing_pipeline import response_pipeline
+
+SAMPLE_QUERIES = [
+    "ما هي شروط التسجيل في الجامعة؟",
+    "كيف يمكنني استعادة كلمة المرور؟",
+    "What documents do I need to apply?",
+    "متى يبدأ الفصل الدراسي القادم؟",
+    "How long does the refund take?",
+    "هل يمكنني تغيير التخصص بعد السنة الأولى؟",
+    "Where can I find the exam schedule?",
+    "ما هي رسوم الدراسة للطلاب الدوليين؟",
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares query embedding latency (p50/p99) and throughput of the embedding backends, "
+        "with N concurrent callers and without the embedding cache"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backends', nargs='+', choices=['api', 'local'], default=['api', 'local'])
+        parser.add_argument('--queries', type=int, default=200, help='queries embedded per backend')
+        parser.add_argument('--concurrency', type=int, default=8, help='number of simultaneous callers')
+
+    def handle(self, *args, backends, queries, concurrency, **options):
+        for backend in backends:
+            embedder = response_pipeline.build_text_embedder(backend)
+            if hasattr(embedder, 'warm_up'):
+                embedder.warm_up()
+            # the first call opens connections / allocates buffers, keep it out of the numbers
+            embedder.run(text=SAMPLE_QUERIES[0])
+            self.run_benchmark(backend, embedder, queries, concurrency)
+
+    def run_benchmark(self, backend, embedder, queries, concurrency):
+        latencies = []
+        failures = []
+        lock = threading.Lock()
+        # suffixes make every query distinct, like real traffic that misses the cache
+        texts = iter(f"{SAMPLE_QUERIES[i % len(SAMPLE_QUERIES)]} {i}" for i in range(queries))
+
+        def caller():
+            while True:
+                with lock:
+                    text = next(texts, None)
+                if text is None:
+                    return
+                start = time.perf_counter()
+                try:
+                    embedder.run(text=text)
+                except Exception as e:
+                    with lock:
+                        failures.append(type(e).__name__)
+                    continue
+                with lock:
+                    latencies.append(time.perf_counter() - start)
+
+        threads = [threading.Thread(target=caller) for _ in range(concurrency)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall_time = time.perf_counter() - start
+
+        self.stdout.write(f"[{backend}] {response_pipeline.get_embedding_model_id(backend)}, concurrency: {concurrency}")
+        self.stdout.write(f"succeeded: {len(latencies)}, failed: {len(failures)} {sorted(set(failures)) or ''}")
+        self.stdout.write(f"wall time: {wall_time:.2f}s, throughput: {len(latencies) / wall_time:.2f} queries/s")
+        if latencies:
+            latencies.sort()
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+            self.stdout.write(f"latency p50: {statistics.median(latencies) * 1000:.1f}ms, p99: {p99 * 1000:.1f}ms")
@@ -0,0 +1,80 @@
+import statistics
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from chatbot_backend.management.commands.bench_ann import percentile, synthetic_embeddings
+from chatbot_backend.services.processing_pipeline import response_pipeline
+from chatbot_backend.services.processing_pipeline.custom.ivf_index import normalize
+from chatbot_backend.services.processing_pipeline.custom.quantization import (
+    DEFAULT_RESCORE_MULTIPLIERS, QUANTIZATIONS, QuantizedEmbeddings, quantized_search
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Memory, latency (p50/p99) and recall against exact float32 search of the quantized embeddings "
+        "(numpy_store quantization), on the embeddings of the document store or on --synthetic ones. "
+        "Every --quantization is searched with every --rescore-multiplier and its default one."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--synthetic', type=int, default=0,
+                            help='benchmark this many synthetic embeddings instead of the store, e.g. 1000000')
+        parser.add_argument('--dimension', type=int, default=1024, help='of the synthetic embeddings')
+        parser.add_argument('--quantization', nargs='+', choices=QUANTIZATIONS, default=list(QUANTIZATIONS))
+        parser.add_argument('--rescore-multiplier', type=int, nargs='+', default=[1, 4, 10],
+                            help="besides each quantization's default (DEFAULT_RESCORE_MULTIPLIERS)")
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--top-k', type=int, default=5)
+
+    def handle(self, *args, synthetic, dimension, quantization, rescore_multiplier, queries, top_k, **options):
+        if synthetic:
+            embeddings = synthetic_embeddings(synthetic, dimension, clusters=max(1, synthetic // 1000))
+        else:
+            documents = response_pipeline.build_numpy_store().filter_documents()
+            if not documents:
+                raise CommandError("The document store is empty")
+            embeddings = np.array([document.embedding for document in documents], dtype=np.float32)
+        norms = np.linalg.norm(embeddings, axis=1)
+        unit_embeddings = normalize(embeddings, norms)
+
+        rng = np.random.default_rng(1)
+        query_embeddings = unit_embeddings[rng.integers(len(embeddings), size=queries)]
+        query_embeddings = normalize(query_embeddings + rng.normal(scale=0.02, size=query_embeddings.shape))
+
+        exact, exact_latencies = [], []
+        for query in query_embeddings:
+            start = time.perf_counter()
+            scores = unit_embeddings @ query
+            k = min(top_k, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+            exact_latencies.append(time.perf_counter() - start)
+            exact.append(set(top.tolist()))
+        self.stdout.write(f"{len(embeddings)} embeddings, dimension {embeddings.shape[1]}, {queries} queries, top_k {top_k}")
+        exact_p50 = statistics.median(exact_latencies)
+        self.stdout.write(f"[float32] {embeddings.nbytes / 1e6:.1f}MB, p50: {exact_p50 * 1000:.3f}ms, "
+                          f"p99: {percentile(exact_latencies, 0.99) * 1000:.3f}ms")
+
+        for kind in quantization:
+            start = time.perf_counter()
+            quantized = QuantizedEmbeddings.build(kind, embeddings)
+            self.stdout.write(f"[{kind}] built in {time.perf_counter() - start:.1f}s, {quantized.nbytes() / 1e6:.1f}MB "
+                              f"({embeddings.nbytes / quantized.nbytes():.0f}x smaller)")
+            if kind == 'int8':
+                self.stdout.write("    int8 saves memory only: its codes are scored as float32, no faster than float32 search")
+            default = DEFAULT_RESCORE_MULTIPLIERS[kind]
+            for multiplier in sorted(set(rescore_multiplier) | {default}):
+                latencies, recalls = [], []
+                for query, expected in zip(query_embeddings, exact):
+                    start = time.perf_counter()
+                    rows, _ = quantized_search(quantized, embeddings, norms, query[None], top_k, multiplier)[0]
+                    latencies.append(time.perf_counter() - start)
+                    recalls.append(len(expected & set(rows.tolist())) / len(expected))
+                p50 = statistics.median(latencies)
+                self.stdout.write(
+                    f"    rescore_multiplier={multiplier}{' (default)' if multiplier == default else ''}: "
+                    f"recall@{top_k} {statistics.mean(recalls):.3f}, p50: {p50 * 1000:.3f}ms "
+                    f"({exact_p50 / p50:.1f}x float32 speed), p99: {percentile(latencies, 0.99) * 1000:.3f}ms"
+                )
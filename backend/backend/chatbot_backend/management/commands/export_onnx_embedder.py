@@ -0,0 +1,42 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from chatbot_backend.services.processing_pipeline.config import PROCESSING_CONFIG, BASE_DIR
+
+
+class Command(BaseCommand):
+    help = (
+        "Exports the embedding model to ONNX, optionally with an int8 dynamically quantized copy, "
+        "for the local embedding backend (response_config['local_embedder'])"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', default=PROCESSING_CONFIG["response_config"]["embedding_model"])
+        parser.add_argument('--output', default=str(BASE_DIR / "models/arabic-english-bge-m3-onnx"),
+                            help='directory the exported model is saved to')
+        parser.add_argument('--quantize', choices=['arm64', 'avx2', 'avx512', 'avx512_vnni', 'none'], default='avx512_vnni',
+                            help='instruction set the int8 model is quantized for, none keeps only the float32 export')
+
+    def handle(self, *args, model, output, quantize, **options):
+        try:
+            from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+        except ImportError:
+            raise CommandError('Run \'pip install "sentence-transformers[onnx]"\' first')
+
+        output = Path(output)
+        self.stdout.write(f"Exporting {model} to ONNX...")
+        # models without an ONNX file on the hub are converted by optimum when loaded with the onnx backend
+        onnx_model = SentenceTransformer(model, device='cpu', backend='onnx')
+        onnx_model.save(str(output))
+        file_name = "onnx/model.onnx"
+
+        if quantize != 'none':
+            self.stdout.write(f"Quantizing to int8 for {quantize}...")
+            export_dynamic_quantized_onnx_model(onnx_model, quantize, str(output))
+            file_name = f"onnx/model_qint8_{quantize}.onnx"
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Done, set response_config["local_embedder"] to model_path={str(output)!r}, file_name={file_name!r} '
+            f'and embedding_backend to "local"'
+        ))
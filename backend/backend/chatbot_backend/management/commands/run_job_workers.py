@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from chatbot_backend.services.job_workers import QUEUES
+
+
+class Command(BaseCommand):
+    help = ("Serves a background job queue from this process "
+            "(set GENERATION_QUEUE['workers'] or INGESTION_QUEUE['workers'] to 0 in the web processes)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queue', choices=sorted(QUEUES), default='generation')
+        parser.add_argument('--workers', type=int, default=None, help="defaults to the queue's 'workers' setting")
+
+    def handle(self, *args, **options):
+        queue = QUEUES[options['queue']]()
+        if options['workers'] is not None:
+            queue.workers = options['workers']
+        if queue.workers <= 0:
+            queue.workers = 1
+        self.stdout.write(f"Serving the {options['queue']} queue with {queue.workers} workers, Ctrl+C to stop")
+        try:
+            queue.serve_forever()
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from chatbot_backend.services.processing_pipeline.config import PROCESSING_CONFIG
+
+
+class Command(BaseCommand):
+    help = (
+        "Indexes new and changed files of indexing_config['documents_path'] into the vector DB and deletes the "
+        "chunks of changed or removed files, unchanged files are skipped. Running servers see the changes once "
+        "they reopen the store, the document upload API updates them in place."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', help='directory of the source files, defaults to indexing_config["documents_path"]')
+        parser.add_argument('--prune', action='store_true',
+                            help='also delete chunks no source file accounts for (e.g. from a store built by the notebook)')
+        parser.add_argument('--knowledge-base',
+                            help='name of one of PROCESSING_CONFIG["knowledge_bases"] to update, the default one otherwise')
+
+    def handle(self, *args, path, prune, knowledge_base, **options):
+        if knowledge_base and knowledge_base not in PROCESSING_CONFIG["knowledge_bases"]:
+            raise CommandError(f"Unknown knowledge base '{knowledge_base}'")
+        # imported here so `manage.py help` doesn't load haystack
+        from chatbot_backend.services.processing_pipeline.indexing_pipeline import update_index
+        from chatbot_backend.services.processing_pipeline.knowledge_bases import knowledge_bases
+
+        start = time.perf_counter()
+        with knowledge_bases.use(knowledge_base) as kb:
+            stats = update_index(prune=prune, documents_path=path or kb.documents_path)
+        self.stdout.write(self.style.SUCCESS(
+            f"Index updated in {time.perf_counter() - start:.2f}s: {stats['indexed_files']} files indexed, "
+            f"{stats['unchanged_files']} unchanged, {stats['removed_files']} removed, "
+            f"{stats['embedded_chunks']} chunks embedded ({stats['resumed_chunks']} resumed from a checkpoint, "
+            f"{stats['chunks_per_second'] or 0} chunks/s), {stats['deleted_chunks']} deleted"
+        ))
@@ -0,0 +1,14 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from chatbot_backend.services.query_processing import warmup_pipeline
+
+
+class Command(BaseCommand):
+    help = "Builds the response pipelines (extracts the vector DB, creates clients) to check the setup and prefill caches"
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        warmup_pipeline(force=True)
+        self.stdout.write(self.style.SUCCESS(f"Pipelines ready in {time.perf_counter() - start:.2f}s"))
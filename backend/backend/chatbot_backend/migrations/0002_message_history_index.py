@@ -0,0 +1,17 @@
+# Generated by Django 5.2.4 on 2026-10-18 14:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot_backend', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['conversation', 'role', 'timestamp'], name='message_history_idx'),
+        ),
+    ]
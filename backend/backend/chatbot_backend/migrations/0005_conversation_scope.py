@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 15:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot_backend', '0004_ingestion_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='scope',
+            field=models.JSONField(blank=True, help_text='Metadata the retrieved documents must match', null=True),
+        ),
+    ]
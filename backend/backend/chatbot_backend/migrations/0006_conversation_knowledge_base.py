@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 18:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot_backend', '0005_conversation_scope'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='knowledge_base',
+            field=models.CharField(blank=True, default='', help_text='Knowledge base the answers come from', max_length=100),
+        ),
+    ]
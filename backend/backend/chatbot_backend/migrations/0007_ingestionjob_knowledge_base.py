@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 21:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot_backend', '0006_conversation_knowledge_base'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingestionjob',
+            name='knowledge_base',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+    ]
@@ -44,6 +44,20 @@ class Conversation(models.Model):
         max_length=100,
         default="New Conversation"
     )
+    # documents retrieval is limited to, {field: value or [values]} over the tags of the indexed chunks
+    # (source, file_type, language, collection), null for all of them
+    scope = models.JSONField(
+        blank=True,
+        null=True,
+        help_text="Metadata the retrieved documents must match"
+    )
+    # name of one of PROCESSING_CONFIG["knowledge_bases"] answering the conversation, empty for the default one
+    knowledge_base = models.CharField(
+        max_length=100,
+        blank=True,
+        default='',
+        help_text="Knowledge base the answers come from"
+    )
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -95,6 +109,105 @@ class Message(models.Model):
         verbose_name = "Message"
         verbose_name_plural = "Messages"
         ordering = ['timestamp']
+        indexes = [
+            # conversation history: last N user messages of a conversation
+            models.Index(fields=['conversation', 'role', 'timestamp'], name='message_history_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_role_display()} message in {self.conversation.title}"
+
+class GenerationJob(models.Model):
+    """A response generation waiting for (or served by) the background workers, see services/job_queue.py"""
+    STATUS_CHOICES = (
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    )
+    
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='generation_jobs'
+    )
+    conversation = models.ForeignKey(
+        Conversation,
+        on_delete=models.CASCADE,
+        related_name='generation_jobs'
+    )
+    # null once a failed job's message was discarded, the job is kept with its error
+    user_message = models.ForeignKey(
+        Message,
+        on_delete=models.SET_NULL,
+        related_name='+',
+        null=True,
+        blank=True
+    )
+    assistant_message = models.ForeignKey(
+        Message,
+        on_delete=models.SET_NULL,
+        related_name='+',
+        null=True,
+        blank=True
+    )
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default='queued'
+    )
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        verbose_name = "Generation job"
+        verbose_name_plural = "Generation jobs"
+        ordering = ['created_at']
+        indexes = [
+            # workers look for the oldest queued jobs
+            models.Index(fields=['status', 'created_at'], name='generationjob_queue_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Generation job {self.id} ({self.get_status_display()})"
+
+class IngestionJob(models.Model):
+    """An uploaded document waiting to be (or being) indexed by the background workers, see services/ingestion_jobs.py"""
+    STATUS_CHOICES = GenerationJob.STATUS_CHOICES
+    
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='ingestion_jobs'
+    )
+    file_name = models.CharField(max_length=255)
+    # path of the stored file relative to the documents_path of the knowledge base
+    source = models.CharField(max_length=512)
+    # name of one of PROCESSING_CONFIG["knowledge_bases"], '' for the default one
+    knowledge_base = models.CharField(max_length=100, blank=True, default='')
+    file_size = models.BigIntegerField()
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default='queued'
+    )
+    error = models.TextField(blank=True, default='')
+    # counts returned by update_index (chunks embedded, deleted...)
+    stats = models.JSONField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        verbose_name = "Ingestion job"
+        verbose_name_plural = "Ingestion jobs"
+        ordering = ['created_at']
+        indexes = [
+            # workers look for the oldest queued jobs
+            models.Index(fields=['status', 'created_at'], name='ingestionjob_queue_idx'),
+        ]
     
     def __str__(self):
-        return f"{self.get_role_display()} message in {self.conversation.title}"
\ No newline at end of file
+        return f"Ingestion job {self.id} ({self.file_name}, {self.get_status_display()})"
@@ -0,0 +1,30 @@
+from rest_framework.pagination import CursorPagination
+
+
+class OptionalCursorPagination(CursorPagination):
+    """
+    Cursor pagination that is used when the client asks for it with ?page_size= or ?cursor=,
+    requests without them still get the full list so existing clients keep working.
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.cursor_query_param not in request.query_params and self.page_size_query_param not in request.query_params:
+            return None
+        return super().paginate_queryset(queryset, request, view)
+
+
+class ConversationCursorPagination(OptionalCursorPagination):
+    """
+    Newest conversations first, by created_at: it never changes, so a conversation saved (e.g. renamed) while the
+    client pages keeps its place instead of moving in front of the cursor and being skipped.
+    ConversationListView orders the unpaginated list the same way.
+    """
+    ordering = ('-created_at', '-id')
+
+
+class MessageCursorPagination(OptionalCursorPagination):
+    """Pages go from the newest messages to the oldest, the way a chat window loads its history"""
+    ordering = ('-timestamp', '-id')
@@ -0,0 +1,11 @@
+from rest_framework import renderers
+from chatbot_backend.utils import format_sse
+
+class EventStreamRenderer(renderers.BaseRenderer):
+    """Lets clients send 'Accept: text/event-stream', errors raised before streaming starts are sent as an 'error' event"""
+    media_type = 'text/event-stream'
+    format = 'sse'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return format_sse('error', data).encode(self.charset)
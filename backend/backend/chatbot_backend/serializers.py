@@ -1,6 +1,8 @@
 from rest_framework import serializers
 from django.contrib.auth.password_validation import validate_password
-from chatbot_backend.models import User, Conversation, Message
+from chatbot_backend.models import User, Conversation, Message, GenerationJob, IngestionJob
+from chatbot_backend.services.ingestion_jobs import job_throughput
+from chatbot_backend.services.query_processing import parse_scope, parse_knowledge_base
 
 class UserRegistrationSerializer(serializers.ModelSerializer):
     password = serializers.CharField(
@@ -43,15 +45,56 @@ class UserProfileSerializer(serializers.ModelSerializer):
 
 ###
 class ConversationSerializer(serializers.ModelSerializer):
-    message_count = serializers.IntegerField(source='messages.count', read_only=True)
+    message_count = serializers.SerializerMethodField()
     
     class Meta:
         model = Conversation
-        fields = ['id', 'title', 'user', 'created_at', 'updated_at', 'message_count']
+        fields = ['id', 'title', 'scope', 'knowledge_base', 'user', 'created_at', 'updated_at', 'message_count']
         read_only_fields = ['id', 'user', 'created_at', 'updated_at', 'message_count']
 
+    def validate_scope(self, value):
+        try:
+            return parse_scope(value)
+        except ValueError as e:
+            raise serializers.ValidationError(str(e))
+
+    def validate_knowledge_base(self, value):
+        try:
+            return parse_knowledge_base(value)
+        except ValueError as e:
+            raise serializers.ValidationError(str(e))
+
+    def get_message_count(self, obj):
+        # annotated by ConversationListView.get_queryset, so listing doesn't run one COUNT per conversation
+        message_count = getattr(obj, 'message_count', None)
+        if message_count is None:
+            message_count = obj.messages.count()
+        return message_count
+
 class MessageSerializer(serializers.ModelSerializer):
     class Meta:
         model = Message
         fields = ['id', 'conversation', 'role', 'content', 'timestamp']
-        read_only_fields = ['id', 'timestamp']
\ No newline at end of file
+        read_only_fields = ['id', 'timestamp']
+
+class GenerationJobSerializer(serializers.ModelSerializer):
+    user_message = MessageSerializer(read_only=True)
+    assistant_message = MessageSerializer(read_only=True)
+
+    class Meta:
+        model = GenerationJob
+        fields = ['id', 'conversation', 'status', 'user_message', 'assistant_message', 'error',
+                  'created_at', 'started_at', 'finished_at']
+        read_only_fields = fields
+
+class IngestionJobSerializer(serializers.ModelSerializer):
+    throughput = serializers.SerializerMethodField()
+
+    class Meta:
+        model = IngestionJob
+        fields = ['id', 'file_name', 'source', 'knowledge_base', 'file_size', 'status', 'error', 'stats', 'throughput',
+                  'created_at', 'started_at', 'finished_at']
+        read_only_fields = fields
+
+    def get_throughput(self, obj):
+        return job_throughput(obj)
@@ -0,0 +1,51 @@
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from chatbot_backend.models import GenerationJob, Message
+from .job_queue import JobQueue
+from .query_processing import generate_response, discard_user_message
+
+_generation_queue = None
+
+def run_generation_job(job):
+    scope = (job.user_message.metadata or {}).get('scope')
+    try:
+        response_text = generate_response(job.conversation, job.user_message.content, scope=scope)
+    except Exception:
+        # nothing will answer this message, dropped as in the views, the job is marked failed by the queue
+        discard_user_message(job.user_message)
+        job.user_message = None
+        raise
+    # the answer and the job state are written together, a job is never 'done' without its message
+    with transaction.atomic():
+        job.assistant_message = Message.objects.create(
+            conversation=job.conversation,
+            role='assistant',
+            content=response_text
+        )
+        job.status = 'done'
+        job.finished_at = timezone.now()
+        job.save()
+
+def get_generation_queue():
+    global _generation_queue
+    if _generation_queue is None:
+        queue_settings = {key: value for key, value in settings.GENERATION_QUEUE.items() if key != 'mode'}
+        _generation_queue = JobQueue(GenerationJob, run_generation_job, **queue_settings)
+    return _generation_queue
+
+def is_background_mode(request):
+    """Background generation is used when enabled in settings, or asked for with ?background=1"""
+    return settings.GENERATION_QUEUE['mode'] == 'background' or request.query_params.get('background') in ('1', 'true')
+
+def enqueue_generation(conversation, user_message):
+    job = GenerationJob.objects.create(
+        user=conversation.user,
+        conversation=conversation,
+        user_message=user_message
+    )
+    queue = get_generation_queue()
+    queue.start()
+    transaction.on_commit(queue.notify)
+    return job
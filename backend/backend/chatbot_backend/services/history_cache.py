@@ -0,0 +1,55 @@
+import threading
+from collections import OrderedDict, deque
+
+
+class ConversationHistoryCache:
+    """
+    Per process ring buffer of the last user messages of recently active conversations,
+    so a new turn doesn't have to read the history back from the database.
+    Only messages handled by this process are appended: with several worker processes a
+    conversation whose turns land on different workers can see a stale history, so keep it
+    disabled unless requests of a conversation are pinned to one process.
+    history_length is the default length of a buffer, set() and append() take the length of the
+    conversation when it differs (e.g. another knowledge base).
+    """
+    def __init__(self, history_length, max_conversations=1000):
+        self.history_length = history_length
+        self.max_conversations = max_conversations
+        self._buffers = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, conversation_id):
+        with self._lock:
+            buffer = self._buffers.get(conversation_id)
+            if buffer is None:
+                return None
+            self._buffers.move_to_end(conversation_id)
+            return list(buffer)
+
+    def set(self, conversation_id, messages, history_length=None):
+        with self._lock:
+            self._buffers[conversation_id] = deque(messages, maxlen=history_length or self.history_length)
+            self._buffers.move_to_end(conversation_id)
+            while len(self._buffers) > self.max_conversations:
+                self._buffers.popitem(last=False)
+
+    def append(self, conversation_id, message, history_length=None):
+        """
+        Adds a message to a buffered conversation and returns the buffered messages,
+        returns None (and buffers nothing) when the conversation isn't buffered, or holds fewer
+        messages than history_length asks for.
+        """
+        history_length = history_length or self.history_length
+        with self._lock:
+            buffer = self._buffers.get(conversation_id)
+            if buffer is None or buffer.maxlen < history_length:
+                return None
+            if buffer.maxlen > history_length:
+                buffer = self._buffers[conversation_id] = deque(buffer, maxlen=history_length)
+            buffer.append(message)
+            self._buffers.move_to_end(conversation_id)
+            return list(buffer)
+
+    def discard(self, conversation_id):
+        with self._lock:
+            self._buffers.pop(conversation_id, None)
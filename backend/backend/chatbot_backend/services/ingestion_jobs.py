@@ -0,0 +1,121 @@
+import hashlib
+import os
+import uuid
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files.move import file_move_safe
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+from django.utils.text import get_valid_filename
+
+from chatbot_backend.models import IngestionJob
+from .job_queue import JobQueue
+from .processing_pipeline.config import PROCESSING_CONFIG
+
+# uploaded files are stored under this directory of the knowledge base's documents_path
+UPLOADS_DIR = 'uploads'
+QUEUE_SETTINGS = ('workers', 'max_queued', 'max_queued_per_user', 'max_running_per_user', 'poll_interval')
+
+_ingestion_queue = None
+
+def run_ingestion_job(job):
+    # imported on first use: haystack and the pipeline modules are only loaded when a document is indexed
+    from .processing_pipeline.indexing_pipeline import update_index
+    from .processing_pipeline.knowledge_bases import knowledge_bases
+    # update_index returns once the chunks are saved to the store on disk, so the job is only 'done' when they are
+    # queryable: serving processes reload the store on their next request (response_pipeline.sync_document_store)
+    with knowledge_bases.use(job.knowledge_base or None):
+        job.stats = update_index(sources=[job.source], documents_path=documents_path(job.knowledge_base))
+
+def documents_path(knowledge_base=''):
+    """Directory of the source files of a knowledge base (same rule as KnowledgeBase.documents_path)"""
+    config = PROCESSING_CONFIG["knowledge_bases"].get(knowledge_base or PROCESSING_CONFIG["default_knowledge_base"]) or {}
+    return config.get("documents_path") or PROCESSING_CONFIG['indexing_config']['documents_path']
+
+def get_ingestion_queue():
+    global _ingestion_queue
+    if _ingestion_queue is None:
+        queue_settings = {key: value for key, value in settings.INGESTION_QUEUE.items() if key in QUEUE_SETTINGS}
+        _ingestion_queue = JobQueue(IngestionJob, run_ingestion_job, **queue_settings)
+    return _ingestion_queue
+
+def store_upload(uploaded_file, knowledge_base=''):
+    """
+    Moves an uploaded file into the documents directory of the knowledge base, returns its source (path relative to it).
+    Files are stored as uploads/<content hash>/<name>: two different files with the same name never replace each
+    other (nor each other's chunks), the same file uploaded again is stored and indexed once.
+    The upload is already on disk (TemporaryFileUploadHandler), it is moved rather than copied when possible,
+    and renamed into place at the end so the indexer never sees half a file.
+    Raises SuspiciousFileOperation when the file name is unusable.
+    """
+    name = get_valid_filename(os.path.basename(uploaded_file.name))
+    digest = hashlib.sha256()
+    for chunk in uploaded_file.chunks():
+        digest.update(chunk)
+    source = f"{UPLOADS_DIR}/{digest.hexdigest()[:16]}/{name}"
+    destination = Path(documents_path(knowledge_base)) / source
+    if destination.exists():
+        return source
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = destination.with_name(f".{name}.{uuid.uuid4().hex}.tmp")
+    if hasattr(uploaded_file, 'temporary_file_path'):
+        file_move_safe(uploaded_file.temporary_file_path(), tmp_path)
+    else:
+        with open(tmp_path, 'wb') as f:
+            for chunk in uploaded_file.chunks():
+                f.write(chunk)
+    os.replace(tmp_path, destination)
+    return source
+
+def enqueue_ingestion(user, uploaded_file, knowledge_base=''):
+    source = store_upload(uploaded_file, knowledge_base)
+    job = IngestionJob.objects.create(
+        user=user,
+        file_name=uploaded_file.name,
+        source=source,
+        knowledge_base=knowledge_base,
+        file_size=uploaded_file.size
+    )
+    queue = get_ingestion_queue()
+    queue.start()
+    transaction.on_commit(queue.notify)
+    return job
+
+def job_throughput(job):
+    """Bytes and chunks indexed per second of a finished job, None while it isn't done"""
+    if job.status != 'done' or job.started_at is None or job.finished_at is None:
+        return None
+    seconds = max((job.finished_at - job.started_at).total_seconds(), 1e-3)
+    return {
+        'seconds': round(seconds, 3),
+        'bytes_per_second': round(job.file_size / seconds, 1),
+        'chunks_per_second': round((job.stats or {}).get('embedded_chunks', 0) / seconds, 2),
+    }
+
+def ingestion_stats(window=timedelta(hours=1)):
+    """Queue state and throughput of the jobs finished within the last `window`"""
+    counts = dict(IngestionJob.objects.values_list('status').annotate(count=Count('id')).values_list('status', 'count'))
+    finished = IngestionJob.objects.filter(status='done', finished_at__gte=timezone.now() - window,
+                                           started_at__isnull=False)
+    files = chunks = size = 0
+    seconds = 0.0
+    for job in finished.only('file_size', 'stats', 'started_at', 'finished_at'):
+        files += 1
+        size += job.file_size
+        chunks += (job.stats or {}).get('embedded_chunks', 0)
+        seconds += (job.finished_at - job.started_at).total_seconds()
+    return {
+        'queued': counts.get('queued', 0),
+        'running': counts.get('running', 0),
+        'failed': counts.get('failed', 0),
+        'window_seconds': int(window.total_seconds()),
+        'files': files,
+        'bytes': size,
+        'chunks': chunks,
+        # per second of indexing work, queueing time excluded
+        'bytes_per_second': round(size / seconds, 1) if seconds else None,
+        'chunks_per_second': round(chunks / seconds, 2) if seconds else None,
+    }
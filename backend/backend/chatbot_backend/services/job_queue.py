@@ -0,0 +1,162 @@
+import threading
+import time
+from datetime import timedelta
+
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Count
+from django.utils import timezone
+
+
+class QueueFull(Exception):
+    """Raised by JobQueue.check_capacity when a new job should be refused (backpressure)"""
+
+
+class JobQueue:
+    """
+    Database backed job queue served by a pool of worker threads, no outside broker needed.
+    Jobs are rows of `model` (status, created_at, started_at, finished_at and a user foreign key),
+    a worker claims one with a conditional UPDATE so several processes can serve the same queue
+    (see claim).
+
+    - concurrency: at most `workers` jobs run at once in this process (0 starts no workers,
+      e.g. when a separate `manage.py run_job_workers` process serves the queue)
+    - backpressure: check_capacity refuses jobs beyond `max_queued` in total or `max_queued_per_user`
+    - fairness: the next job is the oldest one of the users with the fewest running jobs,
+      and a user never has more than `max_running_per_user` jobs running
+    - recovery: jobs left 'running' by a process that died are queued again once older than `stale_after`,
+      by serve_forever when it starts and by the workers of every process at most every `stale_after`
+    """
+    def __init__(self, model, handler, workers=4, max_queued=200, max_queued_per_user=5,
+                 max_running_per_user=1, poll_interval=1.0, stale_after=15 * 60):
+        self.model = model
+        self.handler = handler
+        self.workers = workers
+        self.max_queued = max_queued
+        self.max_queued_per_user = max_queued_per_user
+        self.max_running_per_user = max_running_per_user
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._requeued_at = time.monotonic()
+
+    def check_capacity(self, user, count=1):
+        """Raises QueueFull unless `count` more jobs of user fit in the queue"""
+        queued = self.model.objects.filter(status='queued')
+        if queued.count() + count > self.max_queued:
+            raise QueueFull("Too many pending jobs, try again later")
+        if queued.filter(user=user).count() + count > self.max_queued_per_user:
+            raise QueueFull("You have too many pending jobs, wait for them to finish")
+
+    def start(self):
+        """Starts the worker threads once per process"""
+        with self._lock:
+            if self._threads or self.workers <= 0:
+                return
+            self._stop.clear()
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"{self.model.__name__}-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def serve_forever(self):
+        """Runs the workers until interrupted, for dedicated worker processes"""
+        self.requeue_stale()
+        self.start()
+        try:
+            while not self._stop.wait(60):
+                pass
+        finally:
+            self.stop()
+
+    def notify(self):
+        """Wakes up idle workers after a job was queued"""
+        self._wakeup.set()
+
+    def requeue_stale(self):
+        # jobs left 'running' by a process that died
+        deadline = timezone.now() - timedelta(seconds=self.stale_after)
+        self.model.objects.filter(status='running', started_at__lt=deadline).update(status='queued', started_at=None)
+
+    def requeue_stale_if_due(self):
+        # a job only turns stale after stale_after, checking more often finds nothing new
+        with self._lock:
+            if time.monotonic() - self._requeued_at < self.stale_after:
+                return
+            self._requeued_at = time.monotonic()
+        self.requeue_stale()
+
+    def claim_next(self):
+        """Marks the next job (see fairness above) as running and returns it, None when nothing can run"""
+        running = dict(
+            self.model.objects.filter(status='running')
+            .values_list('user').annotate(count=Count('id')).values_list('user', 'count')
+        )
+        candidates = self.model.objects.filter(status='queued').order_by('created_at', 'id').values_list('id', 'user')[:100]
+        candidates = [(running.get(user_id, 0), position, job_id, user_id)
+                      for position, (job_id, user_id) in enumerate(candidates)
+                      if running.get(user_id, 0) < self.max_running_per_user]
+        for _, _, job_id, user_id in sorted(candidates):
+            if self.claim(job_id, user_id):
+                return self.model.objects.get(id=job_id)
+        return None
+
+    def claim(self, job_id, user_id):
+        """
+        Marks a queued job as running unless its user already has max_running_per_user running jobs, returns
+        whether it did. The running jobs are counted by the UPDATE itself, and the user's row is locked first
+        where the database supports it, so workers claiming jobs of the same user at once never exceed the limit.
+        """
+        busy_users = (self.model.objects.filter(status='running').values('user')
+                      .annotate(count=Count('id')).filter(count__gte=self.max_running_per_user).values('user'))
+        with transaction.atomic():
+            if connection.features.has_select_for_update:
+                # sqlite has no row locks, it runs one write at a time anyway
+                user_model = self.model._meta.get_field('user').related_model
+                list(user_model.objects.select_for_update().filter(pk=user_id).values_list('pk', flat=True))
+            return bool(self.model.objects.filter(id=job_id, status='queued').exclude(user__in=busy_users)
+                        .update(status='running', started_at=timezone.now()))
+
+    def run_once(self):
+        """
+        Claims and runs one job in the calling thread, returns it (None when nothing was queued).
+        The handler may finish the job itself (status 'done' saved in the same transaction as its
+        result), otherwise it is marked done here once the handler returns.
+        """
+        job = self.claim_next()
+        if job is None:
+            return None
+        try:
+            self.handler(job)
+        except Exception as e:
+            print(f"{job} failed:", e)
+            job.status = 'failed'
+            job.error = str(e) or e.__class__.__name__
+        if job.status in ('running', 'failed'):
+            if job.status == 'running':
+                job.status = 'done'
+            job.finished_at = timezone.now()
+            job.save()
+        return job
+
+    def _work(self):
+        while not self._stop.is_set():
+            close_old_connections()
+            try:
+                self.requeue_stale_if_due()
+                job = self.run_once()
+            except Exception as e:
+                print("job worker error:", e)
+                job = None
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.db import DatabaseError
+
+from .generation_jobs import get_generation_queue
+from .ingestion_jobs import get_ingestion_queue
+
+# the background job queues by name, see manage.py run_job_workers
+QUEUES = {
+    'generation': get_generation_queue,
+    'ingestion': get_ingestion_queue,
+}
+
+def start_job_workers():
+    """
+    Starts the worker threads of the queues this process serves (none for a queue whose 'workers' setting is 0),
+    called by wsgi.py / asgi.py so the jobs left queued by a restart are served without waiting for a new one.
+    Set 'workers' to 0 and run `manage.py run_job_workers` to keep the workers out of the web processes.
+    """
+    for name, get_queue in QUEUES.items():
+        if name == 'generation' and settings.GENERATION_QUEUE['mode'] != 'background':
+            # messages are answered in the request, the workers start with the first ?background=1 job
+            continue
+        try:
+            get_queue().start()
+        except DatabaseError as e:
+            # e.g. not migrated yet, the workers start with the first job queued instead
+            print(f"{name} job workers not started:", e)
@@ -1,6 +1,13 @@
-import zipfile
+import contextvars
+import hashlib
+import json
 import os
+import shutil
+import tempfile
+import zipfile
 from pathlib import Path
+
+from filelock import FileLock
 from chatbot_backend.utils import read_secrets
 
 BASE_DIR = Path(__file__).resolve().parent.parent.parent.parent
@@ -10,36 +17,328 @@ PROCESSING_CONFIG = {
     "response_config": {
         "embedding_model": "sayed0am/arabic-english-bge-m3",
         "embedding_api": "https://router.huggingface.co/hf-inference/models/sayed0am/arabic-english-bge-m3/pipeline/feature-extraction",
+        # "api": queries are embedded by embedding_api, "local": embedding_model runs in process on CPU
+        # (needs `pip install "sentence-transformers[onnx]"`, compare both with manage.py bench_embedders)
+        "embedding_backend": "api",
+        "local_embedder": {
+            "backend": "onnx",  # "torch", "onnx" or "openvino"
+            # directory written by manage.py export_onnx_embedder, None loads embedding_model from the hub
+            "model_path": None,
+            # e.g. "onnx/model_qint8_avx512_vnni.onnx" for the int8 quantized export, None for the default file
+            "file_name": None,
+            "threads": 4,
+            "intra_op_threads": 1,  # cores per thread, onnx backend only
+        },
+        # zip the store is extracted from, set to None to open an already extracted store at loaded_vdb_path
         "chroma_testing_vdb_path": BASE_DIR / "vectordb-aren-sayed0am-testing.zip",
         "loaded_vdb_path": BASE_DIR / "chatbot_backend/vectordb",
+        # "chroma": the Chroma store at loaded_vdb_path, "numpy": every embedding in one memory-mapped matrix
+        # searched in process (custom/numpy_store.py), faster for a corpus that fits in RAM, compare both
+        # with manage.py bench_document_stores
+        "document_store": "chroma",
+        "numpy_store": {
+            # exported from the Chroma store on first use, delete it to export again
+            "path": BASE_DIR / "chatbot_backend/vectordb-numpy",
+            "dtype": "float32",  # "float16" halves the memory, scores are computed in float32 either way
+            # None, "int8" (4x smaller, not faster) or "binary" (32x smaller and faster): exact searches scan that
+            # copy of the embeddings and rescore top_k * rescore_multiplier candidates in float,
+            # None for the default of the quantization (4 for int8, 100 for binary), compare with manage.py bench_quantization
+            "quantization": None,
+            "rescore_multiplier": None,
+            # approximate search through an IVF index (custom/ivf_index.py) once the store is big enough,
+            # compare recall and latency of these settings with manage.py bench_ann
+            "ann": {
+                "enabled": False,
+                "min_documents": 50000,  # exact search below, it is fast enough
+                "nlist": None,  # number of lists, None for 4 * sqrt(documents)
+                "nprobe": 16,  # lists searched per query, higher is better recall and slower
+                # one byte codes per pq_m sub-vectors (must divide the dimension, e.g. 64 for bge-m3's 1024),
+                # None to score every candidate of the probed lists exactly (IVF-Flat)
+                "pq_m": None,
+                "rerank": 200,  # with pq_m, candidates rescored exactly from the embeddings
+                "train_sample": 40000,
+                "retrain_growth": 2.0,  # trained again when the store has grown this much since
+            },
+        },
         "chat_model": "microsoft/phi-4",
         "history_max_length": 3,
+        # per process ring buffer of recent user messages (see services/history_cache.py), only safe
+        # when every request of a conversation is served by the same process
+        "history_cache": {
+            "enabled": False,
+            "max_conversations": 1000,
+        },
         "retriever": {
-            "top_k": 5
-        }
+            "top_k": 5,
+            # metadata chunks are tagged with at index time, a conversation (or a single message) can limit
+            # retrieval to some of their values with a "scope", e.g. {"collection": "faq", "language": "ara"}.
+            # Chroma filters them natively, the numpy store and BM25 keep posting lists of them
+            "scope_fields": ["source", "file_type", "language", "collection"],
+        },
+        # BM25 over the same documents fused with the dense results, catches exact terms (names,
+        # article numbers) embeddings miss, the index is built in memory from the vector DB on startup
+        # (off by default: it holds a copy of every document and changes the retrieved excerpts)
+        "bm25": {
+            "enabled": False,
+            "top_k": 5,
+            "k1": 1.5,
+            "b": 0.75,
+        },
+        # over-fetch `candidates` documents and keep the top_k best according to a local cross-encoder,
+        # fewer and better excerpts make a shorter prompt (needs `pip install "sentence-transformers[onnx]"`)
+        "reranker": {
+            "enabled": False,
+            "model": "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1",  # multilingual, covers arabic
+            "backend": "torch",  # "torch", "onnx" or "openvino"
+            "file_name": None,
+            "candidates": 50,
+            "top_k": 3,
+            "batch_size": 16,
+            # drop candidates scoring under this, None keeps the top_k whatever their score
+            "score_threshold": None,
+            # stop scoring once top_k candidates reach this score, None scores every candidate
+            "early_exit_score": None,
+        },
+        # history and documents are fit into a token budget (counted with chat_model's tokenizer)
+        # before they reach the main prompt, overlapping excerpts are deduplicated
+        # (off by default: it downloads chat_model's tokenizer and changes the prompts)
+        "context_packing": {
+            "enabled": False,
+            "tokenizer": None,  # hub model providing a tokenizer.json, None uses chat_model
+            "max_context_tokens": 3000,  # history + documents
+            "max_history_tokens": 300,
+            "max_document_tokens": 800,
+            # share of an excerpt's 5-word shingles found in an already kept one above which it's dropped
+            "dedupe_overlap": 0.8,
+        },
+        # queries arriving within max_wait_ms of each other share one feature extraction request
+        # and one collection query, only worth it when many messages are answered at once
+        "batching": {
+            "enabled": False,
+            "max_batch_size": 32,
+            "max_wait_ms": 5,
+            "max_concurrent_batches": 2,
+        },
+        "embedding_cache": {
+            "enabled": True,
+            "max_size": 2048,
+            "ttl": 24 * 60 * 60,  # seconds
+            # set to None to keep the cache in memory only
+            "disk_path": BASE_DIR / "cache/query_embeddings.sqlite3",
+            # rows kept on disk (expired ones are deleted too), None for no limit
+            "disk_max_size": 100000,
+        },
+        # answers to standalone questions reused for nearly identical ones
+        # (off by default: a reused answer skips retrieval and the LLM, the question's wording is ignored)
+        "answer_cache": {
+            "enabled": False,
+            # cosine similarity between query embeddings above which a stored answer is reused
+            "similarity_threshold": 0.95,
+            "max_size": 1000,
+        },
+        # "sequential": fallback_llm is only called once main_llm answered no_answer
+        # "speculative": fallback_llm runs alongside main_llm and its reply is dropped when main_llm answers,
+        # out of domain questions cost one LLM round trip instead of two but every message pays for two calls
+        "fallback": {
+            "mode": "sequential",
+        },
+        # None for the ones of custom/prompt_templates.py
+        "prompt_templates": {
+            "main": None,
+            "fallback": None,
+        },
 
-        
 
     },
-    "HF_API_TOKEN": read_secrets("HF_API_TOKEN"),
+    # incremental indexing of source files into the vector DB at loaded_vdb_path (manage.py update_index)
+    "indexing_config": {
+        "documents_path": BASE_DIR / "documents",  # pdf, docx/doc and txt files, sub directories included
+        "split_by": "sentence",
+        "split_length": 3,
+        "split_overlap": 0,
+        # chunks are embedded in batches of similar lengths, at most this many chunks and characters
+        # (text-embeddings-inference accepts 32 inputs and 16k tokens per request by default)
+        "embedding_batch_size": 32,
+        "embedding_batch_chars": 48000,
+        "embedding_workers": 4,  # batches embedded concurrently
+        # new chunks of several files are embedded together, up to this many at a time
+        "max_pending_chunks": 10000,
+        "ocr_language": "ara",
+        "ocr_dpi": 300,
+        # pdf pages are OCRed in parallel by this many processes, None for one per core
+        "ocr_workers": None,
+        # OCR text of every page keyed by the hash of its image, set to None to OCR every page again
+        "ocr_cache_path": BASE_DIR / "cache/ocr",
+    },
+    # one deployment serving several domains: every knowledge base has its own vector store, models and prompts,
+    # given as overrides of response_config (nested dicts are merged), and its own pipelines built on first use.
+    # A conversation picks one by name (see processing_pipeline/knowledge_bases.py)
+    "knowledge_bases": {
+        # response_config itself (plus its own "response_config" overrides, if any),
+        # set default_knowledge_base to serve another one to conversations without one
+        "default": {"description": "Default knowledge base"},
+        # "laws": {
+        #     "description": "Labour and civil laws",
+        #     "documents_path": BASE_DIR / "documents-laws",  # manage.py update_index --knowledge-base laws
+        #     "response_config": {
+        #         "chroma_testing_vdb_path": None,
+        #         "loaded_vdb_path": BASE_DIR / "chatbot_backend/vectordb-laws",
+        #         "numpy_store": {"path": BASE_DIR / "chatbot_backend/vectordb-laws-numpy"},
+        #         "chat_model": "microsoft/phi-4",
+        #         "prompt_templates": {"main": "...", "fallback": None},
+        #     },
+        # },
+    },
+    "default_knowledge_base": "default",
+    # loaded knowledge bases are evicted (their objects dropped, built again on next use) once a request ends
+    "knowledge_base_cache": {
+        # least recently used ones first while the loaded ones hold more than this (embeddings, indexes...),
+        # None for no limit, the last used one is always kept
+        "max_resident_bytes": 4 * 1024 ** 3,
+        # unused for this many seconds, None to keep them
+        "idle_seconds": 30 * 60,
+    },
+    # build the pipelines when the server starts (wsgi.py / asgi.py) instead of on the first chat message
+    "warmup_on_startup": False,
 }
 
-def load_vdb(vdb_zip_path = None):
-    vdb_zip_path = vdb_zip_path or PROCESSING_CONFIG["response_config"]["chroma_testing_vdb_path"]
-    vdb_path = PROCESSING_CONFIG["response_config"]["loaded_vdb_path"]
-    # Create directory if it doesn't exist
-    os.makedirs(vdb_path, exist_ok=True)
-    # Unzip
-
-    with zipfile.ZipFile(vdb_zip_path, 'r') as zip_ref:
-        zip_ref.extractall(vdb_path)
-    if os.path.exists(vdb_zip_path):
-        print(f"VDB exists in ", vdb_zip_path)
-    else:
+_hf_token = None
+
+def get_hf_token():
+    # read on first use, so code paths that never call HF (migrations, tests...) don't need secret.config
+    global _hf_token
+    if _hf_token is None:
+        _hf_token = read_secrets("HF_API_TOKEN")
+    return _hf_token
+
+# response_config of the knowledge base the current request is served from, set by knowledge_bases.py
+active_response_config = contextvars.ContextVar("active_response_config", default=None)
+
+def get_response_config():
+    """response_config of the knowledge base being served, the default knowledge base's outside of one"""
+    response_config = active_response_config.get()
+    return knowledge_base_response_config() if response_config is None else response_config
+
+def knowledge_base_response_config(name=None):
+    """
+    response_config with the overrides of the knowledge base called name (default_knowledge_base for None or ''),
+    response_config itself when it has none (or isn't configured). Merged on every call, so changes to
+    response_config show up.
+    """
+    name = name or PROCESSING_CONFIG["default_knowledge_base"]
+    overrides = (PROCESSING_CONFIG["knowledge_bases"].get(name) or {}).get("response_config")
+    if not overrides:
+        return PROCESSING_CONFIG["response_config"]
+    return merge_config(PROCESSING_CONFIG["response_config"], overrides)
+
+def merge_config(config, overrides):
+    """Copy of config with overrides applied, nested dicts are merged key by key"""
+    merged = dict(config)
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            value = merge_config(merged[key], value)
+        merged[key] = value
+    return merged
+
+VDB_MANIFEST_NAME = ".vdb_manifest.json"
+VDB_MANIFEST_VERSION = 1
+
+def get_document_store_path():
+    """Directory of the configured document store, the index manifest and the answer cache fingerprint follow it"""
+    response_config = get_response_config()
+    if response_config["document_store"] == "numpy":
+        return response_config["numpy_store"]["path"]
+    return response_config["loaded_vdb_path"]
+
+def file_checksum(path, chunk_size = 1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def read_vdb_manifest(vdb_path):
+    try:
+        with open(Path(vdb_path) / VDB_MANIFEST_NAME) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return manifest if manifest.get("version") == VDB_MANIFEST_VERSION else None
+
+def write_vdb_manifest(vdb_path, manifest):
+    with open(Path(vdb_path) / VDB_MANIFEST_NAME, 'w') as f:
+        json.dump(manifest, f)
+
+def load_vdb(vdb_zip_path = None, vdb_path = None):
+    """
+    Makes sure loaded_vdb_path holds the content of the vdb zip.
+    Extraction is skipped when the manifest written by the last extraction matches the zip
+    (size and mtime first, then the sha256 checksum), so restarts and forked workers don't unzip again.
+    A new zip is extracted next to the store and swapped in with a rename, under a file lock,
+    so concurrent workers never see (or write) a half extracted store.
+    With no zip configured, the already extracted store at loaded_vdb_path is opened as is.
+    """
+    vdb_zip_path = vdb_zip_path or get_response_config()["chroma_testing_vdb_path"]
+    vdb_path = Path(vdb_path or get_response_config()["loaded_vdb_path"])
+
+    if not vdb_zip_path or not os.path.exists(vdb_zip_path):
+        if vdb_path.exists():
+            print("using already extracted VDB at ", vdb_path)
+            return True
         print("VDB doesn't exist...")
-        print("expected at ", vdb_zip_path)
-    print(f"Documents extracted to {vdb_path}")   
-    return True
+        print("expected at ", vdb_zip_path or vdb_path)
+        return False
+
+    if is_vdb_up_to_date(vdb_zip_path, vdb_path):
+        return True
 
+    vdb_path.parent.mkdir(parents=True, exist_ok=True)
+    with FileLock(str(vdb_path.parent / f".{vdb_path.name}.lock")):
+        # another worker may have extracted it while we were waiting for the lock
+        if is_vdb_up_to_date(vdb_zip_path, vdb_path):
+            return True
+
+        zip_stat = os.stat(vdb_zip_path)
+        manifest = {
+            "version": VDB_MANIFEST_VERSION,
+            "source": os.path.basename(vdb_zip_path),
+            "checksum": file_checksum(vdb_zip_path),
+            "zip_size": zip_stat.st_size,
+            "zip_mtime_ns": zip_stat.st_mtime_ns,
+        }
+        current = read_vdb_manifest(vdb_path)
+        if current and current["checksum"] == manifest["checksum"]:
+            # same content, the zip was only touched or copied
+            write_vdb_manifest(vdb_path, manifest)
+            return True
+
+        staging_path = Path(tempfile.mkdtemp(prefix=f".{vdb_path.name}.staging-", dir=vdb_path.parent))
+        try:
+            with zipfile.ZipFile(vdb_zip_path, 'r') as zip_ref:
+                zip_ref.extractall(staging_path)
+            write_vdb_manifest(staging_path, manifest)
+
+            old_path = None
+            if vdb_path.exists():
+                old_path = vdb_path.with_name(f".{vdb_path.name}.old-{os.getpid()}")
+                os.replace(vdb_path, old_path)
+            try:
+                os.replace(staging_path, vdb_path)
+            except OSError:
+                if old_path is not None:
+                    os.replace(old_path, vdb_path)
+                raise
+        finally:
+            shutil.rmtree(staging_path, ignore_errors=True)
+        if old_path is not None:
+            shutil.rmtree(old_path, ignore_errors=True)
+
+    print(f"Documents extracted to {vdb_path}")
+    return True
 
-load_vdb()
\ No newline at end of file
+def is_vdb_up_to_date(vdb_zip_path, vdb_path):
+    manifest = read_vdb_manifest(vdb_path)
+    if manifest is None:
+        return False
+    zip_stat = os.stat(vdb_zip_path)
+    return manifest["zip_size"] == zip_stat.st_size and manifest["zip_mtime_ns"] == zip_stat.st_mtime_ns
@@ -0,0 +1,163 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from haystack import component
+from haystack.dataclasses import ChatMessage
+
+
+def collection_fingerprint(vdb_path):
+    """Changes whenever a file of the persisted vector store is written, added or removed"""
+    digest = hashlib.sha256()
+    for root, dirs, files in os.walk(vdb_path):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            digest.update(f"{os.path.relpath(path, vdb_path)}:{stat.st_size}:{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+
+def scope_key(filters):
+    """Answers retrieved with different filters are different answers, entries are keyed by their filters too"""
+    return json.dumps(filters, sort_keys=True, default=str) if filters else None
+
+
+@dataclass
+class CachedAnswer:
+    query: str
+    answer: str
+    document_ids: List[str] = field(default_factory=list)
+    scope: Optional[str] = None
+
+
+class SemanticAnswerCache:
+    """
+    Keeps past (query, answer, retrieved document ids) entries with their normalized query embeddings
+    in one matrix, a lookup is a single matrix-vector product which is well under a millisecond
+    for the few thousand entries we keep, so no approximate index is needed at this size.
+    Entries are dropped when the vector store under vdb_path changes, answers may depend on its content.
+    """
+    def __init__(self, threshold=0.95, max_size=1000, vdb_path=None, fingerprint_interval=5.0, clock=time.monotonic):
+        self.threshold = threshold
+        self.max_size = max_size
+        self.vdb_path = vdb_path
+        self.fingerprint_interval = fingerprint_interval
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._embeddings = None
+        self._entries = []
+        self._next_slot = 0
+        self._fingerprint = collection_fingerprint(vdb_path) if vdb_path else None
+        self._fingerprint_checked_at = self.clock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def nbytes(self):
+        return self._embeddings.nbytes if self._embeddings is not None else 0
+
+    @staticmethod
+    def _normalize(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _check_collection(self):
+        if self.vdb_path is None or self.clock() - self._fingerprint_checked_at < self.fingerprint_interval:
+            return
+        self._fingerprint_checked_at = self.clock()
+        fingerprint = collection_fingerprint(self.vdb_path)
+        if fingerprint != self._fingerprint:
+            print("vector store changed, clearing the answer cache")
+            self._fingerprint = fingerprint
+            self._clear()
+
+    def _clear(self):
+        self._embeddings = None
+        self._entries = []
+        self._next_slot = 0
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+
+    def lookup(self, embedding, scope=None):
+        """Returns (CachedAnswer, similarity) of the closest entry of the same scope above the threshold, or None"""
+        with self._lock:
+            self._check_collection()
+            if not self._entries:
+                self.misses += 1
+                return None
+            similarities = self._embeddings[:len(self._entries)] @ self._normalize(embedding)
+            if scope is not None or any(entry.scope is not None for entry in self._entries):
+                same_scope = np.fromiter((entry.scope == scope for entry in self._entries), dtype=bool, count=len(self._entries))
+                similarities[~same_scope] = -np.inf
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return self._entries[best], float(similarities[best])
+
+    def add(self, embedding, query, answer, document_ids=(), scope=None):
+        vector = self._normalize(embedding)
+        with self._lock:
+            self._check_collection()
+            if self._embeddings is None:
+                self._embeddings = np.zeros((self.max_size, vector.shape[0]), dtype=np.float32)
+            # once full, the oldest entry is overwritten
+            slot = self._next_slot
+            self._embeddings[slot] = vector
+            entry = CachedAnswer(query=query, answer=answer, document_ids=list(document_ids), scope=scope)
+            if slot < len(self._entries):
+                self._entries[slot] = entry
+            else:
+                self._entries.append(entry)
+            self._next_slot = (slot + 1) % self.max_size
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+@component
+class AnswerCacheLookup:
+    """
+    Sits between the embedder and the retriever, on a hit the cached answer is sent out as 'replies'
+    and nothing downstream of 'query_embedding' runs (retriever, prompt builder, LLMs).
+    The query it is given is passed on on a miss only, for branches that don't need the embedding
+    (the speculative fallback) but must not run when the cached answer is used.
+    Follow-up questions are never looked up, their answer depends on the history they are asked in.
+    """
+    def __init__(self, cache: SemanticAnswerCache):
+        self.cache = cache
+
+    @component.output_types(query_embedding=List[float], query=str, replies=List[ChatMessage], meta=Dict[str, Any])
+    def run(self, query_embedding: List[float], filters: Optional[Dict[str, Any]] = None, query: Optional[str] = None,
+            follow_up: bool = False):
+        found = None if follow_up else self.cache.lookup(query_embedding, scope_key(filters))
+        if found is None:
+            output = {'query_embedding': query_embedding, 'meta': {'cache_hit': False}}
+            if query is not None:
+                output['query'] = query
+            return output
+        entry, similarity = found
+        print(f"answer cache hit ({similarity:.3f}) for cached query: {entry.query}")
+        reply = ChatMessage.from_assistant(entry.answer, meta={'cached_query': entry.query, 'similarity': similarity})
+        return {'replies': [reply], 'meta': {'cache_hit': True, 'similarity': similarity}}
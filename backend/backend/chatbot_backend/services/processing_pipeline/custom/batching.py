@@ -0,0 +1,157 @@
+import asyncio
+import json
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from haystack import component, Document
+
+
+class MicroBatcher:
+    """
+    Gathers items submitted from many threads (or event loops) within max_wait seconds of each other
+    and hands them to process_batch in one call, process_batch returns one result per item.
+    Up to max_concurrent_batches batches are in flight at once, the next one fills up meanwhile.
+    """
+    def __init__(self, process_batch, max_batch_size=32, max_wait=0.005, max_concurrent_batches=2, name='batcher'):
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.name = name
+        self._queue = queue.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent_batches, thread_name_prefix=name)
+        self._slots = threading.Semaphore(max_concurrent_batches)
+        self._lock = threading.Lock()
+        self._thread = None
+        self.batches = 0
+        self.items = 0
+
+    def submit(self, item):
+        """Queues an item and returns a concurrent.futures.Future of its result"""
+        self._ensure_started()
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def __call__(self, item):
+        return self.submit(item).result()
+
+    async def acall(self, item):
+        return await asyncio.wrap_future(self.submit(item))
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'items': self.items,
+            'mean_batch_size': self.items / self.batches if self.batches else 0.0,
+        }
+
+    def close(self):
+        """Stops the collector thread after the items already queued, the batcher can't be used afterwards"""
+        with self._lock:
+            if self._thread is None:
+                self._executor.shutdown(wait=False)
+            else:
+                self._queue.put(None)
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._collect, name=f'{self.name}-collector', daemon=True)
+                self._thread.start()
+
+    def _collect(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._executor.shutdown(wait=False)
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    # closed, this batch is the last one
+                    self._queue.put(None)
+                    break
+                batch.append(item)
+            # while every slot is busy the queue keeps filling, so the next batch gets bigger instead of waiting
+            self._slots.acquire()
+            self._executor.submit(self._process, batch)
+
+    def _process(self, batch):
+        try:
+            with self._lock:
+                self.batches += 1
+                self.items += len(batch)
+            try:
+                results = self.process_batch([item for item, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                return
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+        finally:
+            self._slots.release()
+
+
+def embed_texts(document_embedder, texts):
+    """Embeds texts in a single feature extraction request through a document embedder"""
+    documents = document_embedder.run(documents=[Document(content=text) for text in texts])['documents']
+    return [document.embedding for document in documents]
+
+
+def search_embeddings(document_store, requests):
+    """Runs (query_embedding, filters, top_k) requests as one collection query per distinct filters and top_k"""
+    groups = {}
+    for index, (_, filters, top_k) in enumerate(requests):
+        key = (json.dumps(filters, sort_keys=True, default=str), top_k)
+        groups.setdefault(key, []).append(index)
+
+    results = [None] * len(requests)
+    for indexes in groups.values():
+        _, filters, top_k = requests[indexes[0]]
+        documents = document_store.search_embeddings([requests[i][0] for i in indexes], top_k, filters)
+        for index, query_documents in zip(indexes, documents):
+            results[index] = query_documents
+    return results
+
+
+@component
+class BatchedTextEmbedder:
+    """Text embedder that sends its texts through a shared MicroBatcher"""
+    def __init__(self, batcher: MicroBatcher):
+        self.batcher = batcher
+
+    @component.output_types(embedding=List[float])
+    def run(self, text: str):
+        return {'embedding': self.batcher(text)}
+
+    @component.output_types(embedding=List[float])
+    async def run_async(self, text: str):
+        return {'embedding': await self.batcher.acall(text)}
+
+
+@component
+class BatchedRetriever:
+    """Embedding retriever that sends its queries through a shared MicroBatcher, see search_embeddings"""
+    def __init__(self, batcher: MicroBatcher, top_k: int = 10):
+        self.batcher = batcher
+        self.top_k = top_k
+
+    @component.output_types(documents=List[Document])
+    def run(self, query_embedding: List[float], filters: Optional[Dict[str, Any]] = None, top_k: Optional[int] = None):
+        return {'documents': self.batcher((query_embedding, filters, top_k or self.top_k))}
+
+    @component.output_types(documents=List[Document])
+    async def run_async(self, query_embedding: List[float], filters: Optional[Dict[str, Any]] = None, top_k: Optional[int] = None):
+        return {'documents': await self.batcher.acall((query_embedding, filters, top_k or self.top_k))}
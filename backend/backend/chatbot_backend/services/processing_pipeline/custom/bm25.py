@@ -0,0 +1,146 @@
+import dataclasses
+import math
+import re
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from haystack import component, Document
+from haystack.components.joiners import DocumentJoiner
+
+from .metadata_index import MetadataIndex
+
+ARABIC_DIACRITICS = re.compile('[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]')  # tashkeel, quranic marks and tatweel
+ARABIC_LETTER_VARIANTS = str.maketrans({
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    'ى': 'ي', 'ئ': 'ي', 'ؤ': 'و', 'ة': 'ه',
+    **{chr(0x0660 + digit): str(digit) for digit in range(10)},  # arabic-indic digits, for article numbers
+    **{chr(0x06f0 + digit): str(digit) for digit in range(10)},
+})
+TOKEN_PATTERN = re.compile(r'\w+')
+ARABIC_WORD = re.compile('^[\u0621-\u064a]+$')
+
+# light10 style affixes, applied once each, the stem has to keep at least 2 letters
+ARABIC_PREFIXES = ('وال', 'بال', 'كال', 'فال', 'لل', 'ال')
+ARABIC_SUFFIXES = ('ها', 'ان', 'ات', 'ون', 'ين', 'يه', 'ه', 'ي')
+
+
+def normalize_arabic(text):
+    """Removes diacritics and tatweel and folds letter variants that are written interchangeably"""
+    text = ARABIC_DIACRITICS.sub('', text)
+    return text.translate(ARABIC_LETTER_VARIANTS).casefold()
+
+
+def light_stem(token):
+    if not ARABIC_WORD.match(token):
+        return token
+    for prefix in ARABIC_PREFIXES:
+        if token.startswith(prefix) and len(token) - len(prefix) >= 2:
+            token = token[len(prefix):]
+            break
+    else:
+        if token.startswith('و') and len(token) > 3:
+            token = token[1:]
+    for suffix in ARABIC_SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= 2:
+            return token[:-len(suffix)]
+    return token
+
+
+def tokenize(text):
+    return [light_stem(token) for token in TOKEN_PATTERN.findall(normalize_arabic(text))]
+
+
+class BM25Index:
+    """
+    Inverted index scoring documents with BM25.
+    Postings are stored term by term in two flat arrays (document number, precomputed BM25 term weight)
+    with the start of every term's postings in `offsets`, 8 bytes per posting. The length normalization
+    doesn't depend on the query so it is folded into the weights at build time, a query is then a few
+    array slices summed into a score vector.
+    Filters are answered from a MetadataIndex over indexed_fields.
+    """
+    def __init__(self, documents: List[Document], k1=1.5, b=0.75, indexed_fields=()):
+        # embeddings are not needed to answer lexical queries
+        self.documents = [dataclasses.replace(document, embedding=None) for document in documents]
+        self.k1 = k1
+        self.b = b
+        self.filter_index = MetadataIndex(self.documents, indexed_fields)
+        self.vocabulary = {}
+
+        term_postings = []
+        document_lengths = np.zeros(len(self.documents), dtype=np.float32)
+        for document_number, document in enumerate(self.documents):
+            term_counts = Counter(tokenize(document.content or ''))
+            document_lengths[document_number] = sum(term_counts.values())
+            for term, count in term_counts.items():
+                term_id = self.vocabulary.setdefault(term, len(self.vocabulary))
+                if term_id == len(term_postings):
+                    term_postings.append([])
+                term_postings[term_id].append((document_number, count))
+
+        average_length = float(document_lengths.mean()) if len(self.documents) else 0.0
+        length_norm = k1 * (1 - b + b * document_lengths / (average_length or 1.0))
+
+        self.offsets = np.zeros(len(term_postings) + 1, dtype=np.int64)
+        self.offsets[1:] = np.cumsum([len(postings) for postings in term_postings])
+        self.document_numbers = np.empty(self.offsets[-1], dtype=np.int32)
+        self.weights = np.empty(self.offsets[-1], dtype=np.float32)
+        self.idf = np.empty(len(term_postings), dtype=np.float32)
+        for term_id, postings in enumerate(term_postings):
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            numbers, counts = zip(*postings)
+            numbers = np.array(numbers, dtype=np.int32)
+            counts = np.array(counts, dtype=np.float32)
+            self.document_numbers[start:end] = numbers
+            self.weights[start:end] = counts * (k1 + 1) / (counts + length_norm[numbers])
+            self.idf[term_id] = math.log(1 + (len(self.documents) - len(postings) + 0.5) / (len(postings) + 0.5))
+
+    def __len__(self):
+        return len(self.documents)
+
+    def nbytes(self):
+        return self.offsets.nbytes + self.document_numbers.nbytes + self.weights.nbytes + self.idf.nbytes
+
+    def search(self, query, top_k=5, filters=None):
+        """Returns copies of the top_k documents matching the query (and filters), with their BM25 score"""
+        scores = np.zeros(len(self.documents), dtype=np.float32)
+        for term in set(tokenize(query)):
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                continue
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            # a document appears once per term, so fancy indexed += is safe
+            scores[self.document_numbers[start:end]] += self.idf[term_id] * self.weights[start:end]
+
+        mask, _ = self.filter_index.select(filters)
+        if mask is not None:
+            scores[~mask] = 0
+        matches = np.flatnonzero(scores)
+        if len(matches) > top_k:
+            matches = matches[np.argpartition(-scores[matches], top_k - 1)[:top_k]]
+        matches = matches[np.argsort(-scores[matches], kind='stable')]
+        return [dataclasses.replace(self.documents[number], score=float(scores[number])) for number in matches]
+
+
+@component
+class HybridRetriever:
+    """
+    Adds BM25 matches of the query to the dense retriever's documents and fuses both lists with
+    reciprocal rank fusion. It takes the dense documents as input so it never runs when the
+    answer cache short-circuits retrieval.
+    """
+    def __init__(self, index: BM25Index, top_k: int = 5):
+        self.index = index
+        self.top_k = top_k
+        self.joiner = DocumentJoiner(join_mode="reciprocal_rank_fusion")
+
+    @component.output_types(documents=List[Document])
+    def run(self, query: str, documents: List[Document], top_k: Optional[int] = None,
+            filters: Optional[Dict[str, Any]] = None):
+        top_k = top_k or self.top_k
+        # the same filters as the dense retriever, or the lexical matches would leave the scope
+        lexical_documents = self.index.search(query, top_k=top_k, filters=filters)
+        # fusion writes scores on the documents, the dense ones are copied too so callers keep theirs
+        dense_documents = [dataclasses.replace(document) for document in documents]
+        return self.joiner.run(documents=[dense_documents, lexical_documents], top_k=top_k)
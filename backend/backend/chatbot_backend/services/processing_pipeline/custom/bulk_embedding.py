@@ -0,0 +1,219 @@
+import dataclasses
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from pathlib import Path
+from typing import Any, Dict, List
+
+import numpy as np
+from haystack import component, Document
+
+EMBEDDINGS_FILE = "embeddings.f32"
+IDS_FILE = "ids.txt"
+META_FILE = "meta.json"
+
+
+class EmbeddingCheckpoint:
+    """
+    Embeddings by chunk id kept on disk while an index is built, so an interrupted build resumes
+    without embedding the same chunks again.
+    Rows are float32 in a memory-mapped file, the id of row i is line i of an append-only id log.
+    Rows are flushed before their ids are appended, so every id in the log has its row on disk,
+    and rows without an id (a crash in between) are simply overwritten.
+    Embeddings of another model_id are discarded when the checkpoint is opened.
+    """
+    def __init__(self, path, model_id=None, initial_capacity=1024):
+        self.path = Path(path)
+        self.model_id = model_id
+        self.initial_capacity = initial_capacity
+        self.dimension = None
+        self._rows = {}
+        self._array = None
+        self._opened = False
+
+    def _open(self):
+        if self._opened:
+            return
+        self._opened = True
+        try:
+            with open(self.path / META_FILE) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            meta = None
+        if meta is None or meta.get("model_id") != self.model_id:
+            self.clear()
+            return
+        self.dimension = meta["dimension"]
+
+        ids_path = self.path / IDS_FILE
+        with open(ids_path, 'rb') as f:
+            data = f.read()
+        # a line without its newline was cut by a crash, it is dropped
+        complete = data[:data.rfind(b'\n') + 1]
+        if len(complete) != len(data):
+            with open(ids_path, 'r+b') as f:
+                f.truncate(len(complete))
+        ids = complete.decode().splitlines()
+        capacity = os.path.getsize(self.path / EMBEDDINGS_FILE) // (4 * self.dimension)
+        if capacity < len(ids):
+            # rows missing from the file, nothing stored can be trusted
+            self.clear()
+            return
+        self._rows = {id: row for row, id in enumerate(ids)}
+        self._array = np.memmap(self.path / EMBEDDINGS_FILE, dtype=np.float32, mode='r+',
+                                shape=(capacity, self.dimension))
+
+    def __len__(self):
+        self._open()
+        return len(self._rows)
+
+    def __contains__(self, id):
+        self._open()
+        return id in self._rows
+
+    def get(self, ids):
+        """Embeddings of ids (all in the checkpoint) as a (len(ids), dimension) array"""
+        self._open()
+        return np.asarray(self._array[[self._rows[id] for id in ids]])
+
+    def _reserve(self, rows):
+        capacity = 0 if self._array is None else self._array.shape[0]
+        if rows <= capacity:
+            return
+        capacity = max(rows, capacity * 2, self.initial_capacity)
+        if self._array is not None:
+            self._array.flush()
+            self._array = None
+        with open(self.path / EMBEDDINGS_FILE, 'ab') as f:
+            f.truncate(capacity * self.dimension * 4)
+        self._array = np.memmap(self.path / EMBEDDINGS_FILE, dtype=np.float32, mode='r+',
+                                shape=(capacity, self.dimension))
+
+    def append(self, ids, embeddings):
+        self._open()
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if not len(ids):
+            return
+        if self.dimension is None:
+            self.dimension = embeddings.shape[1]
+            self.path.mkdir(parents=True, exist_ok=True)
+            (self.path / IDS_FILE).touch()
+            with open(self.path / META_FILE, 'w') as f:
+                json.dump({"model_id": self.model_id, "dimension": self.dimension}, f)
+
+        start = len(self._rows)
+        self._reserve(start + len(ids))
+        self._array[start:start + len(ids)] = embeddings
+        self._array.flush()
+        with open(self.path / IDS_FILE, 'a') as f:
+            f.write(''.join(f"{id}\n" for id in ids))
+            f.flush()
+            os.fsync(f.fileno())
+        for row, id in enumerate(ids, start):
+            self._rows[id] = row
+
+    def clear(self):
+        """Deletes the checkpoint, once its embeddings are safely in the document store"""
+        self._array = None
+        self._rows = {}
+        self.dimension = None
+        self._opened = True
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+def make_batches(texts, max_batch_size=32, max_batch_chars=None):
+    """
+    Groups the indexes of texts into batches of similar lengths, longest first:
+    a batch is padded to its longest text, so sorting wastes less compute, and max_batch_chars keeps
+    batches of long texts small enough for the embedding server.
+    """
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]), reverse=True)
+    batches, batch, batch_chars = [], [], 0
+    for i in order:
+        if batch and (len(batch) >= max_batch_size or
+                      (max_batch_chars is not None and batch_chars + len(texts[i]) > max_batch_chars)):
+            batches.append(batch)
+            batch, batch_chars = [], 0
+        batch.append(i)
+        batch_chars += len(texts[i])
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+@component
+class BulkDocumentEmbedder:
+    """
+    Embeds many documents at once: documents are grouped by make_batches, `workers` batches are embedded
+    concurrently by embed_batch (a function from a list of texts to their embeddings), and every finished
+    batch is saved to the checkpoint. Documents already in the checkpoint (by id) are not embedded again.
+    Progress is printed every progress_interval seconds, meta reports chunks/s.
+    """
+    def __init__(self, embed_batch, checkpoint: EmbeddingCheckpoint = None, max_batch_size=32,
+                 max_batch_chars=None, workers=4, progress_interval=10.0):
+        self.embed_batch = embed_batch
+        self.checkpoint = checkpoint
+        self.max_batch_size = max_batch_size
+        self.max_batch_chars = max_batch_chars
+        self.workers = workers
+        self.progress_interval = progress_interval
+
+    def embed(self, ids, texts):
+        """Returns {id: embedding} of the texts, saving every batch to the checkpoint as it finishes"""
+        embeddings = {}
+        batches = make_batches(texts, self.max_batch_size, self.max_batch_chars)
+        start = last_report = time.perf_counter()
+        done = 0
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='bulk-embedder') as executor:
+            in_flight = {}
+            batches = iter(batches)
+            while True:
+                # a few batches queued ahead of the workers, not the whole corpus
+                for batch in batches:
+                    in_flight[executor.submit(self.embed_batch, [texts[i] for i in batch])] = batch
+                    if len(in_flight) >= self.workers * 2:
+                        break
+                if not in_flight:
+                    break
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    batch = in_flight.pop(future)
+                    batch_ids = [ids[i] for i in batch]
+                    batch_embeddings = future.result()
+                    if self.checkpoint is not None:
+                        self.checkpoint.append(batch_ids, batch_embeddings)
+                    embeddings.update(zip(batch_ids, batch_embeddings))
+                    done += len(batch)
+                now = time.perf_counter()
+                if now - last_report >= self.progress_interval:
+                    last_report = now
+                    print(f"embedded {done}/{len(texts)} chunks, {done / (now - start):.1f} chunks/s")
+        return embeddings
+
+    @component.output_types(documents=List[Document], meta=Dict[str, Any])
+    def run(self, documents: List[Document]):
+        start = time.perf_counter()
+        pending = {}
+        for document in documents:
+            if document.id not in pending and (self.checkpoint is None or document.id not in self.checkpoint):
+                pending[document.id] = document.content or ''
+        embeddings = self.embed(list(pending), list(pending.values())) if pending else {}
+
+        resumed = list({document.id for document in documents if document.id not in embeddings})
+        if resumed:
+            embeddings.update(zip(resumed, self.checkpoint.get(resumed)))
+        seconds = time.perf_counter() - start
+        meta = {
+            'chunks': len(documents),
+            'embedded': len(pending),
+            'resumed': len(resumed),
+            'seconds': round(seconds, 3),
+            'chunks_per_second': round(len(pending) / seconds, 1) if pending and seconds else None,
+        }
+        return {
+            'documents': [dataclasses.replace(document, embedding=[float(x) for x in embeddings[document.id]])
+                          for document in documents],
+            'meta': meta,
+        }
@@ -0,0 +1,52 @@
+from typing import Any, Callable, Dict, List, Optional
+
+from haystack import component, Document
+from haystack.dataclasses import ChatMessage
+
+
+@component
+class BlockingRetriever:
+    """
+    Wraps a retriever so that AsyncPipeline runs it in its thread pool.
+    Chroma's async methods only work with a remote HTTP client, the local persistent
+    store we ship is sync only, so its run_async can't be used.
+    """
+    def __init__(self, retriever):
+        self.retriever = retriever
+
+    @component.output_types(documents=List[Document])
+    def run(self, query_embedding: List[float], filters: Optional[Dict[str, Any]] = None, top_k: Optional[int] = None):
+        return self.retriever.run(query_embedding=query_embedding, filters=filters, top_k=top_k)
+
+
+class GenerationCancelled(Exception):
+    """Raised by a streaming callback to stop the generation it is receiving tokens from"""
+
+
+@component
+class CancellableChatGenerator:
+    """
+    Wraps a chat generator, when its streaming callback raises GenerationCancelled the generation stops
+    (the HTTP stream is closed) and cancelled_reply is returned as its reply instead.
+    """
+    def __init__(self, generator, cancelled_reply):
+        self.generator = generator
+        self.cancelled_reply = cancelled_reply
+
+    def warm_up(self):
+        if hasattr(self.generator, 'warm_up'):
+            self.generator.warm_up()
+
+    @component.output_types(replies=List[ChatMessage])
+    def run(self, messages: List[ChatMessage], streaming_callback: Optional[Callable] = None):
+        try:
+            return self.generator.run(messages=messages, streaming_callback=streaming_callback)
+        except GenerationCancelled:
+            return {'replies': [ChatMessage.from_assistant(self.cancelled_reply)]}
+
+    @component.output_types(replies=List[ChatMessage])
+    async def run_async(self, messages: List[ChatMessage], streaming_callback: Optional[Callable] = None):
+        try:
+            return await self.generator.run_async(messages=messages, streaming_callback=streaming_callback)
+        except GenerationCancelled:
+            return {'replies': [ChatMessage.from_assistant(self.cancelled_reply)]}
@@ -0,0 +1,137 @@
+import dataclasses
+import re
+import threading
+from typing import Any, Dict, List
+
+from haystack import component, Document
+
+CHARS_PER_TOKEN = 3  # rough average of arabic and english text, used when the tokenizer can't be loaded
+WORD_PATTERN = re.compile(r'\w+')
+
+
+class TokenCounter:
+    """
+    Counts and truncates text in tokens of the chat model's tokenizer (tokenizer.json from the hub),
+    falls back to a character based estimate when tokenizer_name is None or the tokenizer can't be loaded.
+    """
+    def __init__(self, tokenizer_name=None, token=None):
+        self.tokenizer_name = tokenizer_name
+        self.token = token
+        self._lock = threading.Lock()
+        self._tokenizer = None
+        self._loaded = tokenizer_name is None
+
+    def _get_tokenizer(self):
+        with self._lock:
+            if not self._loaded:
+                self._loaded = True
+                try:
+                    from tokenizers import Tokenizer
+                    self._tokenizer = Tokenizer.from_pretrained(self.tokenizer_name, token=self.token)
+                except Exception as e:
+                    print(f"couldn't load the {self.tokenizer_name} tokenizer, estimating token counts instead:", e)
+        return self._tokenizer
+
+    def count(self, text):
+        tokenizer = self._get_tokenizer()
+        if tokenizer is None:
+            return -(-len(text) // CHARS_PER_TOKEN)
+        return len(tokenizer.encode(text, add_special_tokens=False).ids)
+
+    def truncate(self, text, max_tokens):
+        """Returns the first max_tokens tokens of text"""
+        tokenizer = self._get_tokenizer()
+        if tokenizer is None:
+            return text[:max_tokens * CHARS_PER_TOKEN]
+        offsets = tokenizer.encode(text, add_special_tokens=False).offsets
+        if len(offsets) <= max_tokens:
+            return text
+        return text[:offsets[max_tokens - 1][1]] if max_tokens > 0 else ''
+
+
+def shingles(text, size=5):
+    words = WORD_PATTERN.findall(text.casefold())
+    if len(words) <= size:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+@component
+class ContextPacker:
+    """
+    Fits the history and the retrieved documents into a token budget before they reach the main prompt.
+    - history keeps the most recent messages within max_history_tokens, the oldest kept one may be truncated
+    - documents (in relevance order) that mostly repeat an already kept one are dropped, chunks
+      overlap after splitting so neighbours often share most of their text
+    - the rest of max_context_tokens is filled by relevance, every document is cut to max_document_tokens
+    """
+    def __init__(self, counter: TokenCounter, max_context_tokens=3000, max_history_tokens=300,
+                 max_document_tokens=800, min_truncated_tokens=64, dedupe_overlap=0.8):
+        self.counter = counter
+        self.max_context_tokens = max_context_tokens
+        self.max_history_tokens = max_history_tokens
+        self.max_document_tokens = max_document_tokens
+        self.min_truncated_tokens = min_truncated_tokens
+        self.dedupe_overlap = dedupe_overlap
+
+    def pack_history(self, history):
+        packed = []
+        budget = self.max_history_tokens
+        for message in reversed(history):
+            tokens = self.counter.count(message)
+            if tokens > budget:
+                if not packed:
+                    # the latest message is the query, it is always kept whole
+                    packed.append(message)
+                    budget -= tokens
+                elif budget >= self.min_truncated_tokens:
+                    message = self.counter.truncate(message, budget)
+                    packed.append(message)
+                    budget -= self.counter.count(message)
+                break
+            packed.append(message)
+            budget -= tokens
+        packed.reverse()
+        return packed, self.max_history_tokens - budget
+
+    def dedupe(self, documents):
+        kept, kept_shingles = [], []
+        for document in documents:
+            document_shingles = shingles(document.content or '')
+            if any(document.id == other.id for other in kept):
+                continue
+            if document_shingles and any(
+                    len(document_shingles & other) / len(document_shingles) >= self.dedupe_overlap
+                    for other in kept_shingles):
+                continue
+            kept.append(document)
+            kept_shingles.append(document_shingles)
+        return kept
+
+    @component.output_types(documents=List[Document], history=List[str], meta=Dict[str, Any])
+    def run(self, documents: List[Document], history: List[str]):
+        history, history_tokens = self.pack_history(history)
+        unique_documents = self.dedupe(documents)
+
+        packed = []
+        budget = max(self.max_context_tokens - history_tokens, 0)
+        for document in unique_documents:
+            content = self.counter.truncate(document.content or '', self.max_document_tokens)
+            tokens = self.counter.count(content)
+            if tokens > budget:
+                if budget >= self.min_truncated_tokens:
+                    content = self.counter.truncate(content, budget)
+                    packed.append(dataclasses.replace(document, content=content))
+                    budget -= self.counter.count(content)
+                break
+            packed.append(dataclasses.replace(document, content=content) if content != document.content else document)
+            budget -= tokens
+
+        meta = {
+            'history_tokens': history_tokens,
+            'document_tokens': max(self.max_context_tokens - history_tokens, 0) - budget,
+            'documents': len(packed),
+            'duplicates': len(documents) - len(unique_documents),
+            'dropped': len(unique_documents) - len(packed),
+        }
+        return {'documents': packed, 'history': history, 'meta': meta}
@@ -0,0 +1,438 @@
+"""File converters of the indexing pipeline, ported from rag_pipelines/rag_chat_processing_documents.ipynb"""
+import hashlib
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+from haystack import Document, component
+from haystack.lazy_imports import LazyImport
+
+with LazyImport(message="Run 'pip install pytesseract opencv-python pillow pdf2image' and install the "
+                        "tesseract-ocr, tesseract-ocr-ara and poppler-utils system packages") as ocr_import:
+    import cv2
+    import pytesseract
+    from pdf2image import convert_from_path, pdfinfo_from_path
+    from PIL import Image
+
+with LazyImport(message="Run 'pip install python-docx'") as docx_import:
+    import docx
+
+PDF_EXTENSIONS = ('.pdf',)
+WORD_EXTENSIONS = ('.docx', '.doc')
+TEXT_EXTENSIONS = ('.txt',)
+SUPPORTED_EXTENSIONS = PDF_EXTENSIONS + WORD_EXTENSIONS + TEXT_EXTENSIONS
+
+
+def count_pdf_pages(pdf_path):
+    return pdfinfo_from_path(pdf_path)["Pages"]
+
+
+def rasterize_page(pdf_path, page_number, dpi):
+    """Renders a single page (1-based), so only the pages being OCRed are ever in memory"""
+    return convert_from_path(pdf_path, dpi=dpi, first_page=page_number, last_page=page_number)[0]
+
+
+def preprocess_image(pil_image):
+    """Preprocess an image to improve OCR quality."""
+    image = np.array(pil_image)
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    _, thresh = cv2.threshold(gray, 150, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    return thresh
+
+
+def ocr_image(image, language):
+    return pytesseract.image_to_string(Image.fromarray(preprocess_image(image)), lang=language)
+
+
+def pdf_preprocess(text: str) -> str:
+    """Clean and preprocess extracted text."""
+    text = text.replace('\r', '')
+    text = text.split('\n\n')
+    text = [i.replace('\n', ' ').strip() for i in text]
+    text = [i for i in text if i != '']
+    text = '\n\n'.join(text)
+    return text
+
+
+def page_cache_key(image, language):
+    # keyed by the rendered pixels, a page keeps its text when the pdf around it is edited or renamed
+    key = hashlib.sha256(f"{language}\0{getattr(image, 'size', '')}\0{getattr(image, 'mode', '')}\0".encode())
+    key.update(image.tobytes())
+    return key.hexdigest()
+
+
+def ocr_page(pdf_path, page_number, dpi, language, cache_path=None):
+    """Rasterizes, OCRs and cleans one page, runs in the converter's worker processes"""
+    image = rasterize_page(pdf_path, page_number, dpi)
+    cache_file = None
+    if cache_path is not None:
+        key = page_cache_key(image, language)
+        cache_file = Path(cache_path) / key[:2] / f"{key}.txt"
+        try:
+            return cache_file.read_text(encoding='utf-8')
+        except OSError:
+            pass
+    text = pdf_preprocess(ocr_image(image, language))
+    del image
+    if cache_file is not None:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        # written to a temporary file first, workers reading the same page never see half a text
+        tmp_file = cache_file.with_suffix(f".{os.getpid()}.tmp")
+        tmp_file.write_text(text, encoding='utf-8')
+        os.replace(tmp_file, cache_file)
+    return text
+
+
+def _init_ocr_worker():
+    # tesseract's OpenMP threads would oversubscribe the cores the pool already uses
+    os.environ['OMP_THREAD_LIMIT'] = '1'
+
+
+@component
+class PdfToSingleDocumentConverter:
+    """
+    A component that converts multiple PDF files to Document objects using OCR.
+
+    Pages are rasterized one at a time and OCRed by a pool of `workers` processes, at most
+    `workers * pages_in_flight` pages are in progress at once, so memory stays flat whatever the page
+    count. The text of every page is cached in `cache_path` under the hash of its rendered image.
+    workers=0 runs everything in the calling process.
+    The pool is started with the first PDF and serves every following run until close(), the indexer
+    closes it once its update is done.
+    """
+
+    def __init__(self, workers: Optional[int] = None, cache_path: Optional[str] = None, pages_in_flight: int = 2):
+        self.workers = os.cpu_count() if workers is None else workers
+        self.cache_path = str(cache_path) if cache_path is not None else None
+        self.pages_in_flight = pages_in_flight
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def _get_executor(self):
+        """The OCR process pool, None when workers is 0"""
+        if self.workers <= 0:
+            return None
+        with self._executor_lock:
+            if self._executor is None:
+                # spawned rather than forked, the server process may be running other threads
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context('spawn'),
+                                                     initializer=_init_ocr_worker)
+            return self._executor
+
+    def close(self):
+        """Stops the OCR processes, a later run starts new ones"""
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    @staticmethod
+    def validate(pdf_path: str):
+        """Validate that the PDF file exists and required dependencies are available."""
+        if not os.path.exists(pdf_path):
+            raise ValueError(f"PDF file '{pdf_path}' does not exist.")
+
+        ocr_import.check()
+        # Check if Tesseract is available
+        try:
+            pytesseract.get_tesseract_version()
+        except Exception as e:
+            raise RuntimeError(
+                "Tesseract OCR is not properly installed or configured. "
+                "Please install it and ensure it's in your PATH. "
+                "For Arabic support, also install the Arabic language pack: tesseract-ocr-ara"
+            ) from e
+
+    def _map_pages(self, executor, pdf_path, pages, dpi, language):
+        """Yields the text of every page in order, keeping a bounded number of pages in flight"""
+        if executor is None:
+            for page_number in range(1, pages + 1):
+                yield ocr_page(pdf_path, page_number, dpi, language, self.cache_path)
+            return
+        in_flight = deque()
+        next_page = 1
+        try:
+            while next_page <= pages or in_flight:
+                while next_page <= pages and len(in_flight) < self.workers * self.pages_in_flight:
+                    in_flight.append(executor.submit(ocr_page, pdf_path, next_page, dpi, language, self.cache_path))
+                    next_page += 1
+                yield in_flight.popleft().result()
+        finally:
+            # the pool outlives this file, pages nobody will read are dropped
+            for future in in_flight:
+                future.cancel()
+
+    def iter_pages(self, pdf_paths: List[str], dpi: int = 300, language: str = 'ara'):
+        """
+        Generator of one Document per page, in order, the pages of a file are OCRed in parallel.
+
+        Args:
+            pdf_paths: List of paths to PDF files to process.
+            dpi: DPI for image conversion (higher = better quality but slower).
+            language: Tesseract language code (default 'ara' for Arabic).
+        """
+        for pdf_path in pdf_paths:
+            self.validate(pdf_path)
+            pages = count_pdf_pages(pdf_path)
+            executor = self._get_executor()
+            for page_number, text in enumerate(self._map_pages(executor, pdf_path, pages, dpi, language), 1):
+                yield Document(
+                    content=text,
+                    meta={
+                        "file_path": pdf_path,
+                        "page_number": page_number,
+                        "total_pages": pages,
+                        "language": language,
+                    }
+                )
+
+    @component.output_types(documents=List[Document])
+    def run(self, pdf_paths: List[str], dpi: int = 300, language: str = 'ara'):
+        """
+        Convert multiple PDF files to Document objects.
+
+        Args:
+            pdf_paths: List of paths to PDF files to process.
+            dpi: DPI for image conversion (higher = better quality but slower).
+            language: Tesseract language code (default 'ara' for Arabic).
+
+        Returns:
+            A dictionary with a 'documents' key containing Document objects for all PDFs.
+        """
+        all_documents = []
+        if not pdf_paths:
+            return {"documents": all_documents}
+
+        # only the page texts are kept, the images are gone once a page is OCRed
+        texts = {}
+        for page in self.iter_pages(pdf_paths, dpi=dpi, language=language):
+            texts.setdefault(page.meta["file_path"], []).append(page.content)
+
+        for pdf_path in pdf_paths:
+            processed_texts = texts.get(pdf_path, [])
+
+            # Join all pages into a single text
+            full_text = "\n\n".join(processed_texts)
+
+            # Create a single Document object for the entire PDF
+            doc = Document(
+                content=full_text,
+                meta={
+                    "file_path": pdf_path,
+                    "total_pages": len(processed_texts),
+                    "language": language,
+                    "is_full_document": True
+                }
+            )
+
+            all_documents.append(doc)
+
+        return {"documents": all_documents}
+
+
+@component
+class WordToDocumentConverter:
+    """
+    A component that converts multiple Word documents to Document objects.
+    """
+
+    @staticmethod
+    def validate(word_path: str):
+        """Validate that the Word file exists and has a supported format."""
+        if not os.path.exists(word_path):
+            raise ValueError(f"Word file '{word_path}' does not exist.")
+
+        if not word_path.lower().endswith(WORD_EXTENSIONS):
+            raise ValueError("Only DOCX and DOC files are supported.")
+        docx_import.check()
+
+    @component.output_types(documents=List[Document])
+    def run(self, word_paths: List[str]):
+        """
+        Convert multiple Word documents to Document objects.
+
+        Args:
+            word_paths: List of paths to Word documents to process.
+
+        Returns:
+            A dictionary with a 'documents' key containing Document objects for all Word files.
+        """
+        all_documents = []
+
+        for word_path in word_paths:
+            self.validate(word_path)
+
+            # Extract text from Word document
+            document = docx.Document(word_path)
+            full_text = []
+
+            for para in document.paragraphs:
+                full_text.append(para.text)
+
+            # Process tables if needed
+            for table in document.tables:
+                for row in table.rows:
+                    for cell in row.cells:
+                        full_text.append(cell.text)
+
+            full_text = "\n\n".join(full_text)
+
+            # Create a Document object
+            doc = Document(
+                content=full_text,
+                meta={
+                    "file_path": word_path,
+                    "file_type": "word",
+                    "total_paragraphs": len(document.paragraphs),
+                    "total_tables": len(document.tables)
+                }
+            )
+
+            all_documents.append(doc)
+
+        return {"documents": all_documents}
+
+
+@component
+class TextFileToDocumentConverter:
+    """
+    A component that converts multiple text files to Document objects.
+    """
+
+    @staticmethod
+    def validate(text_path: str):
+        """Validate that the text file exists and has a supported format."""
+        if not os.path.exists(text_path):
+            raise ValueError(f"Text file '{text_path}' does not exist.")
+
+        if not text_path.lower().endswith(TEXT_EXTENSIONS):
+            raise ValueError("Only TXT files are supported.")
+
+    @component.output_types(documents=List[Document])
+    def run(self, text_paths: List[str], encoding: str = 'utf-8'):
+        """
+        Convert multiple text files to Document objects.
+
+        Args:
+            text_paths: List of paths to text files to process.
+            encoding: File encoding (default 'utf-8').
+
+        Returns:
+            A dictionary with a 'documents' key containing Document objects for all text files.
+        """
+        all_documents = []
+
+        for text_path in text_paths:
+            self.validate(text_path)
+
+            # Read text from file
+            try:
+                with open(text_path, 'r', encoding=encoding) as file:
+                    full_text = file.read()
+            except Exception as e:
+                raise RuntimeError(f"Failed to read text file: {str(e)}") from e
+
+            # Create a Document object
+            doc = Document(
+                content=full_text,
+                meta={
+                    "file_path": text_path,
+                    "file_type": "text",
+                    "encoding": encoding,
+                    "character_count": len(full_text)
+                }
+            )
+
+            all_documents.append(doc)
+
+        return {"documents": all_documents}
+
+
+@component
+class FileTypeDetector:
+    """
+    A component that detects file types based on extensions and groups them by type.
+
+    This component examines file extensions and groups file paths
+    into categories: PDF, Word, and text files.
+    """
+
+    @component.output_types(pdf_paths=List[str], word_paths=List[str], text_paths=List[str])
+    def run(self, file_paths: List[str]):
+        """
+        Group file paths by type.
+
+        Args:
+            file_paths: List of paths to files to be processed
+
+        Returns:
+            Dictionary with paths grouped by file type
+        """
+        pdf_paths = []
+        word_paths = []
+        text_paths = []
+
+        for file_path in file_paths:
+            # Validate file exists
+            if not os.path.exists(file_path):
+                raise ValueError(f"File not found: {file_path}")
+
+            _, extension = os.path.splitext(file_path)
+            extension = extension.lower()
+
+            if extension in PDF_EXTENSIONS:
+                pdf_paths.append(file_path)
+            elif extension in WORD_EXTENSIONS:
+                word_paths.append(file_path)
+            elif extension in TEXT_EXTENSIONS:
+                text_paths.append(file_path)
+            else:
+                raise ValueError(f"Unsupported file format: {extension}. Supported formats are PDF, DOCX, DOC, and TXT.")
+
+        return {
+            "pdf_paths": pdf_paths,
+            "word_paths": word_paths,
+            "text_paths": text_paths
+        }
+
+
+@component
+class DocumentMerger:
+    """
+    A component that merges documents from multiple sources into a single list.
+
+    This component collects documents from PDF, Word, and text converters
+    and combines them into a single list for downstream processing.
+    """
+
+    @component.output_types(documents=List[Document])
+    def run(self, pdf_documents: List[Document] = None,
+            word_documents: List[Document] = None,
+            text_documents: List[Document] = None):
+        """
+        Merge documents from different sources.
+
+        Args:
+            pdf_documents: Documents from PDF converter
+            word_documents: Documents from Word converter
+            text_documents: Documents from text converter
+
+        Returns:
+            Merged list of documents
+        """
+        all_documents = []
+
+        if pdf_documents:
+            all_documents.extend(pdf_documents)
+        if word_documents:
+            all_documents.extend(word_documents)
+        if text_documents:
+            all_documents.extend(text_documents)
+
+        return {"documents": all_documents}
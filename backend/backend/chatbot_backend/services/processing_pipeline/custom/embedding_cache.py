@@ -0,0 +1,191 @@
+import asyncio
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List
+
+from haystack import component
+
+
+def normalize_query(text):
+    """Greetings and FAQ questions differ mostly in case and spacing, so they share one cache entry"""
+    text = unicodedata.normalize('NFKC', text)
+    return re.sub(r'\s+', ' ', text).strip().casefold()
+
+
+class EmbeddingCache:
+    """
+    Bounded LRU cache of query embeddings keyed by (model, normalized text), with a TTL.
+    When disk_path is set, entries are also written to a sqlite file so they survive restarts,
+    memory misses fall back to it before the embedder is called. Every prune_every writes, expired rows
+    and the oldest ones beyond disk_max_size are deleted from it.
+    The file is shared by every worker process, a disk error (e.g. "database is locked") is a cache miss
+    and never fails the request.
+    """
+    def __init__(self, max_size=1024, ttl=None, disk_path=None, disk_max_size=100000, prune_every=64,
+                 clock=time.time):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.disk_max_size = disk_max_size
+        self.prune_every = prune_every
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.disk_errors = 0
+
+        self._db = None
+        if disk_path:
+            Path(disk_path).parent.mkdir(parents=True, exist_ok=True)
+            # waits at most a second for another worker's write
+            self._db = sqlite3.connect(str(disk_path), timeout=1.0, check_same_thread=False)
+            try:
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, embedding BLOB, created_at REAL)"
+                )
+                self._db.execute("CREATE INDEX IF NOT EXISTS embeddings_created_at ON embeddings (created_at)")
+                self._db.commit()
+            except sqlite3.Error as e:
+                # memory only for the life of this process
+                self._disk_error(e)
+                self._db.close()
+                self._db = None
+
+    @staticmethod
+    def make_key(model, text):
+        return hashlib.sha256(f"{model}\x00{normalize_query(text)}".encode('utf-8')).hexdigest()
+
+    def _is_expired(self, created_at):
+        return self.ttl is not None and self.clock() - created_at > self.ttl
+
+    def get(self, model, text):
+        key = self.make_key(model, text)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                created_at, embedding = entry
+                if not self._is_expired(created_at):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return embedding
+                del self._entries[key]
+
+            if self._db is not None:
+                try:
+                    row = self._db.execute("SELECT embedding, created_at FROM embeddings WHERE key = ?", (key,)).fetchone()
+                except sqlite3.Error as e:
+                    self._disk_error(e)
+                    row = None
+                if row is not None and not self._is_expired(row[1]):
+                    embedding = array('f', row[0]).tolist()
+                    self._remember(key, row[1], embedding)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return embedding
+
+            self.misses += 1
+            return None
+
+    def put(self, model, text, embedding):
+        key = self.make_key(model, text)
+        created_at = self.clock()
+        with self._lock:
+            self._remember(key, created_at, list(embedding))
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO embeddings (key, embedding, created_at) VALUES (?, ?, ?)",
+                        (key, array('f', embedding).tobytes(), created_at)
+                    )
+                    self._writes += 1
+                    if self._writes % self.prune_every == 0:
+                        self._prune(created_at)
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    self._db.rollback()
+                    self._disk_error(e)
+
+    def _prune(self, now):
+        if self.ttl is not None:
+            self._db.execute("DELETE FROM embeddings WHERE created_at < ?", (now - self.ttl,))
+        if self.disk_max_size is not None:
+            self._db.execute(
+                "DELETE FROM embeddings WHERE key IN "
+                "(SELECT key FROM embeddings ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                (self.disk_max_size,)
+            )
+
+    def _disk_error(self, error):
+        self.disk_errors += 1
+        print("query embedding cache disk error, skipped:", error)
+
+    def _remember(self, key, created_at, embedding):
+        self._entries[key] = (created_at, embedding)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                try:
+                    self._db.execute("DELETE FROM embeddings")
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    self._disk_error(e)
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self):
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'disk_errors': self.disk_errors,
+            'hit_rate': round(self.hit_rate, 3),
+        }
+
+
+@component
+class CachedTextEmbedder:
+    """Wraps a text embedder, only texts that are not in the cache are sent to it"""
+    def __init__(self, embedder, cache: EmbeddingCache, model: str):
+        self.embedder = embedder
+        self.cache = cache
+        self.model = model
+
+    @component.output_types(embedding=List[float], meta=Dict[str, Any])
+    def run(self, text: str):
+        embedding = self.cache.get(self.model, text)
+        cache_hit = embedding is not None
+        if not cache_hit:
+            embedding = self.embedder.run(text=text)['embedding']
+            self.cache.put(self.model, text, embedding)
+        return {'embedding': embedding, 'meta': {'cache_hit': cache_hit, **self.cache.stats()}}
+
+    @component.output_types(embedding=List[float], meta=Dict[str, Any])
+    async def run_async(self, text: str):
+        embedding = self.cache.get(self.model, text)
+        cache_hit = embedding is not None
+        if not cache_hit:
+            if hasattr(self.embedder, 'run_async'):
+                result = await self.embedder.run_async(text=text)
+            else:
+                result = await asyncio.to_thread(self.embedder.run, text=text)
+            embedding = result['embedding']
+            self.cache.put(self.model, text, embedding)
+        return {'embedding': embedding, 'meta': {'cache_hit': cache_hit, **self.cache.stats()}}
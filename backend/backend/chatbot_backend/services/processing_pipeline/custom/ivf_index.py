@@ -0,0 +1,143 @@
+import numpy as np
+
+PQ_CENTROIDS = 256  # codes are one byte per sub-vector
+
+
+def normalize(vectors, norms=None):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if norms is None:
+        norms = np.linalg.norm(vectors, axis=-1)
+    return vectors / np.maximum(np.asarray(norms, dtype=np.float32), 1e-12)[..., None]
+
+
+def assign(vectors, centroids, block_size=16384):
+    """Index of the nearest centroid (L2) of every vector"""
+    centroid_norms = (centroids ** 2).sum(axis=1)
+    labels = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), block_size):
+        block = np.asarray(vectors[start:start + block_size], dtype=np.float32)
+        # argmin |x - c|^2 = argmax 2 x.c - |c|^2
+        labels[start:start + len(block)] = np.argmax(2 * block @ centroids.T - centroid_norms, axis=1)
+    return labels
+
+
+def kmeans(vectors, k, iterations=20, seed=0):
+    """Lloyd's k-means, empty clusters are reseeded with random vectors"""
+    rng = np.random.default_rng(seed)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    k = min(k, len(vectors))
+    centroids = vectors[rng.choice(len(vectors), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        labels = assign(vectors, centroids)
+        counts = np.bincount(labels, minlength=k)
+        order = np.argsort(labels, kind='stable')
+        nonempty = counts > 0
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[nonempty]
+        centroids[nonempty] = np.add.reduceat(vectors[order], starts, axis=0) / counts[nonempty, None]
+        empty = np.flatnonzero(~nonempty)
+        if len(empty):
+            centroids[empty] = vectors[rng.choice(len(vectors), size=len(empty), replace=False)]
+    return centroids
+
+
+class IVFIndex:
+    """
+    Inverted file index over the unit-normalized embeddings of a store, optionally product quantized (IVF-PQ).
+
+    - the embeddings are clustered into nlist lists by k-means, a query only scores the rows of its
+      nprobe closest lists (more lists probed: better recall, slower)
+    - with pq_m set, the residual of every row (row - its list centroid) is also encoded as pq_m one byte
+      codes (256 centroids per sub-vector), candidates are ranked from lookup tables without touching the
+      embeddings, and only the best `rerank` of them are rescored exactly from the embeddings (refinement)
+    - without pq_m every candidate is scored exactly (IVF-Flat)
+    Rows added after training are encoded with the trained centroids (incremental inserts), the owner
+    retrains once the store has grown well past trained_size (its size when the index was trained).
+    """
+    def __init__(self, nlist, nprobe=16, pq_m=None, rerank=200, centroids=None, codebooks=None,
+                 list_ids=None, codes=None, trained_size=0):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.pq_m = pq_m
+        self.rerank = rerank
+        self.centroids = centroids
+        self.codebooks = codebooks
+        self.trained_size = trained_size
+        self.list_ids = None
+        self.codes = None
+        if list_ids is not None:
+            self.set_rows(list_ids, codes)
+
+    @property
+    def arrays(self):
+        """Everything saved with the store, by name"""
+        arrays = {'centroids': self.centroids, 'list_ids': self.list_ids}
+        if self.pq_m:
+            arrays.update(codebooks=self.codebooks, codes=self.codes)
+        return arrays
+
+    def params(self):
+        return {'nlist': self.nlist, 'pq_m': self.pq_m, 'trained_size': self.trained_size}
+
+    def nbytes(self):
+        return sum(array.nbytes for array in self.arrays.values())
+
+    def train(self, sample, iterations=20, seed=0):
+        """Learns the list centroids (and PQ codebooks) from unit-normalized sample vectors"""
+        sample = np.asarray(sample, dtype=np.float32)
+        self.centroids = kmeans(sample, self.nlist, iterations=iterations, seed=seed)
+        self.nlist = len(self.centroids)
+        if self.pq_m:
+            dimension = sample.shape[1]
+            if dimension % self.pq_m:
+                raise ValueError(f"pq_m={self.pq_m} must divide the embedding dimension {dimension}")
+            residuals = sample - self.centroids[assign(sample, self.centroids)]
+            sub_vectors = residuals.reshape(len(sample), self.pq_m, -1)
+            self.codebooks = np.stack([kmeans(sub_vectors[:, m], PQ_CENTROIDS, iterations=iterations, seed=seed + m)
+                                       for m in range(self.pq_m)])
+
+    def encode(self, unit_vectors):
+        """List id (and PQ codes) of unit-normalized vectors"""
+        list_ids = assign(unit_vectors, self.centroids)
+        codes = None
+        if self.pq_m:
+            residuals = np.asarray(unit_vectors, dtype=np.float32) - self.centroids[list_ids]
+            sub_vectors = residuals.reshape(len(unit_vectors), self.pq_m, -1)
+            codes = np.stack([assign(sub_vectors[:, m], self.codebooks[m]) for m in range(self.pq_m)],
+                             axis=1).astype(np.uint8)
+        return list_ids, codes
+
+    def set_rows(self, list_ids, codes=None):
+        """Sets the encoded rows and builds the inverted lists (row positions grouped by list)"""
+        self.list_ids = np.asarray(list_ids, dtype=np.int32)
+        self.codes = codes
+        self._order = np.argsort(self.list_ids, kind='stable').astype(np.int32)
+        self._offsets = np.concatenate([[0], np.cumsum(np.bincount(self.list_ids, minlength=self.nlist))])
+
+    def candidates(self, query, nprobe=None, mask=None):
+        """Row positions of the nprobe lists closest to the unit-normalized query, and the query's score of every list"""
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        list_scores = self.centroids @ query
+        probed = np.argpartition(-list_scores, nprobe - 1)[:nprobe] if nprobe < self.nlist else range(self.nlist)
+        rows = np.concatenate([self._order[self._offsets[list_id]:self._offsets[list_id + 1]] for list_id in probed])
+        if mask is not None:
+            rows = rows[mask[rows]]
+        return rows, list_scores
+
+    def search(self, query, top_k, embeddings, norms, nprobe=None, mask=None):
+        """Returns (row positions, cosine scores) of the approximate top_k, best first"""
+        query = normalize(query)
+        rows, list_scores = self.candidates(query, nprobe, mask)
+        if self.pq_m and len(rows) > max(self.rerank, top_k):
+            # q.row = q.centroid + q.residual, the second term from the codes' lookup tables
+            tables = np.einsum('mcd,md->mc', self.codebooks, query.reshape(self.pq_m, -1))
+            approximate = list_scores[self.list_ids[rows]] + tables[np.arange(self.pq_m), self.codes[rows]].sum(axis=1)
+            keep = max(self.rerank, top_k)
+            rows = rows[np.argpartition(-approximate, keep - 1)[:keep]]
+        rows = np.sort(rows)  # sequential reads of the memory-mapped matrix
+        scores = (np.asarray(embeddings[rows], dtype=np.float32) @ query) / np.maximum(norms[rows], 1e-12)
+        k = min(top_k, len(rows))
+        if k == 0:
+            return rows[:0], scores[:0]
+        top = np.argpartition(-scores, k - 1)[:k] if k < len(rows) else np.arange(len(rows))
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return rows[top], scores[top]
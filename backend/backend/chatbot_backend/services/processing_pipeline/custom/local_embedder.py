@@ -0,0 +1,82 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from haystack import component
+from haystack.lazy_imports import LazyImport
+
+with LazyImport(message="Run 'pip install \"sentence-transformers[onnx]\"' to embed locally") as sentence_transformers_import:
+    from sentence_transformers import SentenceTransformer
+
+
+class LocalEmbeddingModel:
+    """
+    Embedding model loaded in process on CPU, shared by every pipeline.
+    Encoding runs on a pool of `threads` workers each using `intra_op_threads` cores (ONNX Runtime and
+    torch release the GIL), so concurrent requests run in parallel without oversubscribing the CPU.
+    intra_op_threads is set on the ONNX Runtime session only: torch's thread count is process wide
+    (the reranker and everything else share it), the torch backend leaves it alone.
+    """
+    def __init__(self, model, backend='onnx', file_name=None, threads=4, intra_op_threads=1, batch_size=32, token=None):
+        self.model = model
+        self.backend = backend
+        self.file_name = file_name
+        self.intra_op_threads = intra_op_threads
+        self.batch_size = batch_size
+        self.token = token
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='local-embedder')
+        self._lock = threading.Lock()
+        self._model = None
+
+    def warm_up(self):
+        with self._lock:
+            if self._model is None:
+                sentence_transformers_import.check()
+                self._model = SentenceTransformer(self.model, device='cpu', backend=self.backend,
+                                                  token=self.token, model_kwargs=self._model_kwargs())
+
+    def _model_kwargs(self):
+        if self.backend == 'torch':
+            return {}
+        model_kwargs = {'provider': 'CPUExecutionProvider'} if self.backend == 'onnx' else {}
+        if self.file_name:
+            model_kwargs['file_name'] = self.file_name
+        if self.backend == 'onnx':
+            import onnxruntime
+            session_options = onnxruntime.SessionOptions()
+            session_options.intra_op_num_threads = self.intra_op_threads
+            model_kwargs['session_options'] = session_options
+        return model_kwargs
+
+    def _encode(self, texts):
+        self.warm_up()
+        # bge-m3 embeddings from the inference API are normalized, local ones have to match
+        embeddings = self._model.encode(texts, batch_size=self.batch_size, normalize_embeddings=True,
+                                        convert_to_numpy=True, show_progress_bar=False)
+        return embeddings.tolist()
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        return self._executor.submit(self._encode, texts).result()
+
+    async def aembed(self, texts: List[str]) -> List[List[float]]:
+        return await asyncio.wrap_future(self._executor.submit(self._encode, texts))
+
+
+@component
+class LocalTextEmbedder:
+    """Text embedder running a shared LocalEmbeddingModel"""
+    def __init__(self, model: LocalEmbeddingModel):
+        self.model = model
+
+    def warm_up(self):
+        self.model.warm_up()
+
+    @component.output_types(embedding=List[float])
+    def run(self, text: str):
+        return {'embedding': self.model.embed([text])[0]}
+
+    @component.output_types(embedding=List[float])
+    async def run_async(self, text: str):
+        return {'embedding': (await self.model.aembed([text]))[0]}
+
@@ -0,0 +1,95 @@
+import json
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from haystack.utils.filters import document_matches_filter
+
+INDEXED_OPERATORS = ('==', '!=', 'in', 'not in')
+
+
+class MetadataIndex:
+    """
+    Posting lists (row positions of every value) of a few metadata fields of a document list, so filters
+    on them are answered with a few array writes instead of matching every document.
+    Conditions on other fields or with other operators (>, <...) fall back to document_matches_filter,
+    AND / OR / NOT combine the masks of their conditions.
+    The results of recent filters are kept, a conversation sends the same filters with every message.
+    """
+    def __init__(self, documents, fields=(), cache_size=64):
+        self.documents = documents
+        self.cache_size = cache_size
+        self.postings = {}
+        for field in fields:
+            values = {}
+            for position, document in enumerate(documents):
+                value = document.meta.get(field)
+                if value is None:
+                    continue
+                try:
+                    values.setdefault(value, []).append(position)
+                except TypeError:
+                    # unhashable values (lists...), the field is matched document by document
+                    values = None
+                    break
+            if values is not None:
+                self.postings[field] = {value: np.array(positions, dtype=np.int32) for value, positions in values.items()}
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def nbytes(self):
+        return sum(rows.nbytes for postings in self.postings.values() for rows in postings.values())
+
+    def select(self, filters):
+        """Returns (mask, rows) of the documents matching the filters, both read-only, or (None, None) without filters"""
+        if not filters:
+            return None, None
+        key = json.dumps(filters, sort_keys=True, default=str)
+        with self._lock:
+            selection = self._cache.get(key)
+            if selection is not None:
+                self._cache.move_to_end(key)
+                return selection
+        mask = self._evaluate(filters)
+        rows = np.flatnonzero(mask)
+        mask.flags.writeable = False
+        rows.flags.writeable = False
+        with self._lock:
+            self._cache[key] = (mask, rows)
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return mask, rows
+
+    def _match(self, condition):
+        return np.fromiter((document_matches_filter(condition, document) for document in self.documents),
+                           dtype=bool, count=len(self.documents))
+
+    def _evaluate(self, condition):
+        if 'conditions' in condition:
+            operator = condition.get('operator')
+            if operator not in ('AND', 'OR', 'NOT') or not condition['conditions']:
+                return self._match(condition)
+            masks = [self._evaluate(sub_condition) for sub_condition in condition['conditions']]
+            if operator == 'OR':
+                return np.logical_or.reduce(masks)
+            mask = np.logical_and.reduce(masks)
+            return ~mask if operator == 'NOT' else mask
+
+        field = condition.get('field', '')
+        postings = self.postings.get(field[len('meta.'):]) if field.startswith('meta.') else None
+        operator = condition.get('operator')
+        if postings is None or operator not in INDEXED_OPERATORS:
+            return self._match(condition)
+        values = condition.get('value')
+        if operator in ('==', '!='):
+            values = [values]
+        if not isinstance(values, list) or any(value is None or not isinstance(value, (str, int, float, bool))
+                                               for value in values):
+            return self._match(condition)
+        mask = np.zeros(len(self.documents), dtype=bool)
+        for value in values:
+            rows = postings.get(value)
+            if rows is not None:
+                mask[rows] = True
+        # like document_matches_filter, documents without the field match != and not in
+        return ~mask if operator in ('!=', 'not in') else mask
@@ -0,0 +1,410 @@
+import json
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from haystack import component, default_from_dict, default_to_dict, Document
+from haystack.document_stores.errors import DuplicateDocumentError
+from haystack.document_stores.types import DuplicatePolicy
+
+from .ivf_index import IVFIndex, normalize
+from .metadata_index import MetadataIndex
+from .quantization import QuantizedEmbeddings, quantized_search
+
+STORE_MANIFEST_NAME = "store.json"
+# filtered searches only score the matching rows below this fraction of the store, above it
+# streaming the whole matrix is cheaper than gathering the rows
+SUBSET_SEARCH_FRACTION = 0.5
+
+
+class StoreState:
+    """One generation of the store, replaced as a whole on every write so searches never see half of one"""
+    def __init__(self, generation, documents, embeddings, norms, ivf=None, quantized=None):
+        self.generation = generation
+        self.documents = documents
+        self.embeddings = embeddings
+        self.norms = norms
+        self.ivf = ivf
+        self.quantized = quantized
+        self.positions = {document.id: position for position, document in enumerate(documents)}
+        # built on the first filtered search
+        self.filter_index = None
+
+
+class NumpyDocumentStore:
+    """
+    Document store keeping every embedding in one contiguous float32 (or float16) matrix with its
+    precomputed norms, searched with a vectorized dot product and argpartition, for corpora that fit in RAM.
+
+    Each write saves a new generation of .npy files (embeddings, norms) and documents .json under path,
+    then store.json is replaced to point to it, so readers never see half a write. The previous generation
+    is only deleted by the next write, a process that just read store.json can still open its files.
+    Saving rewrites every array, inside batch() the writes and deletes are saved as one generation instead.
+    The matrices are memory-mapped when loaded, no copy: pages come from the page cache on first use and
+    are shared by every process serving the same store.
+    Scores are cosine similarities, higher is better.
+
+    With `ann` set (the "ann" settings of numpy_store in config.py), stores of at least min_documents
+    documents are also indexed by an IVFIndex saved with every generation and searched approximately.
+    Written rows are encoded with the existing centroids, the index is trained again once the store
+    has grown retrain_growth times since it was trained.
+
+    With `quantization` set ("int8" or "binary"), exact searches scan a QuantizedEmbeddings copy of the
+    matrix saved with every generation instead (4x / 32x smaller), and only its best
+    top_k * rescore_multiplier candidates (a default per kind when None) are scored again from the
+    float embeddings, so the float matrix stays mostly on disk. int8 saves memory, not time.
+
+    Filters on indexed_fields are answered from posting lists (see MetadataIndex), and a filter
+    matching a small part of the store only scores those rows, so it is faster than an unfiltered search.
+    """
+    def __init__(self, path, dtype='float32', block_size=65536, ann=None, quantization=None, rescore_multiplier=None,
+                 indexed_fields=()):
+        self.path = Path(path)
+        self.dtype = np.dtype(dtype)
+        # rows converted to float32 at once when the matrix is float16
+        self.block_size = block_size
+        self.ann = ann
+        self.quantization = quantization
+        self.rescore_multiplier = rescore_multiplier
+        self.indexed_fields = list(indexed_fields)
+        self._lock = threading.Lock()
+        # writes and deletes of the open batch(): ({id: document with its embedding}, deleted ids)
+        self._pending = None
+        self._state = self._load()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return default_to_dict(self, path=str(self.path), dtype=self.dtype.name, block_size=self.block_size, ann=self.ann,
+                               quantization=self.quantization, rescore_multiplier=self.rescore_multiplier,
+                               indexed_fields=self.indexed_fields)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "NumpyDocumentStore":
+        return default_from_dict(cls, data)
+
+    def _load(self, attempts=3):
+        try:
+            with open(self.path / STORE_MANIFEST_NAME) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return StoreState(0, [], np.zeros((0, 0), dtype=self.dtype), np.zeros(0, dtype=np.float32))
+        try:
+            return self._load_generation(manifest)
+        except FileNotFoundError:
+            # deleted by a writer two generations ahead, store.json points to a newer one
+            if attempts <= 1:
+                raise
+            return self._load(attempts - 1)
+
+    def _load_generation(self, manifest):
+        generation = manifest["generation"]
+        with open(self.path / f"documents-{generation}.json", encoding='utf-8') as f:
+            documents = [Document(id=item["id"], content=item["content"], meta=item["meta"]) for item in json.load(f)]
+        embeddings = np.load(self.path / f"embeddings-{generation}.npy", mmap_mode='r')
+        norms = np.load(self.path / f"norms-{generation}.npy", mmap_mode='r')
+        ivf = None
+        if self.ann is not None and manifest.get("ivf"):
+            params = manifest["ivf"]
+            arrays = {name: np.load(self.path / f"ivf-{name}-{generation}.npy", mmap_mode='r')
+                      for name in params["arrays"]}
+            ivf = IVFIndex(params["nlist"], nprobe=self.ann["nprobe"], pq_m=params["pq_m"], rerank=self.ann["rerank"],
+                           trained_size=params["trained_size"], **arrays)
+        quantized = None
+        if self.quantization:
+            params = manifest.get("quantization") or {}
+            if params.get("kind") == self.quantization:
+                quantized = QuantizedEmbeddings(self.quantization, **{
+                    name: np.load(self.path / f"quantized-{name}-{generation}.npy", mmap_mode='r')
+                    for name in params["arrays"]})
+            else:
+                # saved before quantization was turned on, kept in memory until the next write
+                quantized = QuantizedEmbeddings.build(self.quantization, embeddings, self.block_size)
+        return StoreState(generation, documents, embeddings, norms, ivf, quantized)
+
+    def _build_ivf(self, embeddings, norms, reused):
+        """
+        The IVF index of the new generation, None when the store is too small for one.
+        reused[i] is the position in the current generation of new row i, -1 for new or changed rows.
+        """
+        ann = self.ann
+        if ann is None or len(embeddings) < ann["min_documents"]:
+            return None
+        previous = self._state.ivf
+        retrain = (previous is None or reused is None or previous.pq_m != ann["pq_m"]
+                   or (ann["nlist"] and previous.nlist != ann["nlist"])
+                   or len(embeddings) > previous.trained_size * ann["retrain_growth"])
+        if retrain:
+            # a few hundred vectors per list at most, like faiss recommends
+            nlist = ann["nlist"] or max(1, min(int(4 * np.sqrt(len(embeddings))), len(embeddings) // 39))
+            rng = np.random.default_rng(0)
+            sample_size = min(len(embeddings), max(ann["train_sample"], 39 * nlist))
+            sample = np.sort(rng.choice(len(embeddings), size=sample_size, replace=False))
+            ivf = IVFIndex(nlist, nprobe=ann["nprobe"], pq_m=ann["pq_m"], rerank=ann["rerank"])
+            ivf.train(normalize(embeddings[sample], norms[sample]))
+            ivf.trained_size = len(embeddings)
+            rows = np.arange(len(embeddings))
+            list_ids = np.empty(len(embeddings), dtype=np.int32)
+            codes = np.empty((len(embeddings), ivf.pq_m), dtype=np.uint8) if ivf.pq_m else None
+        else:
+            ivf = IVFIndex(previous.nlist, nprobe=ann["nprobe"], pq_m=previous.pq_m, rerank=ann["rerank"],
+                           centroids=np.asarray(previous.centroids), codebooks=previous.codebooks,
+                           trained_size=previous.trained_size)
+            reused = np.asarray(reused)
+            kept = reused >= 0
+            rows = np.flatnonzero(~kept)
+            list_ids = np.empty(len(embeddings), dtype=np.int32)
+            list_ids[kept] = previous.list_ids[reused[kept]]
+            codes = None
+            if ivf.pq_m:
+                codes = np.empty((len(embeddings), ivf.pq_m), dtype=np.uint8)
+                codes[kept] = previous.codes[reused[kept]]
+        for start in range(0, len(rows), self.block_size):
+            block = rows[start:start + self.block_size]
+            block_list_ids, block_codes = ivf.encode(normalize(embeddings[block], norms[block]))
+            list_ids[block] = block_list_ids
+            if codes is not None:
+                codes[block] = block_codes
+        ivf.set_rows(list_ids, codes)
+        return ivf
+
+    def _save(self, documents, embeddings, reused=None):
+        """Writes a new generation, points store.json to it and deletes the ones before the previous one"""
+        self.path.mkdir(parents=True, exist_ok=True)
+        previous = self._state.generation
+        generation = previous + 1
+        embeddings = np.ascontiguousarray(embeddings, dtype=self.dtype)
+        norms = np.linalg.norm(embeddings.astype(np.float32), axis=1) if len(embeddings) else np.zeros(0, dtype=np.float32)
+        np.save(self.path / f"embeddings-{generation}.npy", embeddings)
+        np.save(self.path / f"norms-{generation}.npy", norms.astype(np.float32))
+        with open(self.path / f"documents-{generation}.json", 'w', encoding='utf-8') as f:
+            json.dump([{"id": document.id, "content": document.content, "meta": document.meta}
+                       for document in documents], f, ensure_ascii=False)
+        manifest = {"generation": generation, "count": len(documents), "dtype": self.dtype.name,
+                    "dimension": int(embeddings.shape[1]) if embeddings.ndim == 2 else 0}
+        ivf = self._build_ivf(embeddings, norms, reused)
+        if ivf is not None:
+            for name, array in ivf.arrays.items():
+                np.save(self.path / f"ivf-{name}-{generation}.npy", array)
+            manifest["ivf"] = {**ivf.params(), "arrays": list(ivf.arrays)}
+        if self.quantization:
+            quantized = QuantizedEmbeddings.build(self.quantization, embeddings, self.block_size)
+            for name, array in quantized.arrays.items():
+                np.save(self.path / f"quantized-{name}-{generation}.npy", array)
+            manifest["quantization"] = {"kind": quantized.kind, "arrays": list(quantized.arrays)}
+        manifest_path = self.path / STORE_MANIFEST_NAME
+        with open(manifest_path.with_suffix('.tmp'), 'w') as f:
+            json.dump(manifest, f)
+        os.replace(manifest_path.with_suffix('.tmp'), manifest_path)
+        # processes still mapping the old files keep them until they reload, unlinking is safe
+        for old_path in self.path.glob("*-*.*"):
+            old_generation = old_path.name.rsplit('-', 1)[1].split('.', 1)[0]
+            if old_generation.isdigit() and int(old_generation) < previous:
+                try:
+                    os.remove(old_path)
+                except OSError:
+                    pass
+        self._state = self._load()
+
+    @contextmanager
+    def batch(self):
+        """
+        Saves the writes and deletes made inside the block as one generation when it ends (nothing if it raises).
+        Searches meanwhile answer from the last saved generation.
+        """
+        with self._lock:
+            if self._pending is not None:
+                raise RuntimeError("A batch is already open on this store")
+            self._pending = ({}, set())
+        try:
+            yield self
+        except BaseException:
+            with self._lock:
+                self._pending = None
+            raise
+        with self._lock:
+            written, deleted = self._pending
+            self._pending = None
+            self._apply(written, deleted)
+
+    def reload(self):
+        """Picks up the writes of other processes"""
+        self._state = self._load()
+
+    def nbytes(self):
+        state = self._state
+        return (state.embeddings.nbytes + state.norms.nbytes + (state.ivf.nbytes() if state.ivf is not None else 0)
+                + (state.quantized.nbytes() if state.quantized is not None else 0))
+
+    def count_documents(self) -> int:
+        return len(self._state.documents)
+
+    def _select(self, state, filters):
+        """(mask, rows) of the documents matching the filters, (None, None) without filters"""
+        if not filters:
+            return None, None
+        if state.filter_index is None:
+            # two threads may both build it, they build the same thing
+            state.filter_index = MetadataIndex(state.documents, self.indexed_fields)
+        return state.filter_index.select(filters)
+
+    def filter_documents(self, filters: Optional[Dict[str, Any]] = None) -> List[Document]:
+        state = self._state
+        _, rows = self._select(state, filters)
+        positions = range(len(state.documents)) if rows is None else rows.tolist()
+        return [Document(id=state.documents[position].id, content=state.documents[position].content,
+                         meta=state.documents[position].meta,
+                         embedding=state.embeddings[position].astype(np.float32).tolist())
+                for position in positions]
+
+    def _apply(self, written, deleted):
+        """Saves the current generation without the deleted ids and with the written documents (by id)"""
+        state = self._state
+        deleted = {state.positions[id] for id in deleted if id in state.positions and id not in written}
+        if not written and not deleted:
+            return
+        # rows kept as they are, the others are encoded again by the IVF index
+        keep = [position for position in range(len(state.documents)) if position not in deleted]
+        new_documents = [state.documents[position] for position in keep]
+        reused = list(keep)
+        positions = {document.id: position for position, document in enumerate(new_documents)}
+        for document in written.values():
+            stored = Document(id=document.id, content=document.content, meta=document.meta)
+            if document.id in positions:
+                new_documents[positions[document.id]] = stored
+                reused[positions[document.id]] = -1
+            else:
+                positions[document.id] = len(new_documents)
+                new_documents.append(stored)
+                reused.append(-1)
+
+        dimension = len(next(iter(written.values())).embedding) if written else state.embeddings.shape[1]
+        embeddings = np.zeros((len(new_documents), dimension), dtype=self.dtype)
+        if keep:
+            kept = state.embeddings if len(keep) == len(state.documents) else state.embeddings[keep]
+            embeddings[:len(keep)] = kept
+        for document in written.values():
+            embeddings[positions[document.id]] = document.embedding
+        self._save(new_documents, embeddings, reused)
+
+    def write_documents(self, documents: List[Document], policy: DuplicatePolicy = DuplicatePolicy.NONE) -> int:
+        for document in documents:
+            if document.embedding is None:
+                raise ValueError(f"Document {document.id} has no embedding, the store only holds embedded documents")
+        with self._lock:
+            pending_written, pending_deleted = self._pending or ({}, set())
+            written = {}
+            for document in documents:
+                exists = ((document.id in self._state.positions and document.id not in pending_deleted)
+                          or document.id in pending_written or document.id in written)
+                if exists:
+                    if policy == DuplicatePolicy.SKIP:
+                        continue
+                    if policy != DuplicatePolicy.OVERWRITE:
+                        raise DuplicateDocumentError(f"ID '{document.id}' already exists in the document store.")
+                written[document.id] = document
+            if self._pending is not None:
+                pending_written.update(written)
+                pending_deleted.difference_update(written)
+            elif written:
+                self._apply(written, ())
+        return len(written)
+
+    def delete_documents(self, document_ids: List[str]) -> None:
+        with self._lock:
+            if self._pending is not None:
+                pending_written, pending_deleted = self._pending
+                for id in document_ids:
+                    pending_written.pop(id, None)
+                    pending_deleted.add(id)
+            else:
+                self._apply({}, set(document_ids))
+
+    def _scores(self, state, query_embeddings, rows=None):
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        if rows is not None:
+            # only the selected rows, gathered in one copy
+            scores = queries @ state.embeddings[rows].astype(np.float32, copy=False).T
+            scores /= np.maximum(np.outer(np.linalg.norm(queries, axis=1), state.norms[rows]), 1e-12)
+            return scores
+        scores = np.empty((len(queries), len(state.documents)), dtype=np.float32)
+        if state.embeddings.dtype == np.float32:
+            # straight BLAS on the memory-mapped matrix
+            np.dot(queries, state.embeddings.T, out=scores)
+        else:
+            for start in range(0, len(state.documents), self.block_size):
+                block = state.embeddings[start:start + self.block_size].astype(np.float32)
+                scores[:, start:start + len(block)] = queries @ block.T
+        query_norms = np.linalg.norm(queries, axis=1)
+        scores /= np.maximum(np.outer(query_norms, state.norms), 1e-12)
+        return scores
+
+    def search_embeddings(self, query_embeddings: List[List[float]], top_k: int,
+                          filters: Optional[Dict[str, Any]] = None) -> List[List[Document]]:
+        """Top top_k documents of every query embedding, all queries in one matrix product"""
+        state = self._state
+        if not query_embeddings:
+            return []
+        if not state.documents or top_k <= 0:
+            return [[] for _ in query_embeddings]
+        mask, selected = self._select(state, filters)
+        if selected is not None and not len(selected):
+            return [[] for _ in query_embeddings]
+        subset = selected is not None and len(selected) <= SUBSET_SEARCH_FRACTION * len(state.documents)
+        if state.ivf is not None and not (subset and len(selected) < self.ann["min_documents"]):
+            # a filter leaving fewer rows than an indexed store needs is searched exactly below
+            results = []
+            for query in query_embeddings:
+                rows, scores = state.ivf.search(query, top_k, state.embeddings, state.norms, mask=mask)
+                results.append(self._documents(state, rows.tolist(), scores.tolist()))
+            return results
+        if state.quantized is not None:
+            return [self._documents(state, rows.tolist(), scores.tolist())
+                    for rows, scores in quantized_search(state.quantized, state.embeddings, state.norms, query_embeddings,
+                                                         top_k, self.rescore_multiplier,
+                                                         mask=None if subset else mask, rows=selected if subset else None)]
+
+        if subset:
+            scores = self._scores(state, query_embeddings, selected)
+            candidates = len(selected)
+        else:
+            scores = self._scores(state, query_embeddings)
+            candidates = len(state.documents)
+            if mask is not None:
+                scores[:, ~mask] = -np.inf
+                candidates = len(selected)
+        k = min(top_k, candidates)
+        if k < scores.shape[1]:
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            top = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind='stable')
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        if subset:
+            top = selected[top]
+        return [self._documents(state, positions, query_scores)
+                for positions, query_scores in zip(top.tolist(), top_scores.tolist())]
+
+    @staticmethod
+    def _documents(state, positions, scores):
+        return [Document(id=state.documents[position].id, content=state.documents[position].content,
+                         meta=state.documents[position].meta, score=float(score))
+                for position, score in zip(positions, scores)]
+
+
+@component
+class NumpyEmbeddingRetriever:
+    """Retrieves the documents of a NumpyDocumentStore most similar to the query embedding"""
+    def __init__(self, document_store: NumpyDocumentStore, filters: Optional[Dict[str, Any]] = None, top_k: int = 10):
+        self.document_store = document_store
+        self.filters = filters
+        self.top_k = top_k
+
+    @component.output_types(documents=List[Document])
+    def run(self, query_embedding: List[float], filters: Optional[Dict[str, Any]] = None, top_k: Optional[int] = None):
+        documents = self.document_store.search_embeddings([query_embedding], top_k or self.top_k,
+                                                          filters or self.filters)[0]
+        return {'documents': documents}
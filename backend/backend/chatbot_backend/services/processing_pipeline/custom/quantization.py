@@ -0,0 +1,116 @@
+import numpy as np
+
+QUANTIZATIONS = ('int8', 'binary')
+# candidates rescored per result when no rescore_multiplier is given: binary codes rank far more roughly
+# (recall@5 0.36 at 4, 0.91 at 80 and 0.99 at 160 on 100k synthetic 1024-d embeddings, see bench_quantization)
+DEFAULT_RESCORE_MULTIPLIERS = {'int8': 4, 'binary': 100}
+
+
+class QuantizedEmbeddings:
+    """
+    Compact copy of an embedding matrix scanned instead of the float one, the float embeddings are only
+    read back for the few candidates it returns (see quantized_search).
+    - int8: every dimension scaled to [-127, 127] by its largest absolute value, 4x smaller than float32.
+      It saves memory only: numpy has no fast int8 dot product, the codes are scored as float32 blocks,
+      which is no faster (a little slower) than a float32 search through BLAS
+    - binary: the sign of every dimension, 8 per byte, 32x smaller, scored by hamming distance, several
+      times faster than a float32 search but needs many more candidates rescored (DEFAULT_RESCORE_MULTIPLIERS)
+    """
+    def __init__(self, kind, codes, scales=None):
+        if kind not in QUANTIZATIONS:
+            raise ValueError(f"Unknown quantization {kind!r}, use one of {QUANTIZATIONS}")
+        self.kind = kind
+        self.codes = codes
+        self.scales = scales
+
+    @classmethod
+    def build(cls, kind, embeddings, block_size=65536):
+        if kind == 'binary':
+            codes = np.empty((len(embeddings), -(-embeddings.shape[1] // 8)), dtype=np.uint8)
+            for start in range(0, len(embeddings), block_size):
+                codes[start:start + block_size] = np.packbits(np.asarray(embeddings[start:start + block_size]) > 0, axis=1)
+            return cls(kind, codes)
+        scales = np.abs(np.asarray(embeddings, dtype=np.float32)).max(axis=0) / 127 if len(embeddings) else np.ones(0)
+        scales = np.maximum(scales, 1e-12).astype(np.float32)
+        codes = np.empty(embeddings.shape, dtype=np.int8)
+        for start in range(0, len(embeddings), block_size):
+            block = np.asarray(embeddings[start:start + block_size], dtype=np.float32)
+            codes[start:start + block_size] = np.clip(np.rint(block / scales), -127, 127)
+        return cls(kind, codes, scales)
+
+    def take(self, rows):
+        """The codes of these rows only"""
+        return QuantizedEmbeddings(self.kind, self.codes[rows], self.scales)
+
+    @property
+    def arrays(self):
+        """Everything saved with the store, by name"""
+        if self.kind == 'binary':
+            return {'codes': self.codes}
+        return {'codes': self.codes, 'scales': self.scales}
+
+    def nbytes(self):
+        return sum(array.nbytes for array in self.arrays.values())
+
+    def scores(self, queries, block_size=2048):
+        """
+        Approximate similarity of every query to every row, higher is better (not normalized).
+        int8 codes are converted to float32 for BLAS, an int32 accumulated dot product of int8 codes runs
+        without BLAS in numpy and was 1.5-3x slower.
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        scores = np.empty((len(queries), len(self.codes)), dtype=np.float32)
+        if self.kind == 'binary':
+            query_bits = np.packbits(queries > 0, axis=1)
+            for i, bits in enumerate(query_bits):
+                for start in range(0, len(self.codes), block_size):
+                    block = self.codes[start:start + block_size]
+                    scores[i, start:start + len(block)] = -np.bitwise_count(block ^ bits).sum(axis=1, dtype=np.int32)
+            return scores
+        # q.x ~ (q * scales).codes, the codes converted to float32 in small blocks that stay in cache
+        scaled_queries = queries * self.scales
+        buffer = np.empty((min(block_size, len(self.codes)), self.codes.shape[1]), dtype=np.float32)
+        for start in range(0, len(self.codes), block_size):
+            block = buffer[:len(self.codes[start:start + block_size])]
+            block[...] = self.codes[start:start + block_size]
+            scores[:, start:start + len(block)] = scaled_queries @ block.T
+        return scores
+
+
+def quantized_search(quantized, embeddings, norms, queries, top_k, rescore_multiplier=None, mask=None, rows=None):
+    """
+    Top top_k rows of every query: the quantized matrix picks top_k * rescore_multiplier candidates
+    (DEFAULT_RESCORE_MULTIPLIERS of its kind when None), which are rescored with their float embeddings (exact cosine).
+    mask excludes rows from the scan, rows (positions) limits the scan to these rows.
+    Returns a list of (row positions, scores) per query, best first.
+    """
+    queries = np.asarray(queries, dtype=np.float32)
+    rescore_multiplier = rescore_multiplier or DEFAULT_RESCORE_MULTIPLIERS[quantized.kind]
+    scanned = quantized.take(rows) if rows is not None else quantized
+    scanned_norms = norms[rows] if rows is not None else norms
+    approximate = scanned.scores(queries)
+    if quantized.kind == 'int8':
+        approximate /= np.maximum(scanned_norms, 1e-12)
+    candidates = len(scanned_norms)
+    if mask is not None:
+        approximate[:, ~mask] = -np.inf
+        candidates = int(mask.sum())
+    keep = min(top_k * rescore_multiplier, candidates)
+    k = min(top_k, candidates)
+    if k == 0:
+        return [(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)) for _ in queries]
+    if keep < len(scanned_norms):
+        positions = np.argpartition(-approximate, keep - 1, axis=1)[:, :keep]
+    else:
+        positions = np.broadcast_to(np.arange(len(scanned_norms)), approximate.shape)
+    rows = rows[positions] if rows is not None else positions
+
+    results = []
+    query_norms = np.maximum(np.linalg.norm(queries, axis=1), 1e-12)
+    for query, query_norm, query_rows in zip(queries, query_norms, rows):
+        query_rows = np.sort(query_rows)  # sequential reads of the memory-mapped matrix
+        scores = (np.asarray(embeddings[query_rows], dtype=np.float32) @ query) / (np.maximum(norms[query_rows], 1e-12) * query_norm)
+        top = np.argpartition(-scores, k - 1)[:k] if k < len(query_rows) else np.arange(len(query_rows))
+        top = top[np.argsort(-scores[top], kind='stable')]
+        results.append((query_rows[top], scores[top]))
+    return results
@@ -0,0 +1,80 @@
+import dataclasses
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from haystack import component, Document
+from haystack.lazy_imports import LazyImport
+
+with LazyImport(message="Run 'pip install \"sentence-transformers[onnx]\"' to rerank documents") as sentence_transformers_import:
+    from sentence_transformers import CrossEncoder
+
+
+class CrossEncoderModel:
+    """Cross-encoder loaded in process on CPU once and shared by every pipeline"""
+    def __init__(self, model, backend='torch', file_name=None, max_length=512):
+        self.model = model
+        self.backend = backend
+        self.file_name = file_name
+        self.max_length = max_length
+        self._lock = threading.Lock()
+        self._model = None
+
+    def warm_up(self):
+        with self._lock:
+            if self._model is None:
+                sentence_transformers_import.check()
+                model_kwargs = {'file_name': self.file_name} if self.file_name else {}
+                self._model = CrossEncoder(self.model, device='cpu', backend=self.backend,
+                                           max_length=self.max_length, model_kwargs=model_kwargs)
+
+    def score(self, query, texts, batch_size=16):
+        self.warm_up()
+        scores = self._model.predict([(query, text) for text in texts], batch_size=batch_size,
+                                     show_progress_bar=False, convert_to_numpy=True)
+        return [float(score) for score in scores]
+
+
+@component
+class CrossEncoderRanker:
+    """
+    Rescores the retrieved candidates with a cross-encoder and keeps the best top_k.
+    Candidates are scored batch by batch in retrieval order, once top_k of them reach early_exit_score
+    the rest are not scored. Documents under score_threshold are dropped.
+    meta reports how many candidates were scored and the time it took.
+    """
+    def __init__(self, model: CrossEncoderModel, top_k: int = 3, batch_size: int = 16,
+                 score_threshold: Optional[float] = None, early_exit_score: Optional[float] = None):
+        self.model = model
+        self.top_k = top_k
+        self.batch_size = batch_size
+        self.score_threshold = score_threshold
+        self.early_exit_score = early_exit_score
+
+    def warm_up(self):
+        self.model.warm_up()
+
+    @component.output_types(documents=List[Document], meta=Dict[str, Any])
+    def run(self, query: str, documents: List[Document], top_k: Optional[int] = None):
+        top_k = top_k or self.top_k
+        start = time.perf_counter()
+
+        scored = []
+        for batch_start in range(0, len(documents), self.batch_size):
+            batch = documents[batch_start:batch_start + self.batch_size]
+            scores = self.model.score(query, [document.content or '' for document in batch], batch_size=self.batch_size)
+            scored.extend(dataclasses.replace(document, score=score) for document, score in zip(batch, scores))
+            if self.early_exit_score is not None and \
+                    sum(document.score >= self.early_exit_score for document in scored) >= top_k:
+                break
+
+        scored_count = len(scored)
+        if self.score_threshold is not None:
+            scored = [document for document in scored if document.score >= self.score_threshold]
+        ranked = sorted(scored, key=lambda document: document.score, reverse=True)[:top_k]
+        meta = {
+            'candidates': len(documents),
+            'scored': scored_count,
+            'latency_ms': round((time.perf_counter() - start) * 1000, 1),
+        }
+        return {'documents': ranked, 'meta': meta}
@@ -1,2 +1,375 @@
+import hashlib
+import json
+import os
+import re
+from contextlib import nullcontext
+from pathlib import Path
+from typing import List
+
+from filelock import FileLock
+from haystack import Pipeline, Document, component
+from haystack.components.embedders import HuggingFaceAPIDocumentEmbedder
+from haystack.components.preprocessors import DocumentCleaner, DocumentSplitter
+from haystack.document_stores.types import DuplicatePolicy
+from haystack.utils import Secret
+
+from .config import *
+from .registry import registry
+from .response_pipeline import refresh_retrieval, get_embedding_model_id
+from .custom.batching import embed_texts
+from .custom.bulk_embedding import BulkDocumentEmbedder, EmbeddingCheckpoint
+from .custom.converters import (FileTypeDetector, PdfToSingleDocumentConverter, WordToDocumentConverter,
+                                TextFileToDocumentConverter, DocumentMerger, SUPPORTED_EXTENSIONS,
+                                PDF_EXTENSIONS, WORD_EXTENSIONS, TEXT_EXTENSIONS)
+
+# which file every indexed chunk comes from, kept next to the store it describes
+INDEX_MANIFEST_NAME = ".index_manifest.json"
+INDEX_MANIFEST_VERSION = 1
+# embeddings of the chunks not written yet, an interrupted update resumes from them
+EMBEDDING_CHECKPOINT_NAME = ".embedding_checkpoint"
+WRITE_BATCH_SIZE = 1000
+# bumped when chunk_tags changes, the chunks already indexed are tagged again on the next update
+TAGS_VERSION = 1
+FILE_TYPES = {**{extension: "pdf" for extension in PDF_EXTENSIONS},
+              **{extension: "word" for extension in WORD_EXTENSIONS},
+              **{extension: "text" for extension in TEXT_EXTENSIONS}}
+# files directly under documents_path
+DEFAULT_COLLECTION = "default"
+ARABIC_LETTER = re.compile('[\u0621-\u064a\u0671-\u06d3\u06fa-\u06ff]')
+LATIN_LETTER = re.compile('[A-Za-z]')
+
+
+def chunk_id(source, content):
+    # the same text in two files gives two chunks, so deleting one file's chunks never touches the other
+    return hashlib.sha256(f"{source}\0{content}".encode()).hexdigest()
+
+
+def detect_language(text):
+    """'ara' or 'eng' (the OCR language codes) by the script most letters are in, None without letters"""
+    arabic = len(ARABIC_LETTER.findall(text))
+    latin = len(LATIN_LETTER.findall(text))
+    if not arabic and not latin:
+        return None
+    return "ara" if arabic >= latin else "eng"
+
+
+def chunk_tags(source, content, meta=None):
+    """
+    Metadata a retrieval scope can filter on (see scope_fields in config.py): the source file, its type,
+    its collection (the first directory of source, e.g. 'uploads') and the language of the chunk.
+    """
+    directory, _, _ = source.rpartition('/')
+    tags = {
+        "source": source,
+        "file_type": FILE_TYPES.get(os.path.splitext(source)[1].lower(), "other"),
+        "collection": directory.split('/')[0] if directory else DEFAULT_COLLECTION,
+    }
+    language = detect_language(content) or (meta or {}).get("language")
+    if language:
+        tags["language"] = language
+    return tags
+
+
+@component
+class ChunkHasher:
+    """
+    Gives every chunk an id derived from its source file and content, and only passes on the chunks
+    that are not indexed yet, so the unchanged chunks of an edited file are not embedded again.
+    The chunks passed on are tagged with chunk_tags.
+    """
+    @component.output_types(documents=List[Document], chunk_ids=List[str])
+    def run(self, documents: List[Document], source: str, indexed_ids: List[str]):
+        indexed_ids = set(indexed_ids)
+        new_documents = []
+        chunk_ids = []
+        seen = set()
+        for document in documents:
+            id = chunk_id(source, document.content)
+            if id in seen:
+                continue
+            seen.add(id)
+            chunk_ids.append(id)
+            if id not in indexed_ids:
+                new_documents.append(Document(id=id, content=document.content,
+                                              meta={**document.meta, **chunk_tags(source, document.content, document.meta)}))
+        return {"documents": new_documents, "chunk_ids": chunk_ids}
+
+
+def build_document_embedder(checkpoint=None):
+    indexing_config = PROCESSING_CONFIG["indexing_config"]
+    if get_response_config()["embedding_backend"] == "local":
+        embed_batch = registry.get('local_embedding_model').embed
+    else:
+        document_embedder = HuggingFaceAPIDocumentEmbedder(api_type="text_embeddings_inference",
+                                                           api_params={"url": get_response_config()["embedding_api"]},
+                                                           token=Secret.from_token(get_hf_token()),
+                                                           batch_size=indexing_config["embedding_batch_size"],
+                                                           progress_bar=False)
+        embed_batch = lambda texts: embed_texts(document_embedder, texts)
+    return BulkDocumentEmbedder(embed_batch, checkpoint=checkpoint,
+                                max_batch_size=indexing_config["embedding_batch_size"],
+                                max_batch_chars=indexing_config["embedding_batch_chars"],
+                                workers=indexing_config["embedding_workers"])
+
+
 def build_indexing_pipeline():
-    pass
\ No newline at end of file
+    """
+    Converts one source file to chunks and returns the ones that are not indexed yet (see ChunkHasher),
+    the pipeline of rag_chat_processing_documents.ipynb with a hashing step. Chunks of many files are then
+    embedded together by IncrementalIndexer.
+    """
+    indexing_config = PROCESSING_CONFIG["indexing_config"]
+    pipeline = Pipeline()
+    pipeline.add_component('file_type_detector', FileTypeDetector())
+    pipeline.add_component('pdf_converter', PdfToSingleDocumentConverter(
+        workers=indexing_config["ocr_workers"],
+        cache_path=indexing_config["ocr_cache_path"]
+    ))
+    pipeline.add_component('word_converter', WordToDocumentConverter())
+    pipeline.add_component('text_converter', TextFileToDocumentConverter())
+    pipeline.add_component('document_merger', DocumentMerger())
+    pipeline.add_component('cleaner', DocumentCleaner(
+        remove_empty_lines=True,
+        remove_extra_whitespaces=True,
+        remove_repeated_substrings=False
+    ))
+    pipeline.add_component('splitter', DocumentSplitter(
+        split_by=indexing_config["split_by"],
+        split_length=indexing_config["split_length"],
+        split_overlap=indexing_config["split_overlap"]
+    ))
+    pipeline.add_component('chunk_hasher', ChunkHasher())
+
+    pipeline.connect('file_type_detector.pdf_paths', 'pdf_converter.pdf_paths')
+    pipeline.connect('file_type_detector.word_paths', 'word_converter.word_paths')
+    pipeline.connect('file_type_detector.text_paths', 'text_converter.text_paths')
+    pipeline.connect('pdf_converter.documents', 'document_merger.pdf_documents')
+    pipeline.connect('word_converter.documents', 'document_merger.word_documents')
+    pipeline.connect('text_converter.documents', 'document_merger.text_documents')
+    pipeline.connect('document_merger.documents', 'cleaner.documents')
+    pipeline.connect('cleaner.documents', 'splitter.documents')
+    pipeline.connect('splitter.documents', 'chunk_hasher.documents')
+    return pipeline
+
+
+def read_index_manifest(vdb_path):
+    try:
+        with open(Path(vdb_path) / INDEX_MANIFEST_NAME) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = None
+    if manifest is None or manifest.get("version") != INDEX_MANIFEST_VERSION:
+        return {"version": INDEX_MANIFEST_VERSION, "files": {}}
+    return manifest
+
+
+def write_index_manifest(vdb_path, manifest):
+    # written to a temporary file first so a crash never leaves half a manifest
+    path = Path(vdb_path) / INDEX_MANIFEST_NAME
+    with open(path.with_suffix('.tmp'), 'w') as f:
+        json.dump(manifest, f)
+    os.replace(path.with_suffix('.tmp'), path)
+
+
+def store_batch(document_store):
+    """Groups the writes made inside it into one save when the store supports it (NumpyDocumentStore.batch)"""
+    return document_store.batch() if hasattr(document_store, 'batch') else nullcontext()
+
+
+class IncrementalIndexer:
+    """
+    Keeps document_store in sync with the files under documents_path.
+    The manifest records the sha256 of every indexed file and the ids of its chunks:
+    unchanged files are skipped without being converted, changed files are converted again but only
+    their new chunks are embedded and written, chunks that disappeared are deleted, and so are the
+    chunks of removed files.
+    New chunks of up to max_pending_chunks are embedded together (see BulkDocumentEmbedder), their
+    embeddings are checkpointed next to the store until they are written, so an interrupted update
+    doesn't embed them again. The chunks of those files are written to the store in one batch, and the
+    manifest only records the files once the batch is saved.
+    """
+    def __init__(self, document_store, documents_path, vdb_path, pipeline=None, embedder=None):
+        self.document_store = document_store
+        self.documents_path = Path(documents_path)
+        self.vdb_path = Path(vdb_path)
+        self.pipeline = pipeline or build_indexing_pipeline()
+        self.checkpoint = EmbeddingCheckpoint(self.vdb_path / EMBEDDING_CHECKPOINT_NAME, model_id=get_embedding_model_id())
+        self.embedder = embedder or build_document_embedder(self.checkpoint)
+        self.max_pending_chunks = PROCESSING_CONFIG["indexing_config"]["max_pending_chunks"]
+
+    def scan(self):
+        """Returns {path relative to documents_path: absolute path} of the supported files"""
+        files = {}
+        for root, dirs, names in os.walk(self.documents_path):
+            for name in names:
+                if name.lower().endswith(SUPPORTED_EXTENSIONS):
+                    path = Path(root) / name
+                    files[path.relative_to(self.documents_path).as_posix()] = path
+        return files
+
+    def chunk_file(self, source, path, indexed_ids):
+        """Returns the chunk ids of a file and its chunks that are not indexed yet"""
+        indexing_config = PROCESSING_CONFIG["indexing_config"]
+        results = self.pipeline.run({
+            'file_type_detector': {'file_paths': [str(path)]},
+            'pdf_converter': {'dpi': indexing_config["ocr_dpi"], 'language': indexing_config["ocr_language"]},
+            'chunk_hasher': {'source': source, 'indexed_ids': indexed_ids},
+        })
+        return results['chunk_hasher']['chunk_ids'], results['chunk_hasher']['documents']
+
+    def flush(self, pending, manifest, stats):
+        """Embeds the new chunks of the pending files together, then writes them in one batch"""
+        if not pending:
+            return
+        documents = [document for *_, file_documents in pending for document in file_documents]
+        embedded = {}
+        if documents:
+            results = self.embedder.run(documents=documents)
+            embedded = {document.id: document for document in results['documents']}
+            meta = results.get('meta', {})
+            stats["resumed_chunks"] += meta.get('resumed', 0)
+            stats["embedding_seconds"] += meta.get('seconds', 0.0)
+            if meta.get('chunks_per_second'):
+                print(f"embedded {meta['embedded']} chunks in {meta['seconds']:.1f}s, "
+                      f"{meta['chunks_per_second']} chunks/s, {meta['resumed']} resumed from the checkpoint")
+
+        with store_batch(self.document_store):
+            for source, source_hash, indexed_ids, chunk_ids, file_documents in pending:
+                file_documents = [embedded[document.id] for document in file_documents]
+                for start in range(0, len(file_documents), WRITE_BATCH_SIZE):
+                    # chunk ids are content hashes, an existing id always holds the same chunk
+                    self.document_store.write_documents(file_documents[start:start + WRITE_BATCH_SIZE],
+                                                        policy=DuplicatePolicy.OVERWRITE)
+                stale_ids = sorted(set(indexed_ids) - set(chunk_ids))
+                if stale_ids:
+                    self.document_store.delete_documents(stale_ids)
+        for source, source_hash, indexed_ids, chunk_ids, file_documents in pending:
+            stale_ids = sorted(set(indexed_ids) - set(chunk_ids))
+            manifest["files"][source] = {"hash": source_hash, "chunk_ids": chunk_ids}
+            stats["indexed_files"] += 1
+            stats["embedded_chunks"] += len(file_documents)
+            stats["deleted_chunks"] += len(stale_ids)
+            print(f"indexed {source}: {len(chunk_ids)} chunks, {len(file_documents)} new, {len(stale_ids)} deleted")
+        # saved after every batch, an interrupted run resumes where it stopped
+        write_index_manifest(self.vdb_path, manifest)
+
+    def retag(self):
+        """Tags the chunks indexed before the current chunk_tags with them, keeping their embeddings"""
+        changed = []
+        for document in self.document_store.filter_documents():
+            # chunks of the notebook's store only have the path it was built from
+            source = document.meta.get("source") or os.path.basename(document.meta.get("file_path") or "")
+            if not source:
+                continue
+            meta = {**document.meta, **chunk_tags(source, document.content or "", document.meta)}
+            if meta != document.meta:
+                changed.append(Document(id=document.id, content=document.content, meta=meta, embedding=document.embedding))
+        for start in range(0, len(changed), WRITE_BATCH_SIZE):
+            batch = changed[start:start + WRITE_BATCH_SIZE]
+            # Chroma keeps the existing document when an id is written again
+            self.document_store.delete_documents([document.id for document in batch])
+            self.document_store.write_documents(batch, policy=DuplicatePolicy.OVERWRITE)
+        return len(changed)
+
+    def close(self):
+        """Stops the OCR processes the pdf converter started for this update"""
+        try:
+            converter = self.pipeline.get_component('pdf_converter')
+        except ValueError:
+            return
+        if hasattr(converter, 'close'):
+            converter.close()
+
+    def update(self, prune=False, sources=None):
+        """
+        Brings the store up to date, returns counts of what was done.
+        sources limits the update to these files (paths relative to documents_path), e.g. a new upload.
+        The PDFs of every file share one pool of OCR processes, stopped when the update ends.
+        """
+        try:
+            return self._update(prune, sources)
+        finally:
+            self.close()
+
+    def _update(self, prune, sources):
+        stats = {"unchanged_files": 0, "indexed_files": 0, "removed_files": 0, "embedded_chunks": 0,
+                 "resumed_chunks": 0, "deleted_chunks": 0, "retagged_chunks": 0, "embedding_seconds": 0.0}
+        with FileLock(str(self.vdb_path) + ".index.lock"):
+            manifest = read_index_manifest(self.vdb_path)
+            if manifest.get("tags") != TAGS_VERSION:
+                stats["retagged_chunks"] = self.retag()
+                manifest["tags"] = TAGS_VERSION
+                if self.vdb_path.exists():
+                    write_index_manifest(self.vdb_path, manifest)
+                if stats["retagged_chunks"]:
+                    print(f"tagged {stats['retagged_chunks']} indexed chunks")
+            files = self.scan()
+            known_sources = set(manifest["files"])
+            if sources is not None:
+                sources = set(sources)
+                files = {source: path for source, path in files.items() if source in sources}
+                known_sources &= sources
+
+            pending = []
+            pending_chunks = 0
+            for source, path in sorted(files.items()):
+                source_hash = file_checksum(path)
+                entry = manifest["files"].get(source)
+                if entry is not None and entry["hash"] == source_hash:
+                    stats["unchanged_files"] += 1
+                    continue
+                indexed_ids = entry["chunk_ids"] if entry is not None else []
+                chunk_ids, documents = self.chunk_file(source, path, indexed_ids)
+                pending.append((source, source_hash, indexed_ids, chunk_ids, documents))
+                pending_chunks += len(documents)
+                if pending_chunks >= self.max_pending_chunks:
+                    self.flush(pending, manifest, stats)
+                    pending, pending_chunks = [], 0
+            self.flush(pending, manifest, stats)
+
+            removed = sorted(known_sources - set(files))
+            with store_batch(self.document_store):
+                for source in removed:
+                    chunk_ids = manifest["files"][source]["chunk_ids"]
+                    if chunk_ids:
+                        self.document_store.delete_documents(chunk_ids)
+            for source in removed:
+                chunk_ids = manifest["files"].pop(source)["chunk_ids"]
+                stats["removed_files"] += 1
+                stats["deleted_chunks"] += len(chunk_ids)
+                print(f"removed {source}: {len(chunk_ids)} chunks deleted")
+            if removed:
+                write_index_manifest(self.vdb_path, manifest)
+
+            if prune and sources is None:
+                # chunks no file accounts for, e.g. the ones of a store built by the notebook
+                known_ids = {id for entry in manifest["files"].values() for id in entry["chunk_ids"]}
+                unknown_ids = [document.id for document in self.document_store.filter_documents()
+                               if document.id not in known_ids]
+                if unknown_ids:
+                    self.document_store.delete_documents(unknown_ids)
+                stats["deleted_chunks"] += len(unknown_ids)
+                print(f"pruned {len(unknown_ids)} chunks without a source file")
+
+            # every checkpointed embedding is in the store now
+            self.checkpoint.clear()
+        embedded = stats["embedded_chunks"] - stats["resumed_chunks"]
+        stats["chunks_per_second"] = round(embedded / stats["embedding_seconds"], 1) if embedded and stats["embedding_seconds"] else None
+        stats["embedding_seconds"] = round(stats["embedding_seconds"], 3)
+        return stats
+
+
+def update_index(prune=False, sources=None, documents_path=None):
+    """
+    Indexes new and changed files of documents_path (indexing_config's by default) into the document store
+    the running process answers from, and rebuilds what holds a copy of the documents (BM25 index, pipelines),
+    no restart needed. Other processes reload the store on their next request (see sync_document_store).
+    Run inside knowledge_bases.use() to update the store of another knowledge base.
+    """
+    indexer = IncrementalIndexer(registry.get('document_store'),
+                                 documents_path or PROCESSING_CONFIG["indexing_config"]["documents_path"],
+                                 get_document_store_path())
+    stats = indexer.update(prune=prune, sources=sources)
+    if stats["indexed_files"] or stats["removed_files"] or stats["deleted_chunks"] or stats["retagged_chunks"]:
+        refresh_retrieval()
+    return stats
@@ -0,0 +1,188 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from .config import PROCESSING_CONFIG, active_response_config, merge_config
+from .registry import active_registry, registry
+from .custom.batching import MicroBatcher
+
+# built once for every knowledge base, entries are keyed by embedding model so they never mix
+SHARED_OBJECTS = ('embedding_cache',)
+
+
+def directory_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                continue
+    return total
+
+
+def close_chroma_store(persist_path):
+    # chroma keeps one client system per directory for the life of the process, stopping it frees the index
+    from chromadb.api.shared_system_client import SharedSystemClient
+    system = SharedSystemClient._identifier_to_system.pop(str(persist_path), None)
+    if system is not None:
+        system.stop()
+
+
+class KnowledgeBase:
+    """A named set of documents with the response_config (store, models, prompts) its pipelines are built from"""
+    def __init__(self, name, response_config, registry, documents_path=None, description=''):
+        self.name = name
+        self.response_config = response_config
+        self.registry = registry
+        self.documents_path = documents_path or PROCESSING_CONFIG["indexing_config"]["documents_path"]
+        self.description = description
+        self.last_used = None
+        # requests being served, never evicted meanwhile
+        self.active = 0
+        # (built objects, their resident_bytes), only measured again once objects are built or dropped
+        self._size = (None, 0)
+
+    def built_objects(self):
+        return {name: instance for name, instance in self.registry.instances().items() if name not in SHARED_OBJECTS}
+
+    def is_loaded(self):
+        return bool(self.built_objects())
+
+    def resident_bytes(self):
+        """
+        Rough memory held by the built objects: embeddings and indexes of the numpy store, BM25 postings,
+        cached answers, and the size of a Chroma store's files (its HNSW index is loaded whole).
+        Measured when the built objects change, not on every call (walking a Chroma directory is slow).
+        """
+        instances = self.built_objects()
+        key = frozenset((name, id(instance)) for name, instance in instances.items())
+        if self._size[0] == key:
+            return self._size[1]
+        total = 0
+        for name, instance in instances.items():
+            if hasattr(instance, 'nbytes'):
+                total += instance.nbytes()
+            elif name == 'document_store':
+                total += directory_size(self.response_config["loaded_vdb_path"])
+        self._size = (key, total)
+        return total
+
+    def unload(self):
+        """Drops the built objects, they are built again on next use"""
+        instances = self.built_objects()
+        if not instances:
+            return
+        self.registry.reset(*instances)
+        for name, instance in instances.items():
+            if isinstance(instance, MicroBatcher):
+                instance.close()
+        if 'document_store' in instances and self.response_config["document_store"] == "chroma":
+            close_chroma_store(self.response_config["loaded_vdb_path"])
+
+
+class KnowledgeBaseRegistry:
+    """
+    The knowledge bases of PROCESSING_CONFIG["knowledge_bases"], each one has its own registry so its document
+    store, models and pipelines are only built once a conversation using it sends a message.
+    When a request ends, loaded knowledge bases unused for idle_seconds are evicted, then the least recently
+    used ones while all of them hold more than max_resident_bytes. The default one is response_config
+    served by the process registry, so warmup() and the management commands keep working on it.
+    """
+    def __init__(self, configs, default_name='default', max_resident_bytes=None, idle_seconds=None,
+                 default_registry=None, clock=time.monotonic):
+        self.configs = configs
+        self.default_name = default_name
+        self.max_resident_bytes = max_resident_bytes
+        self.idle_seconds = idle_seconds
+        self.default_registry = default_registry or registry.default
+        self.clock = clock
+        self._knowledge_bases = {}
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def names(self):
+        return list(self.configs)
+
+    def get(self, name=None):
+        """The knowledge base called name (the default one for None), raises KeyError for an unknown name"""
+        name = name or self.default_name
+        with self._lock:
+            knowledge_base = self._knowledge_bases.get(name)
+            if knowledge_base is None:
+                if name not in self.configs:
+                    raise KeyError(f"Unknown knowledge base '{name}'")
+                config = self.configs[name] or {}
+                # the default one's overrides too, like get_response_config() outside of use()
+                overrides = config.get("response_config")
+                response_config = (merge_config(PROCESSING_CONFIG["response_config"], overrides) if overrides
+                                   else PROCESSING_CONFIG["response_config"])
+                if name == self.default_name:
+                    kb_registry = self.default_registry
+                else:
+                    kb_registry = self.default_registry.child(shared=SHARED_OBJECTS)
+                knowledge_base = KnowledgeBase(name, response_config, kb_registry, config.get("documents_path"),
+                                               config.get("description", ''))
+                self._knowledge_bases[name] = knowledge_base
+            return knowledge_base
+
+    @contextmanager
+    def use(self, name=None):
+        """
+        Serves a request from a knowledge base: the pipeline modules' registry and get_response_config()
+        resolve to its own inside the block (in this thread or task only), evictions run when it ends
+        """
+        knowledge_base = self.get(name)
+        with self._lock:
+            knowledge_base.active += 1
+        registry_token = active_registry.set(knowledge_base.registry)
+        config_token = active_response_config.set(knowledge_base.response_config)
+        try:
+            yield knowledge_base
+        finally:
+            active_response_config.reset(config_token)
+            active_registry.reset(registry_token)
+            with self._lock:
+                knowledge_base.active -= 1
+                knowledge_base.last_used = self.clock()
+            self.evict()
+
+    def evict(self):
+        """Unloads idle knowledge bases, then the least recently used ones while over max_resident_bytes"""
+        with self._lock:
+            loaded = [knowledge_base for knowledge_base in self._knowledge_bases.values() if knowledge_base.is_loaded()]
+        sizes = {knowledge_base.name: knowledge_base.resident_bytes() for knowledge_base in loaded}
+        total = sum(sizes.values())
+        now = self.clock()
+        loaded.sort(key=lambda knowledge_base: knowledge_base.last_used or 0)
+        for knowledge_base in loaded:
+            idle = (self.idle_seconds is not None and knowledge_base.last_used is not None
+                    and now - knowledge_base.last_used >= self.idle_seconds)
+            # the last used one is kept even when it alone is over the budget, it would be built again right away
+            over_budget = (self.max_resident_bytes is not None and total > self.max_resident_bytes
+                           and knowledge_base is not loaded[-1])
+            with self._lock:
+                if knowledge_base.active or not (idle or over_budget):
+                    continue
+                knowledge_base.unload()
+                self.evictions += 1
+            total -= sizes[knowledge_base.name]
+            print(f"evicted knowledge base {knowledge_base.name} ({sizes[knowledge_base.name] / 1e6:.1f}MB, "
+                  f"{'idle' if idle else 'over budget'})")
+
+    def stats(self):
+        with self._lock:
+            knowledge_bases = list(self._knowledge_bases.values())
+        return {
+            'loaded': {knowledge_base.name: knowledge_base.resident_bytes()
+                       for knowledge_base in knowledge_bases if knowledge_base.is_loaded()},
+            'evictions': self.evictions,
+        }
+
+
+cache_config = PROCESSING_CONFIG["knowledge_base_cache"]
+knowledge_bases = KnowledgeBaseRegistry(
+    PROCESSING_CONFIG["knowledge_bases"], PROCESSING_CONFIG["default_knowledge_base"],
+    max_resident_bytes=cache_config["max_resident_bytes"], idle_seconds=cache_config["idle_seconds"],
+)
@@ -0,0 +1,76 @@
+import contextvars
+import threading
+import time
+
+
+class LazyRegistry:
+    """
+    Process wide registry of expensive objects (document store, generators, pipelines...).
+    Each object is built by its factory the first time it is requested and then shared,
+    so importing the pipeline modules costs nothing until a chat message actually needs them.
+    """
+    def __init__(self, factories=None, parent=None, shared=()):
+        self._factories = {} if factories is None else factories
+        self._instances = {}
+        # names requested from parent instead of being built again
+        self._parent = parent
+        self._shared = set(shared)
+        # reentrant: factories request the objects they depend on
+        self._lock = threading.RLock()
+
+    def child(self, shared=()):
+        """Registry building its own objects with the same factories (for another knowledge base), shared ones come from this one"""
+        return LazyRegistry(self._factories, parent=self, shared=shared)
+
+    def register(self, name, factory):
+        with self._lock:
+            self._factories[name] = factory
+            self._instances.pop(name, None)
+
+    def get(self, name):
+        if name in self._shared:
+            return self._parent.get(name)
+        instance = self._instances.get(name)
+        if instance is not None or name in self._instances:
+            return instance
+        with self._lock:
+            if name not in self._instances:
+                start = time.perf_counter()
+                self._instances[name] = self._factories[name]()
+                print(f"built {name} in {time.perf_counter() - start:.2f}s")
+            return self._instances[name]
+
+    def is_built(self, name):
+        return name in self._instances
+
+    def instances(self):
+        """Objects built so far, by name"""
+        with self._lock:
+            return dict(self._instances)
+
+    def warmup(self, *names):
+        """Builds the given objects (all registered ones by default) ahead of the first request"""
+        for name in names or list(self._factories):
+            self.get(name)
+
+    def reset(self, *names):
+        """Drops built objects (all by default), they are rebuilt on next use"""
+        with self._lock:
+            for name in names or list(self._instances):
+                self._instances.pop(name, None)
+
+
+# registry of the knowledge base the current request is served from, set by knowledge_bases.py
+active_registry = contextvars.ContextVar('active_registry', default=None)
+
+
+class ActiveRegistry:
+    """The registry of the knowledge base being served, the default one outside of one"""
+    def __init__(self, default):
+        self.default = default
+
+    def __getattr__(self, name):
+        return getattr(active_registry.get() or self.default, name)
+
+
+registry = ActiveRegistry(LazyRegistry())
@@ -1,7 +1,23 @@
+import os
+import queue
+import threading
+from pathlib import Path
+
 from .config import *
+from .registry import registry
+from .knowledge_bases import knowledge_bases, close_chroma_store
 from .custom.prompt_templates import main_prompt_template, fallback_prompt_template
+from .custom.components import BlockingRetriever, CancellableChatGenerator, GenerationCancelled
+from .custom.embedding_cache import EmbeddingCache, CachedTextEmbedder
+from .custom.answer_cache import SemanticAnswerCache, AnswerCacheLookup, scope_key
+from .custom.bm25 import BM25Index, HybridRetriever
+from .custom.reranker import CrossEncoderModel, CrossEncoderRanker
+from .custom.context_packing import TokenCounter, ContextPacker
+from .custom.local_embedder import LocalEmbeddingModel, LocalTextEmbedder
+from .custom.batching import MicroBatcher, BatchedTextEmbedder, BatchedRetriever, embed_texts, search_embeddings
+from .custom.numpy_store import NumpyDocumentStore, NumpyEmbeddingRetriever, STORE_MANIFEST_NAME
 
-from haystack import Pipeline
+from haystack import Pipeline, AsyncPipeline
 from haystack.components.builders import ChatPromptBuilder, PromptBuilder
 from haystack.dataclasses import ChatMessage
 from haystack.utils import Secret
@@ -12,39 +28,167 @@ from haystack_integrations.components.retrievers.chroma import ChromaEmbeddingRe
 from haystack_integrations.document_stores.chroma import ChromaDocumentStore
 from haystack.utils.hf import HFGenerationAPIType
 from haystack import component
-from haystack.components.embedders import SentenceTransformersTextEmbedder, HuggingFaceAPITextEmbedder
+from haystack.components.embedders import SentenceTransformersTextEmbedder, HuggingFaceAPITextEmbedder, HuggingFaceAPIDocumentEmbedder
 
 API_TYPE = HFGenerationAPIType.SERVERLESS_INFERENCE_API
 
-# Initialize document store (using Chroma as in your example)
-document_store = ChromaDocumentStore(
-    persist_path = PROCESSING_CONFIG["response_config"]["loaded_vdb_path"]
-)
+# Everything expensive is built on first use through the registry and shared process wide (by knowledge base,
+# see knowledge_bases.py), a component can only belong to one pipeline so every pipeline builds its own components.
+def build_chroma_store():
+    load_vdb()
+    return ChromaDocumentStore(
+        persist_path = str(get_response_config()["loaded_vdb_path"])
+    )
+
+def build_numpy_store():
+    numpy_config = get_response_config()["numpy_store"]
+    ann = numpy_config["ann"] if numpy_config["ann"]["enabled"] else None
+    document_store = NumpyDocumentStore(numpy_config["path"], dtype=numpy_config["dtype"], ann=ann,
+                                        quantization=numpy_config["quantization"],
+                                        rescore_multiplier=numpy_config["rescore_multiplier"],
+                                        indexed_fields=get_response_config()["retriever"]["scope_fields"])
+    if not document_store.count_documents():
+        # first use, the documents and their embeddings are copied from the shipped Chroma store
+        documents = build_chroma_store().filter_documents()
+        document_store.write_documents(documents)
+        print(f"exported {len(documents)} documents from Chroma to {numpy_config['path']}")
+    return document_store
 
-query_embedder = HuggingFaceAPITextEmbedder(api_type="text_embeddings_inference",
-                                            api_params={"url": PROCESSING_CONFIG["response_config"]["embedding_api"]},
-                                            token=Secret.from_token(PROCESSING_CONFIG["HF_API_TOKEN"]))
+def document_store_version():
+    """
+    Changes whenever a write to the document store is saved, by this process or another one (run_job_workers,
+    another web process): the numpy store replaces store.json, the indexer replaces its manifest next to Chroma
+    """
+    if get_response_config()["document_store"] == "numpy":
+        path = Path(get_response_config()["numpy_store"]["path"]) / STORE_MANIFEST_NAME
+    else:
+        from .indexing_pipeline import INDEX_MANIFEST_NAME
+        path = Path(get_response_config()["loaded_vdb_path"]) / INDEX_MANIFEST_NAME
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
 
-retriever = ChromaEmbeddingRetriever(document_store=document_store, top_k=PROCESSING_CONFIG["response_config"]["retriever"]["top_k"])
+def build_document_store():
+    # read before loading, a write meanwhile is picked up by the next request (see sync_document_store)
+    version = document_store_version()
+    if get_response_config()["document_store"] == "numpy":
+        document_store = build_numpy_store()
+    else:
+        document_store = build_chroma_store()
+    document_store.loaded_version = version
+    return document_store
 
-template1 = [ChatMessage.from_user(main_prompt_template)]
-main_promptbuilder = ChatPromptBuilder(template=template1, required_variables=["history","query"], variables = ['query', 'history', 'documents'])
-template2 = [ChatMessage.from_user(fallback_prompt_template)]
-fallback_promptbuilder = ChatPromptBuilder(template=template2, required_variables=["query"])
+def build_embedding_cache():
+    # shared by every pipeline so the sync and async paths hit the same entries
+    embedding_cache_config = get_response_config()["embedding_cache"]
+    if not embedding_cache_config["enabled"]:
+        return None
+    return EmbeddingCache(
+        max_size=embedding_cache_config["max_size"],
+        ttl=embedding_cache_config["ttl"],
+        disk_path=embedding_cache_config["disk_path"],
+        disk_max_size=embedding_cache_config["disk_max_size"],
+    )
 
-main_llm = HuggingFaceAPIChatGenerator(
-      api_type=API_TYPE,
-      api_params={"model": PROCESSING_CONFIG["response_config"]["chat_model"]},
-      token=Secret.from_token(PROCESSING_CONFIG["HF_API_TOKEN"])
+def build_answer_cache():
+    answer_cache_config = get_response_config()["answer_cache"]
+    if not answer_cache_config["enabled"]:
+        return None
+    return SemanticAnswerCache(
+        threshold=answer_cache_config["similarity_threshold"],
+        max_size=answer_cache_config["max_size"],
+        vdb_path=get_document_store_path(),
     )
 
+def build_bm25_index():
+    bm25_config = get_response_config()["bm25"]
+    if not bm25_config["enabled"]:
+        return None
+    index = BM25Index(registry.get('document_store').filter_documents(), k1=bm25_config["k1"], b=bm25_config["b"],
+                      indexed_fields=get_response_config()["retriever"]["scope_fields"])
+    print(f"BM25 index: {len(index)} documents, {len(index.vocabulary)} terms, {index.nbytes() / 1e6:.1f}MB of postings")
+    return index
 
-fallback_llm = HuggingFaceAPIChatGenerator(
-      api_type=API_TYPE,
-      api_params={"model": PROCESSING_CONFIG["response_config"]["chat_model"]},
-      token=Secret.from_token(PROCESSING_CONFIG["HF_API_TOKEN"])
+def build_cross_encoder():
+    reranker_config = get_response_config()["reranker"]
+    if not reranker_config["enabled"]:
+        return None
+    return CrossEncoderModel(reranker_config["model"], backend=reranker_config["backend"], file_name=reranker_config["file_name"])
+
+def build_token_counter():
+    # only used to pack the context, no tokenizer is loaded otherwise
+    if not get_response_config()["context_packing"]["enabled"]:
+        return None
+    tokenizer = get_response_config()["context_packing"]["tokenizer"] or get_response_config()["chat_model"]
+    return TokenCounter(tokenizer, token=get_hf_token())
+
+def build_local_embedding_model():
+    local_config = get_response_config()["local_embedder"]
+    return LocalEmbeddingModel(
+        model=str(local_config["model_path"] or get_response_config()["embedding_model"]),
+        backend=local_config["backend"],
+        file_name=local_config["file_name"],
+        threads=local_config["threads"],
+        intra_op_threads=local_config["intra_op_threads"],
+        batch_size=get_response_config()["batching"]["max_batch_size"],
     )
 
+def get_embedding_model_id(embedding_backend=None):
+    """Identifies the embeddings in caches, a quantized local model doesn't give exactly the API's vectors"""
+    embedding_backend = embedding_backend or get_response_config()["embedding_backend"]
+    if embedding_backend == "local":
+        local_config = get_response_config()["local_embedder"]
+        return f'{get_response_config()["embedding_model"]}@{local_config["backend"]}/{local_config["file_name"] or "default"}'
+    return get_response_config()["embedding_model"]
+
+def build_text_embedder(embedding_backend=None):
+    """Builds the uncached query embedder of the configured embedding backend, or of the given one"""
+    embedding_backend = embedding_backend or get_response_config()["embedding_backend"]
+    if embedding_backend == "local":
+        return LocalTextEmbedder(registry.get('local_embedding_model'))
+    return HuggingFaceAPITextEmbedder(api_type="text_embeddings_inference",
+                                      api_params={"url": get_response_config()["embedding_api"]},
+                                      token=Secret.from_token(get_hf_token()))
+
+def build_retriever(document_store, top_k, pipeline_class = Pipeline):
+    if isinstance(document_store, NumpyDocumentStore):
+        # sync only, AsyncPipeline runs it in its thread pool
+        return NumpyEmbeddingRetriever(document_store=document_store, top_k=top_k)
+    retriever = ChromaEmbeddingRetriever(document_store=document_store, top_k=top_k)
+    if pipeline_class is AsyncPipeline:
+        retriever = BlockingRetriever(retriever)
+    return retriever
+
+def build_batcher(process_batch, name):
+    batching_config = get_response_config()["batching"]
+    return MicroBatcher(
+        process_batch,
+        max_batch_size=batching_config["max_batch_size"],
+        max_wait=batching_config["max_wait_ms"] / 1000,
+        max_concurrent_batches=batching_config["max_concurrent_batches"],
+        name=name,
+    )
+
+def build_embedding_batcher():
+    # one batcher per process, queries from the sync and async pipelines end up in the same batches
+    if not get_response_config()["batching"]["enabled"]:
+        return None
+    if get_response_config()["embedding_backend"] == "local":
+        return build_batcher(registry.get('local_embedding_model').embed, 'embedding-batcher')
+    document_embedder = HuggingFaceAPIDocumentEmbedder(api_type="text_embeddings_inference",
+                                                       api_params={"url": get_response_config()["embedding_api"]},
+                                                       token=Secret.from_token(get_hf_token()),
+                                                       batch_size=get_response_config()["batching"]["max_batch_size"],
+                                                       progress_bar=False)
+    return build_batcher(lambda texts: embed_texts(document_embedder, texts), 'embedding-batcher')
+
+def build_retrieval_batcher():
+    if not get_response_config()["batching"]["enabled"]:
+        return None
+    document_store = registry.get('document_store')
+    return build_batcher(lambda requests: search_embeddings(document_store, requests), 'retrieval-batcher')
 
 from typing import List
 @component
@@ -54,74 +198,420 @@ class NoOpComponent:
     print(history)
     return {'history':history, 'query':history[-1]}
 
-conditional_router = ConditionalRouter([
-    {
-        "condition": "{{'no_answer' not in replies[0].text }}",
-        "output": "{{replies}}",
-        "output_name": "replies",
-        "output_type": list[ChatMessage],
-    },
-    {
-        "condition": "{{'no_answer' in replies[0].text }}",
-        "output": "{{query}}",
-        "output_name": "go_to_fallback",
-        "output_type": str,
-    },
-], unsafe = True)
-
-# Setup pipeline
-pipeline = Pipeline()
-pipeline.add_component('distributer', NoOpComponent())
-pipeline.add_component('embedder', query_embedder)
-pipeline.add_component('retriever', retriever)
-pipeline.add_component('main_promptbuilder', main_promptbuilder)
-pipeline.add_component('fallback_promptbuilder', fallback_promptbuilder)
-pipeline.add_component('main_llm', main_llm)
-pipeline.add_component('fallback_llm', fallback_llm)
-pipeline.add_component('conditional_router', conditional_router)
-
-pipeline.connect('distributer.query', 'embedder.text')
-pipeline.connect('distributer.query', 'main_promptbuilder.query')
-pipeline.connect('distributer.history', 'main_promptbuilder.history')
-pipeline.connect('distributer.query', 'conditional_router.query')
-
-pipeline.connect('embedder.embedding', 'retriever.query_embedding')
-pipeline.connect('retriever.documents', 'main_promptbuilder.documents')
-
-pipeline.connect('main_promptbuilder.prompt', 'main_llm.messages')
-
-pipeline.connect('main_llm.replies', 'conditional_router.replies')
-
-pipeline.connect('conditional_router.go_to_fallback', 'fallback_promptbuilder.query')
-pipeline.connect('fallback_promptbuilder.prompt', 'fallback_llm.messages')
+
+def build_pipeline(pipeline_class = Pipeline):
+    """Builds the response pipeline, pass AsyncPipeline to get the asyncio version"""
+    document_store = registry.get('document_store')
+    embedding_cache = registry.get('embedding_cache')
+    answer_cache = registry.get('answer_cache')
+    bm25_index = registry.get('bm25_index')
+    cross_encoder = registry.get('cross_encoder')
+    reranker_config = get_response_config()["reranker"]
+    # the reranker picks the final documents out of a bigger candidate list
+    retrieval_top_k = reranker_config["candidates"] if cross_encoder is not None else get_response_config()["retriever"]["top_k"]
+
+    embedding_batcher = registry.get('embedding_batcher')
+    retrieval_batcher = registry.get('retrieval_batcher')
+
+    if embedding_batcher is not None:
+        query_embedder = BatchedTextEmbedder(embedding_batcher)
+    else:
+        query_embedder = build_text_embedder()
+    if embedding_cache is not None:
+        query_embedder = CachedTextEmbedder(query_embedder, embedding_cache, get_embedding_model_id())
+
+    if retrieval_batcher is not None:
+        retriever = BatchedRetriever(retrieval_batcher, top_k=retrieval_top_k)
+    else:
+        retriever = build_retriever(document_store, retrieval_top_k, pipeline_class)
+
+    prompt_templates = get_response_config()["prompt_templates"]
+    template1 = [ChatMessage.from_user(prompt_templates["main"] or main_prompt_template)]
+    # documents is required so the builder (and main_llm) never run when the answer cache short-circuits retrieval
+    main_promptbuilder = ChatPromptBuilder(template=template1, required_variables=["history","query","documents"], variables = ['query', 'history', 'documents'])
+    template2 = [ChatMessage.from_user(prompt_templates["fallback"] or fallback_prompt_template)]
+    fallback_promptbuilder = ChatPromptBuilder(template=template2, required_variables=["query"])
+
+    main_llm = HuggingFaceAPIChatGenerator(
+          api_type=API_TYPE,
+          api_params={"model": get_response_config()["chat_model"]},
+          token=Secret.from_token(get_hf_token())
+        )
+
+    fallback_llm = HuggingFaceAPIChatGenerator(
+          api_type=API_TYPE,
+          api_params={"model": get_response_config()["chat_model"]},
+          token=Secret.from_token(get_hf_token())
+        )
+
+    speculative = is_speculative()
+    if speculative:
+        # stream_response stops main_llm once its reply turns out to be 'no_answer' and the fallback one is streamed
+        main_llm = CancellableChatGenerator(main_llm, NO_ANSWER)
+        # both replies are already there, the router only picks one
+        fallback_route = {
+            "condition": "{{'no_answer' in replies[0].text }}",
+            "output": "{{fallback_replies}}",
+            "output_name": "fallback_replies",
+            "output_type": list[ChatMessage],
+        }
+    else:
+        fallback_route = {
+            "condition": "{{'no_answer' in replies[0].text }}",
+            "output": "{{query}}",
+            "output_name": "go_to_fallback",
+            "output_type": str,
+        }
+    conditional_router = ConditionalRouter([
+        {
+            "condition": "{{'no_answer' not in replies[0].text }}",
+            "output": "{{replies}}",
+            "output_name": "replies",
+            "output_type": list[ChatMessage],
+        },
+        fallback_route,
+    ], unsafe = True)
+
+    # Setup pipeline
+    pipeline = pipeline_class()
+    pipeline.add_component('distributer', NoOpComponent())
+    pipeline.add_component('embedder', query_embedder)
+    pipeline.add_component('retriever', retriever)
+    pipeline.add_component('main_promptbuilder', main_promptbuilder)
+    pipeline.add_component('fallback_promptbuilder', fallback_promptbuilder)
+    pipeline.add_component('main_llm', main_llm)
+    pipeline.add_component('fallback_llm', fallback_llm)
+    pipeline.add_component('conditional_router', conditional_router)
+    if answer_cache is not None:
+        pipeline.add_component('answer_cache', AnswerCacheLookup(answer_cache))
+    if bm25_index is not None:
+        pipeline.add_component('hybrid_retriever', HybridRetriever(bm25_index, top_k=retrieval_top_k if cross_encoder is not None else get_response_config()["bm25"]["top_k"]))
+    packing_config = get_response_config()["context_packing"]
+    if packing_config["enabled"]:
+        pipeline.add_component('context_packer', ContextPacker(registry.get('token_counter'),
+                                                               max_context_tokens=packing_config["max_context_tokens"],
+                                                               max_history_tokens=packing_config["max_history_tokens"],
+                                                               max_document_tokens=packing_config["max_document_tokens"],
+                                                               dedupe_overlap=packing_config["dedupe_overlap"]))
+    if cross_encoder is not None:
+        pipeline.add_component('reranker', CrossEncoderRanker(cross_encoder,
+                                                              top_k=reranker_config["top_k"],
+                                                              batch_size=reranker_config["batch_size"],
+                                                              score_threshold=reranker_config["score_threshold"],
+                                                              early_exit_score=reranker_config["early_exit_score"]))
+
+    pipeline.connect('distributer.query', 'embedder.text')
+    pipeline.connect('distributer.query', 'main_promptbuilder.query')
+    if not packing_config["enabled"]:
+        pipeline.connect('distributer.history', 'main_promptbuilder.history')
+    if not speculative:
+        pipeline.connect('distributer.query', 'conditional_router.query')
+
+    if answer_cache is not None:
+        pipeline.connect('embedder.embedding', 'answer_cache.query_embedding')
+        pipeline.connect('answer_cache.query_embedding', 'retriever.query_embedding')
+    else:
+        pipeline.connect('embedder.embedding', 'retriever.query_embedding')
+    candidates = 'retriever.documents'
+    if bm25_index is not None:
+        pipeline.connect('distributer.query', 'hybrid_retriever.query')
+        pipeline.connect(candidates, 'hybrid_retriever.documents')
+        candidates = 'hybrid_retriever.documents'
+    if cross_encoder is not None:
+        pipeline.connect('distributer.query', 'reranker.query')
+        pipeline.connect(candidates, 'reranker.documents')
+        candidates = 'reranker.documents'
+    if packing_config["enabled"]:
+        pipeline.connect('distributer.history', 'context_packer.history')
+        pipeline.connect(candidates, 'context_packer.documents')
+        pipeline.connect('context_packer.history', 'main_promptbuilder.history')
+        candidates = 'context_packer.documents'
+    pipeline.connect(candidates, 'main_promptbuilder.documents')
+
+    pipeline.connect('main_promptbuilder.prompt', 'main_llm.messages')
+
+    pipeline.connect('main_llm.replies', 'conditional_router.replies')
+
+    if speculative:
+        # the fallback branch only depends on the query, so it starts next to retrieval and main_llm,
+        # after the answer cache missed so a cached answer never pays for a fallback call
+        if answer_cache is not None:
+            pipeline.connect('distributer.query', 'answer_cache.query')
+            pipeline.connect('answer_cache.query', 'fallback_promptbuilder.query')
+        else:
+            pipeline.connect('distributer.query', 'fallback_promptbuilder.query')
+        pipeline.connect('fallback_llm.replies', 'conditional_router.fallback_replies')
+    else:
+        pipeline.connect('conditional_router.go_to_fallback', 'fallback_promptbuilder.query')
+    pipeline.connect('fallback_promptbuilder.prompt', 'fallback_llm.messages')
+    return pipeline
+
+
+registry.register('document_store', build_document_store)
+registry.register('embedding_cache', build_embedding_cache)
+registry.register('answer_cache', build_answer_cache)
+registry.register('bm25_index', build_bm25_index)
+registry.register('cross_encoder', build_cross_encoder)
+registry.register('token_counter', build_token_counter)
+registry.register('local_embedding_model', build_local_embedding_model)
+registry.register('embedding_batcher', build_embedding_batcher)
+registry.register('retrieval_batcher', build_retrieval_batcher)
+registry.register('pipeline', build_pipeline)
+registry.register('async_pipeline', lambda: build_pipeline(AsyncPipeline))
+
+def warmup():
+    """Builds the pipelines and everything they use, so the first chat message doesn't pay for it"""
+    registry.warmup()
+    if get_response_config()["embedding_backend"] == "local":
+        # registry objects are cheap to build, loading the model itself takes seconds
+        registry.get('local_embedding_model').warm_up()
+    if registry.get('cross_encoder') is not None:
+        registry.get('cross_encoder').warm_up()
+
+def refresh_retrieval():
+    """Rebuilds what holds a copy of the indexed documents, after the document store was updated in place"""
+    registry.reset('bm25_index', 'pipeline', 'async_pipeline')
+
+def sync_document_store():
+    """
+    Called before every request: reloads the document store when another process saved a write to it since it was
+    loaded (an ingestion job run by run_job_workers, update_index in another web process), costs one stat otherwise
+    """
+    if not registry.is_built('document_store'):
+        return
+    document_store = registry.get('document_store')
+    version = document_store_version()
+    if version == getattr(document_store, 'loaded_version', version):
+        return
+    print("document store changed on disk, reloading it")
+    if get_response_config()["document_store"] == "numpy":
+        document_store.reload()
+        document_store.loaded_version = version
+    else:
+        # chroma keeps the index it loaded in memory, only a new client reads it again
+        registry.reset('document_store')
+        close_chroma_store(get_response_config()["loaded_vdb_path"])
+    refresh_retrieval()
 
 ### Utils
 
-def run(messages_history: str, history_length: int):
+NO_ANSWER = 'no_answer'
+
+OUTPUTS_TO_INCLUDE = {'distributer', 'answer_cache', 'retriever', 'hybrid_retriever', 'reranker', 'context_packer', 'main_promptbuilder', 'main_llm'}
+
+def is_speculative(response_config = None):
+  return (response_config or get_response_config())["fallback"]["mode"] == "speculative"
+
+def as_async_callback(callback):
+  # generators running inside AsyncPipeline only accept coroutine streaming callbacks
+  async def async_callback(chunk):
+    callback(chunk)
+  return async_callback
+
+def build_run_data(messages_history, history_length, streaming_callbacks = None, filters = None):
   # extracts last sent messages
   proper_history = messages_history[-history_length:] if history_length<len(messages_history) else messages_history
   print("the proper history is: ", proper_history)
-  results = pipeline.run({
-      'distributer': {'history': proper_history},
-      }, include_outputs_from={'retriever','main_promptbuilder', 'main_llm'})
+  data = {'distributer': {'history': proper_history}}
+  if filters:
+    # the scope of the conversation, every component choosing documents gets it
+    data['retriever'] = {'filters': filters}
+    if registry.get('answer_cache') is not None:
+      data['answer_cache'] = {'filters': filters}
+    if registry.get('bm25_index') is not None:
+      data['hybrid_retriever'] = {'filters': filters}
+  if len(proper_history) > 1 and registry.get('answer_cache') is not None:
+    # same rule as remember_answer, follow-ups are neither stored nor answered from the cache
+    data.setdefault('answer_cache', {})['follow_up'] = True
+  # streaming callbacks are keyed by generator name ('main_llm' / 'fallback_llm')
+  for llm_name, callback in (streaming_callbacks or {}).items():
+    data[llm_name] = {'streaming_callback': callback}
+  return data
+
+def run(messages_history: str, history_length: int, streaming_callbacks = None, filters = None):
+  sync_document_store()
+  if is_speculative():
+    # the main and fallback branches only overlap in the async pipeline, run it to completion on this thread
+    streaming_callbacks = {name: as_async_callback(callback) for name, callback in (streaming_callbacks or {}).items()}
+    data = build_run_data(messages_history, history_length, streaming_callbacks, filters)
+    results = registry.get('async_pipeline').run(data, include_outputs_from=OUTPUTS_TO_INCLUDE)
+  else:
+    data = build_run_data(messages_history, history_length, streaming_callbacks, filters)
+    results = registry.get('pipeline').run(data, include_outputs_from=OUTPUTS_TO_INCLUDE)
+  remember_answer(results, filters)
+  print_cache_stats()
+  print_request_stats(results)
+  return results
+
+async def run_async(messages_history, history_length, filters = None):
+  # embedder and LLM calls are awaited, so the event loop is free while they are in flight
+  sync_document_store()
+  data = build_run_data(messages_history, history_length, filters=filters)
+  results = await registry.get('async_pipeline').run_async(data, include_outputs_from=OUTPUTS_TO_INCLUDE)
+  remember_answer(results, filters)
+  print_cache_stats()
+  print_request_stats(results)
   return results
 
+def print_request_stats(results):
+  if 'reranker' in results:
+    print("reranker:", results['reranker']['meta'])
+  token_counter = registry.get('token_counter')
+  if 'main_promptbuilder' in results and token_counter is not None:
+    # the prompt size drives main_llm latency and cost
+    prompt_tokens = token_counter.count(results['main_promptbuilder']['prompt'][0].text)
+    print("prompt tokens:", prompt_tokens, results.get('context_packer', {}).get('meta', ''))
+
+def print_cache_stats():
+  embedding_cache = registry.get('embedding_cache')
+  if embedding_cache is not None:
+    print("query embedding cache:", embedding_cache.stats())
+  answer_cache = registry.get('answer_cache')
+  if answer_cache is not None:
+    print("answer cache:", answer_cache.stats())
+  for name in ('embedding_batcher', 'retrieval_batcher'):
+    batcher = registry.get(name)
+    if batcher is not None:
+      print(name.replace('_', ' ') + ":", batcher.stats())
+
+def remember_answer(results, filters = None):
+  # only answers to standalone questions are stored, follow-ups depend on the history they were asked in
+  answer_cache = registry.get('answer_cache')
+  if answer_cache is None or get_is_cached(results) or get_is_fallback(results):
+    return
+  if len(results['distributer']['history']) != 1:
+    return
+  query_embedding = results['answer_cache']['query_embedding']
+  document_ids = [doc.id for doc in get_context(results)]
+  answer_cache.add(query_embedding, results['distributer']['query'], get_reply(results), document_ids, scope_key(filters))
+
 def get_is_fallback(results):
-  return results.get('fallback_llm') is not None
+  return results.get('fallback_llm') is not None or 'fallback_replies' in results.get('conditional_router', {})
+
+def get_is_cached(results):
+  return 'replies' in results.get('answer_cache', {})
 
 def get_context(results):
-  retriever_output = results["retriever"]['documents']
+  # the documents the prompt was built from, after BM25 fusion, reranking and packing when they are on
+  retriever_output = (results.get('context_packer') or results.get('reranker') or results.get('hybrid_retriever')
+                      or results["retriever"])['documents']
   return retriever_output
 
 
 def get_reply(results):
-  response = results.get('conditional_router') or results.get('fallback_llm')
-  print('from conditional router:', results.get('conditional_router') is not None)
-  print('from fallback llm:', results.get('fallback_llm') is not None)
-  reply = response['replies'][0].text.replace('\n', '')
+  if get_is_cached(results):
+    return results['answer_cache']['replies'][0].text
+  router_output = results.get('conditional_router') or {}
+  print('from conditional router:', 'replies' in router_output)
+  print('from fallback llm:', get_is_fallback(results))
+  if 'replies' in router_output:
+    replies = router_output['replies']
+  elif 'fallback_replies' in router_output:
+    replies = router_output['fallback_replies']
+  else:
+    replies = results['fallback_llm']['replies']
+  reply = replies[0].text.replace('\n', '')
   return reply
 
-def generate_response(messages_history):
-    results = run(messages_history, PROCESSING_CONFIG["response_config"]["history_max_length"])
-    reply = get_reply(results)
-    return reply
\ No newline at end of file
+# knowledge_base: name of the knowledge base answering (see knowledge_bases.py), None for the default one
+def generate_response(messages_history, filters=None, knowledge_base=None):
+    with knowledge_bases.use(knowledge_base):
+        results = run(messages_history, get_response_config()["history_max_length"], filters=filters)
+        reply = get_reply(results)
+    return reply
+
+async def agenerate_response(messages_history, filters=None, knowledge_base=None):
+    with knowledge_bases.use(knowledge_base):
+        results = await run_async(messages_history, get_response_config()["history_max_length"], filters)
+        reply = get_reply(results)
+    return reply
+
+def stream_response(messages_history, filters=None, knowledge_base=None):
+    """
+    Runs the pipeline in a worker thread and yields (event, payload) tuples as tokens arrive:
+    ('token', text) for every streamed piece of the answer, ('reset', None) when tokens already
+    sent from main_llm turn out to be a 'no_answer' reply and the fallback answer follows,
+    and finally ('done', reply) with the same reply generate_response would return.
+    In speculative fallback mode the fallback tokens are streamed as soon as main_llm starts with 'no_answer',
+    and main_llm is stopped at its next token so 'done' only waits for the fallback reply.
+    """
+    knowledge_base = knowledge_bases.get(knowledge_base)
+    events = queue.Queue()
+    cancel_main = threading.Event()
+
+    def on_main_chunk(chunk):
+        if cancel_main.is_set():
+            # caught by CancellableChatGenerator, which closes the stream and replies 'no_answer'
+            raise GenerationCancelled()
+        events.put(('main_llm', chunk.content))
+
+    def on_fallback_chunk(chunk):
+        events.put(('fallback_llm', chunk.content))
+
+    def worker():
+        try:
+            # the knowledge base is only active in this thread, the generator may be resumed from other ones
+            with knowledge_bases.use(knowledge_base.name):
+                results = run(messages_history,
+                              knowledge_base.response_config["history_max_length"],
+                              streaming_callbacks={'main_llm': on_main_chunk, 'fallback_llm': on_fallback_chunk},
+                              filters=filters)
+                events.put(('done', (get_reply(results), get_is_fallback(results))))
+        except Exception as e:
+            events.put(('error', e))
+
+    thread = threading.Thread(target=worker, daemon=True)
+    thread.start()
+
+    # main_llm tokens are held back until they can't be the start of a 'no_answer' reply, in speculative
+    # mode fallback_llm tokens are held back until main_llm's reply turns out to be 'no_answer'
+    speculative = is_speculative(knowledge_base.response_config)
+    held_back = ''
+    main_streamed = False
+    fallback_chosen = False
+    fallback_held_back = []
+    while True:
+        source, payload = events.get()
+        if source == 'main_llm':
+            if not payload or fallback_chosen:
+                continue
+            if main_streamed:
+                yield 'token', payload
+                continue
+            held_back += payload
+            if speculative and held_back.lstrip().startswith(NO_ANSWER):
+                # early exit, the fallback reply being generated is the answer so main_llm is stopped
+                fallback_chosen = True
+                cancel_main.set()
+                for token in fallback_held_back:
+                    yield 'token', token
+                continue
+            if NO_ANSWER.startswith(held_back.lstrip()):
+                continue
+            main_streamed = True
+            yield 'token', held_back
+            held_back = ''
+        elif source == 'fallback_llm':
+            if speculative and not fallback_chosen:
+                if payload:
+                    fallback_held_back.append(payload)
+                continue
+            if main_streamed:
+                main_streamed = False
+                yield 'reset', None
+            if payload:
+                yield 'token', payload
+        elif source == 'done':
+            thread.join()
+            reply, is_fallback = payload
+            if speculative and is_fallback and not fallback_chosen:
+                # 'no_answer' came after main_llm tokens were already sent
+                if main_streamed:
+                    yield 'reset', None
+                if fallback_held_back:
+                    yield 'token', ''.join(fallback_held_back)
+            yield 'done', reply
+            return
+        else:
+            thread.join()
+            raise payload
@@ -1,12 +1,155 @@
-from .processing_pipeline import response_pipeline
+import importlib
+import json
 
-def generate_response(conversation, query):
+from .history_cache import ConversationHistoryCache
+from .processing_pipeline.config import PROCESSING_CONFIG, knowledge_base_response_config
+
+SCOPE_FIELDS = PROCESSING_CONFIG["response_config"]["retriever"]["scope_fields"]
+
+history_cache_config = PROCESSING_CONFIG["response_config"]["history_cache"]
+history_cache = ConversationHistoryCache(
+    PROCESSING_CONFIG["response_config"]["history_max_length"], history_cache_config["max_conversations"]
+) if history_cache_config["enabled"] else None
+
+def get_response_pipeline():
+    # imported on first use: haystack and the pipeline modules are only loaded when a chat message needs them
+    return importlib.import_module('.processing_pipeline.response_pipeline', __package__)
+
+def history_length(conversation):
+    """
+    history_max_length of the conversation's knowledge base (default_knowledge_base without one),
+    read on every call so config changes apply
+    """
+    return knowledge_base_response_config(conversation.knowledge_base)["history_max_length"]
+
+def recent_user_messages_query(conversation):
+    # only the last history_length user messages are used, newest first so the (conversation, role, timestamp)
+    # index serves it without reading the rest of the conversation
+    return (conversation.messages.filter(role = 'user')
+            .order_by('-timestamp', '-id')
+            .values_list('content', flat=True)[:history_length(conversation)])
+
+def get_user_messages(conversation, query = None):
+    """Last user messages of the conversation, oldest first, the query being the last one"""
+    cached = get_cached_user_messages(conversation, query)
+    if cached is not None:
+        return cached
+    user_messages = list(recent_user_messages_query(conversation))[::-1]
+    if history_cache is not None:
+        history_cache.set(conversation.id, user_messages, history_length(conversation))
+    return user_messages
+
+async def aget_user_messages(conversation, query = None):
+    cached = get_cached_user_messages(conversation, query)
+    if cached is not None:
+        return cached
+    user_messages = [content async for content in recent_user_messages_query(conversation)][::-1]
+    if history_cache is not None:
+        history_cache.set(conversation.id, user_messages, history_length(conversation))
+    return user_messages
+
+def get_cached_user_messages(conversation, query):
+    # the query was just saved as the newest user message, so it completes the buffered history
+    if history_cache is None or query is None:
+        return None
+    return history_cache.append(conversation.id, query, history_length(conversation))
+
+def discard_user_message(user_message):
+    """Deletes a user message generation failed to answer, it was appended to the buffered history so that goes too"""
+    user_message.delete()
+    forget_history(user_message.conversation_id)
+
+async def adiscard_user_message(user_message):
+    await user_message.adelete()
+    forget_history(user_message.conversation_id)
+
+def forget_history(conversation_id):
+    # read back from the database on the next turn
+    if history_cache is not None:
+        history_cache.discard(conversation_id)
+
+def parse_scope(scope):
+    """
+    Checks a retrieval scope, {field: value or list of values} with fields from SCOPE_FIELDS (a JSON string
+    of one is accepted for form posts). Returns the scope, None when empty, raises ValueError when invalid.
+    """
+    if isinstance(scope, str):
+        try:
+            scope = json.loads(scope) if scope.strip() else None
+        except ValueError:
+            raise ValueError("scope must be a JSON object")
+    if not scope:
+        return None
+    if not isinstance(scope, dict):
+        raise ValueError("scope must be an object of {field: value or list of values}")
+    for field, value in scope.items():
+        if field not in SCOPE_FIELDS:
+            raise ValueError(f"Unknown scope field '{field}', use one of: {', '.join(SCOPE_FIELDS)}")
+        values = value if isinstance(value, list) else [value]
+        if not values or not all(isinstance(item, str) and item for item in values):
+            raise ValueError(f"scope '{field}' must be a string or a list of strings")
+    return scope
+
+def scope_filters(scope):
+    """Retriever filters of a scope, None to search every document"""
+    if not scope:
+        return None
+    conditions = [{"field": f"meta.{field}", "operator": "in" if isinstance(value, list) else "==", "value": value}
+                  for field, value in sorted(scope.items())]
+    return conditions[0] if len(conditions) == 1 else {"operator": "AND", "conditions": conditions}
+
+def parse_knowledge_base(name):
+    """Checks a knowledge base name, '' for the default one, raises ValueError when it isn't configured"""
+    if not name:
+        return ''
+    if name not in PROCESSING_CONFIG["knowledge_bases"]:
+        raise ValueError(f"Unknown knowledge base '{name}', use one of: {', '.join(PROCESSING_CONFIG['knowledge_bases'])}")
+    return name
+
+def list_knowledge_bases():
+    default_name = PROCESSING_CONFIG["default_knowledge_base"]
+    return [{'name': name, 'description': (config or {}).get('description', ''), 'default': name == default_name}
+            for name, config in PROCESSING_CONFIG["knowledge_bases"].items()]
+
+def retrieval_filters(conversation, scope=None):
+    # the scope sent with a message replaces the conversation's
+    return scope_filters(scope if scope is not None else conversation.scope)
+
+def generate_response(conversation, query, scope=None):
     print("!!generating response!!")
     
     # setup conversation history
-    user_messages = [message.content for message in conversation.messages.filter(role = 'user')]
+    user_messages = get_user_messages(conversation, query)
     print("user messages:" , user_messages)  
 
     # generate response
-    response = response_pipeline.generate_response(user_messages)
-    return response
\ No newline at end of file
+    response = get_response_pipeline().generate_response(user_messages, retrieval_filters(conversation, scope),
+                                                         conversation.knowledge_base or None)
+    return response
+
+async def agenerate_response(conversation, query, scope=None):
+    """Async version of generate_response, for the ASGI message path"""
+    print("!!generating response (async)!!")
+
+    user_messages = await aget_user_messages(conversation, query)
+    print("user messages:" , user_messages)
+
+    response = await get_response_pipeline().agenerate_response(user_messages, retrieval_filters(conversation, scope),
+                                                                conversation.knowledge_base or None)
+    return response
+
+def stream_response(conversation, query, scope=None):
+    """Yields (event, payload) tuples while the response is generated, see response_pipeline.stream_response"""
+    print("!!streaming response!!")
+
+    user_messages = get_user_messages(conversation, query)
+    print("user messages:" , user_messages)
+
+    yield from get_response_pipeline().stream_response(user_messages, retrieval_filters(conversation, scope),
+                                                       conversation.knowledge_base or None)
+
+def warmup_pipeline(force=False):
+    """Builds the response pipelines now if PROCESSING_CONFIG asks for it (or force), called by wsgi.py / asgi.py"""
+    from .processing_pipeline.config import PROCESSING_CONFIG
+    if force or PROCESSING_CONFIG["warmup_on_startup"]:
+        get_response_pipeline().warmup()
@@ -0,0 +1,15 @@
+import numpy as np
+
+
+class FakeClock:
+    """Stands in for time.monotonic, tests move it forward by setting now"""
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def exact_top_k(embeddings, query, top_k):
+    """Rows of the top_k highest dot products with query, what the approximate searches are checked against"""
+    return np.argsort(-(embeddings @ query))[:top_k].tolist()
@@ -0,0 +1,75 @@
+import shutil
+import tempfile
+from pathlib import Path
+
+from django.test import SimpleTestCase
+
+from chatbot_backend.services.processing_pipeline.custom.answer_cache import SemanticAnswerCache, AnswerCacheLookup
+from chatbot_backend.tests.helpers import FakeClock
+
+
+class SemanticAnswerCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.vdb_path = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.vdb_path)
+        (self.vdb_path / 'chroma.sqlite3').write_bytes(b'v1')
+
+    def test_similar_query_hits(self):
+        """Test a query embedding close to a stored one returns the stored answer"""
+        cache = SemanticAnswerCache(threshold=0.95)
+        cache.add([1.0, 0.0, 0.0], 'what are the opening hours?', 'From 9 to 5', ['doc-1'])
+        entry, similarity = cache.lookup([0.99, 0.05, 0.0])
+        self.assertEqual(entry.answer, 'From 9 to 5')
+        self.assertEqual(entry.document_ids, ['doc-1'])
+        self.assertGreater(similarity, 0.95)
+
+    def test_different_query_misses(self):
+        """Test a query embedding below the threshold is a miss"""
+        cache = SemanticAnswerCache(threshold=0.95)
+        cache.add([1.0, 0.0, 0.0], 'what are the opening hours?', 'From 9 to 5')
+        self.assertIsNone(cache.lookup([0.6, 0.8, 0.0]))
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_entries_are_scoped(self):
+        """Test an answer retrieved with some filters is only returned for the same filters"""
+        cache = SemanticAnswerCache(threshold=0.95)
+        cache.add([1.0, 0.0, 0.0], 'what are the opening hours?', 'From 9 to 5', scope='{"collection": "faq"}')
+        self.assertIsNone(cache.lookup([1.0, 0.0, 0.0]))
+        self.assertIsNone(cache.lookup([1.0, 0.0, 0.0], scope='{"collection": "laws"}'))
+        self.assertEqual(cache.lookup([1.0, 0.0, 0.0], scope='{"collection": "faq"}')[0].answer, 'From 9 to 5')
+
+    def test_oldest_entry_is_replaced_when_full(self):
+        """Test the cache never grows past max_size"""
+        cache = SemanticAnswerCache(max_size=2)
+        cache.add([1.0, 0.0, 0.0], 'a', 'A')
+        cache.add([0.0, 1.0, 0.0], 'b', 'B')
+        cache.add([0.0, 0.0, 1.0], 'c', 'C')
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.lookup([1.0, 0.0, 0.0]))
+        self.assertEqual(cache.lookup([0.0, 0.0, 1.0])[0].answer, 'C')
+
+    def test_invalidated_when_vector_store_changes(self):
+        """Test entries are dropped once a file of the vector store changes"""
+        clock = FakeClock()
+        cache = SemanticAnswerCache(vdb_path=self.vdb_path, fingerprint_interval=5, clock=clock)
+        cache.add([1.0, 0.0], 'a', 'A')
+
+        (self.vdb_path / 'chroma.sqlite3').write_bytes(b'v2 with more documents')
+        # the store is only checked every fingerprint_interval seconds
+        self.assertIsNotNone(cache.lookup([1.0, 0.0]))
+        clock.now += 6
+        self.assertIsNone(cache.lookup([1.0, 0.0]))
+        self.assertEqual(len(cache), 0)
+
+    def test_lookup_component(self):
+        """Test the component forwards the embedding on a miss and sends replies on a hit"""
+        cache = SemanticAnswerCache()
+        lookup = AnswerCacheLookup(cache)
+        miss = lookup.run(query_embedding=[1.0, 0.0])
+        self.assertEqual(miss['query_embedding'], [1.0, 0.0])
+        self.assertNotIn('replies', miss)
+
+        cache.add([1.0, 0.0], 'a', 'A')
+        hit = lookup.run(query_embedding=[1.0, 0.0])
+        self.assertNotIn('query_embedding', hit)
+        self.assertEqual(hit['replies'][0].text, 'A')
@@ -0,0 +1,77 @@
+import asyncio
+from unittest import mock
+
+from django.test import TestCase, AsyncClient
+
+from chatbot_backend.models import User, Conversation, Message
+
+
+class AsyncMessageViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123',
+            user_type='user'
+        )
+        self.other_user = User.objects.create_user(
+            username='otheruser',
+            email='other@example.com',
+            password='otherpass123',
+            user_type='user'
+        )
+        self.conversation = Conversation.objects.create(user=self.user, title='Async')
+        self.other_conversation = Conversation.objects.create(user=self.other_user, title='Other')
+        self.async_url = lambda conversation_id: f'/api/conversations/{conversation_id}/messages/async/'
+
+    async def login(self):
+        client = AsyncClient()
+        await client.alogin(username='testuser', password='testpass123')
+        return client
+
+    @mock.patch('chatbot_backend.views.async_conversation_views.agenerate_response',
+                new_callable=mock.AsyncMock, return_value='Django is a web framework')
+    async def test_create_message(self, agenerate_response):
+        """Test creating a message through the async path"""
+        client = await self.login()
+        response = await client.post(self.async_url(self.conversation.id), {'content': 'What is Django?'},
+                                     content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['role'], 'assistant')
+        self.assertEqual(response.json()['content'], 'Django is a web framework')
+        agenerate_response.assert_awaited_once()
+
+        count = await Message.objects.filter(conversation=self.conversation).acount()
+        self.assertEqual(count, 2)
+
+    async def test_concurrent_requests_do_not_block(self):
+        """Test that requests waiting on generation run concurrently on one event loop"""
+        async def slow_generation(conversation, query, scope=None):
+            await asyncio.sleep(0.2)
+            return 'done'
+
+        client = await self.login()
+        with mock.patch('chatbot_backend.views.async_conversation_views.agenerate_response', slow_generation):
+            loop = asyncio.get_running_loop()
+            start = loop.time()
+            responses = await asyncio.gather(*[
+                client.post(self.async_url(self.conversation.id), {'content': f'question {i}'},
+                            content_type='application/json')
+                for i in range(5)
+            ])
+            elapsed = loop.time() - start
+        self.assertTrue(all(response.status_code == 201 for response in responses))
+        self.assertLess(elapsed, 0.2 * 5)
+
+    async def test_create_message_in_other_user_conversation(self):
+        """Test that users cannot add messages to other users' conversations"""
+        client = await self.login()
+        response = await client.post(self.async_url(self.other_conversation.id), {'content': 'Hello'},
+                                     content_type='application/json')
+        self.assertEqual(response.status_code, 404)
+
+    async def test_unauthenticated(self):
+        """Test that anonymous users are rejected"""
+        response = await AsyncClient().post(self.async_url(self.conversation.id), {'content': 'Hello'},
+                                            content_type='application/json')
+        self.assertEqual(response.status_code, 403)
@@ -0,0 +1,102 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from django.test import SimpleTestCase
+from haystack import Document
+
+from chatbot_backend.services.processing_pipeline.custom.batching import (
+    MicroBatcher, BatchedTextEmbedder, BatchedRetriever, search_embeddings
+)
+
+
+class FakeDocumentStore:
+    def __init__(self):
+        self.calls = []
+
+    def search_embeddings(self, query_embeddings, top_k, filters=None):
+        self.calls.append((len(query_embeddings), top_k, filters))
+        return [[Document(content=f'{embedding[0]}-{i}') for i in range(top_k)] for embedding in query_embeddings]
+
+
+class MicroBatcherTests(SimpleTestCase):
+    def test_concurrent_items_share_a_batch(self):
+        """Test items submitted at the same time are processed in one call and fanned back out"""
+        batches = []
+
+        def process_batch(items):
+            batches.append(items)
+            return [item * 2 for item in items]
+
+        batcher = MicroBatcher(process_batch, max_batch_size=8, max_wait=0.2)
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(executor.map(batcher, [1, 2, 3, 4]))
+        self.assertEqual(results, [2, 4, 6, 8])
+        self.assertEqual(len(batches), 1)
+        self.assertEqual(batcher.stats()['mean_batch_size'], 4.0)
+
+    def test_max_batch_size(self):
+        """Test batches never get bigger than max_batch_size"""
+        batches = []
+
+        def process_batch(items):
+            batches.append(len(items))
+            return items
+
+        batcher = MicroBatcher(process_batch, max_batch_size=2, max_wait=0.2)
+        futures = [batcher.submit(item) for item in range(5)]
+        self.assertEqual([future.result() for future in futures], list(range(5)))
+        self.assertTrue(all(size <= 2 for size in batches))
+        self.assertEqual(sum(batches), 5)
+
+    def test_errors_reach_every_caller(self):
+        """Test a failing batch raises in every request it contains"""
+        def process_batch(items):
+            raise RuntimeError('embedding API is down')
+
+        batcher = MicroBatcher(process_batch, max_wait=0.05)
+        futures = [batcher.submit(item) for item in range(3)]
+        for future in futures:
+            with self.assertRaises(RuntimeError):
+                future.result()
+        # the batcher keeps working after a failure
+        batcher.process_batch = lambda items: items
+        self.assertEqual(batcher(7), 7)
+
+    def test_async_callers(self):
+        """Test coroutines awaiting the batcher are batched together too"""
+        batches = []
+
+        def process_batch(items):
+            batches.append(items)
+            return [len(item) for item in items]
+
+        embedder = BatchedTextEmbedder(MicroBatcher(process_batch, max_wait=0.1))
+
+        async def embed_all():
+            return await asyncio.gather(*(embedder.run_async(text=text) for text in ['a', 'bb', 'ccc']))
+
+        results = asyncio.run(embed_all())
+        self.assertEqual([result['embedding'] for result in results], [1, 2, 3])
+        self.assertEqual(len(batches), 1)
+
+
+class BatchedRetrievalTests(SimpleTestCase):
+    def test_search_groups_by_filters_and_top_k(self):
+        """Test one collection query is made per distinct filters and top_k, in request order"""
+        store = FakeDocumentStore()
+        requests = [
+            ([1.0], None, 2),
+            ([2.0], {'field': 'meta.lang', 'operator': '==', 'value': 'ar'}, 2),
+            ([3.0], None, 2),
+        ]
+        results = search_embeddings(store, requests)
+        self.assertEqual([[doc.content for doc in docs] for docs in results],
+                         [['1.0-0', '1.0-1'], ['2.0-0', '2.0-1'], ['3.0-0', '3.0-1']])
+        self.assertEqual(sorted(call[0] for call in store.calls), [1, 2])
+
+    def test_retriever_uses_default_top_k(self):
+        """Test the retriever falls back to its own top_k"""
+        store = FakeDocumentStore()
+        retriever = BatchedRetriever(MicroBatcher(lambda requests: search_embeddings(store, requests)), top_k=3)
+        self.assertEqual(len(retriever.run(query_embedding=[1.0])['documents']), 3)
+        self.assertEqual(len(retriever.run(query_embedding=[1.0], top_k=1)['documents']), 1)
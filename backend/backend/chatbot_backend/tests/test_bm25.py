@@ -0,0 +1,78 @@
+from django.test import SimpleTestCase
+from haystack import Document
+
+from chatbot_backend.services.processing_pipeline.custom.bm25 import (
+    normalize_arabic, tokenize, BM25Index, HybridRetriever
+)
+
+DOCUMENTS = [
+    Document(content='تنص المادة ١٢ من القانون على حقوق المعلمين'),
+    Document(content='يبدأ الفصل الدراسي في شهر سبتمبر'),
+    Document(content='رسوم التسجيل للطلاب الدوليين'),
+    Document(content='The refund takes two weeks'),
+]
+
+
+class ArabicTokenizerTests(SimpleTestCase):
+    def test_normalization(self):
+        """Test diacritics and tatweel are removed and letter variants are folded"""
+        self.assertEqual(normalize_arabic('مُـــدَرِّسَة'), 'مدرسه')
+        self.assertEqual(normalize_arabic('أحمد إلى آخر'), 'احمد الي اخر')
+        self.assertEqual(normalize_arabic('المادة ١٢'), 'الماده 12')
+
+    def test_light_stemming(self):
+        """Test the article and plural affixes are stripped so word forms share a term"""
+        self.assertEqual(tokenize('المعلمون'), tokenize('معلمين'))
+        self.assertEqual(tokenize('والطلاب'), tokenize('الطلاب'))
+        # short words and latin text are left alone
+        self.assertEqual(tokenize('من Refund'), ['من', 'refund'])
+
+
+class BM25IndexTests(SimpleTestCase):
+    def setUp(self):
+        self.index = BM25Index(DOCUMENTS)
+
+    def test_exact_term_match(self):
+        """Test article numbers and names match whatever digits or diacritics the query uses"""
+        results = self.index.search('المادة 12', top_k=2)
+        self.assertEqual(results[0].content, DOCUMENTS[0].content)
+        self.assertGreater(results[0].score, 0)
+
+    def test_only_matching_documents_are_returned(self):
+        """Test documents sharing no term with the query are not returned"""
+        self.assertEqual(self.index.search('كلمة غير موجودة'), [])
+        self.assertEqual(len(self.index.search('refund weeks', top_k=5)), 1)
+
+    def test_rare_terms_rank_higher(self):
+        """Test a rare query term outweighs a common one"""
+        index = BM25Index([Document(content='طالب طالب'), Document(content='طالب منحة'), Document(content='طالب')])
+        self.assertEqual(index.search('طالب منحة', top_k=1)[0].content, 'طالب منحة')
+
+    def test_indexed_documents_are_not_changed(self):
+        """Test search results are copies, concurrent requests never share scores"""
+        result = self.index.search('refund')[0]
+        result.score = 100
+        self.assertIsNone(self.index.documents[3].score)
+        self.assertIsNone(self.index.documents[3].embedding)
+
+
+    def test_filters(self):
+        """Test only the documents matching the filters are returned"""
+        documents = [Document(content='رسوم التسجيل', meta={'collection': 'faq'}),
+                     Document(content='رسوم التسجيل للطلاب', meta={'collection': 'laws'})]
+        index = BM25Index(documents, indexed_fields=['collection'])
+        results = index.search('رسوم التسجيل', filters={'field': 'meta.collection', 'operator': '==', 'value': 'laws'})
+        self.assertEqual([result.content for result in results], ['رسوم التسجيل للطلاب'])
+
+
+class HybridRetrieverTests(SimpleTestCase):
+    def test_fusion(self):
+        """Test lexical matches missed by the dense retriever are added and shared ones rank first"""
+        retriever = HybridRetriever(BM25Index(DOCUMENTS), top_k=3)
+        dense = [Document(id=DOCUMENTS[2].id, content=DOCUMENTS[2].content, score=0.9),
+                 Document(id=DOCUMENTS[1].id, content=DOCUMENTS[1].content, score=0.8)]
+        documents = retriever.run(query='تسجيل الطلاب في المادة ١٢', documents=dense)['documents']
+        self.assertEqual(documents[0].id, DOCUMENTS[2].id)
+        self.assertIn(DOCUMENTS[0].id, [document.id for document in documents])
+        self.assertEqual(len(documents), 3)
+        self.assertEqual(dense[0].score, 0.9)
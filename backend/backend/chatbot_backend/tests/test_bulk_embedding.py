@@ -0,0 +1,105 @@
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+from django.test import SimpleTestCase
+from haystack import Document
+
+from chatbot_backend.services.processing_pipeline.custom.bulk_embedding import (
+    BulkDocumentEmbedder, EmbeddingCheckpoint, make_batches)
+
+
+def fake_embed(texts):
+    return [[float(len(text)), 1.0] for text in texts]
+
+
+class MakeBatchesTests(SimpleTestCase):
+    def test_batches_group_similar_lengths(self):
+        texts = ['a' * 5, 'a' * 50, 'a', 'a' * 40, 'a' * 4]
+        self.assertEqual(make_batches(texts, max_batch_size=2), [[1, 3], [0, 4], [2]])
+
+    def test_batches_respect_max_chars(self):
+        texts = ['a' * 60, 'a' * 50, 'a' * 10, 'a' * 10]
+        self.assertEqual(make_batches(texts, max_batch_size=32, max_batch_chars=70), [[0], [1, 2, 3]])
+
+
+class EmbeddingCheckpointTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.path = self.tmp_dir / 'checkpoint'
+
+    def test_embeddings_survive_reopening(self):
+        """Test embeddings appended past the initial capacity are read back by a new instance"""
+        checkpoint = EmbeddingCheckpoint(self.path, model_id='bge-m3', initial_capacity=2)
+        checkpoint.append(['a', 'b'], [[1.0, 2.0], [3.0, 4.0]])
+        checkpoint.append(['c', 'd', 'e'], [[5.0, 6.0], [7.0, 8.0], [9.0, 10.0]])
+
+        checkpoint = EmbeddingCheckpoint(self.path, model_id='bge-m3')
+        self.assertEqual(len(checkpoint), 5)
+        self.assertIn('c', checkpoint)
+        np.testing.assert_array_equal(checkpoint.get(['e', 'a']), [[9.0, 10.0], [1.0, 2.0]])
+
+    def test_cut_id_line_is_dropped(self):
+        """Test an id whose write was interrupted doesn't count as checkpointed"""
+        checkpoint = EmbeddingCheckpoint(self.path, model_id='bge-m3')
+        checkpoint.append(['a', 'b'], [[1.0, 2.0], [3.0, 4.0]])
+        with open(self.path / 'ids.txt', 'a') as f:
+            f.write('c')
+
+        checkpoint = EmbeddingCheckpoint(self.path, model_id='bge-m3')
+        self.assertEqual(len(checkpoint), 2)
+        checkpoint.append(['c'], [[5.0, 6.0]])
+        checkpoint = EmbeddingCheckpoint(self.path, model_id='bge-m3')
+        np.testing.assert_array_equal(checkpoint.get(['c']), [[5.0, 6.0]])
+
+    def test_other_model_discards_embeddings(self):
+        EmbeddingCheckpoint(self.path, model_id='bge-m3').append(['a'], [[1.0, 2.0]])
+        self.assertEqual(len(EmbeddingCheckpoint(self.path, model_id='other-model')), 0)
+
+    def test_clear(self):
+        checkpoint = EmbeddingCheckpoint(self.path, model_id='bge-m3')
+        checkpoint.append(['a'], [[1.0, 2.0]])
+        checkpoint.clear()
+        self.assertFalse(self.path.exists())
+        self.assertEqual(len(EmbeddingCheckpoint(self.path, model_id='bge-m3')), 0)
+
+
+class BulkDocumentEmbedderTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.documents = [Document(id=str(i), content='x' * (i + 1)) for i in range(10)]
+
+    def test_embeds_every_document(self):
+        embedder = BulkDocumentEmbedder(fake_embed, max_batch_size=3, workers=2)
+        results = embedder.run(self.documents)
+        self.assertEqual([document.embedding for document in results['documents']],
+                         [[float(i + 1), 1.0] for i in range(10)])
+        self.assertEqual(results['meta']['embedded'], 10)
+
+    def test_interrupted_run_resumes_from_the_checkpoint(self):
+        """Test batches finished before a failure are not embedded again"""
+        calls = []
+
+        def failing_embed(texts):
+            calls.append(texts)
+            if len(calls) == 3:
+                raise RuntimeError('embedding server went away')
+            return fake_embed(texts)
+
+        checkpoint = EmbeddingCheckpoint(self.tmp_dir / 'checkpoint', model_id='bge-m3')
+        embedder = BulkDocumentEmbedder(failing_embed, checkpoint=checkpoint, max_batch_size=2, workers=1)
+        with self.assertRaises(RuntimeError):
+            embedder.run(self.documents)
+        self.assertEqual(len(checkpoint), 4)
+
+        calls.clear()
+        checkpoint = EmbeddingCheckpoint(self.tmp_dir / 'checkpoint', model_id='bge-m3')
+        embedder = BulkDocumentEmbedder(fake_embed, checkpoint=checkpoint, max_batch_size=2, workers=1)
+        results = embedder.run(self.documents)
+        self.assertEqual(results['meta']['resumed'], 4)
+        self.assertEqual(results['meta']['embedded'], 6)
+        self.assertEqual([document.embedding for document in results['documents']],
+                         [[float(i + 1), 1.0] for i in range(10)])
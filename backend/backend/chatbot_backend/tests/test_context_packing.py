@@ -0,0 +1,61 @@
+from django.test import SimpleTestCase
+from haystack import Document
+
+from chatbot_backend.services.processing_pipeline.custom.context_packing import TokenCounter, ContextPacker
+
+# without a tokenizer name tokens are estimated as 3 characters each, which keeps the numbers readable
+COUNTER = TokenCounter()
+
+
+def words(count, word='word'):
+    return ' '.join(f'{word}{i}' for i in range(count))
+
+
+class ContextPackerTests(SimpleTestCase):
+    def test_documents_fill_the_budget_by_relevance(self):
+        """Test documents are kept in order until the budget is used, the last one is truncated"""
+        documents = [Document(content='a' * 300), Document(content='b' * 300), Document(content='c' * 300)]
+        packer = ContextPacker(COUNTER, max_context_tokens=250, max_history_tokens=50, min_truncated_tokens=10)
+        result = packer.run(documents=documents, history=['query'])
+        self.assertEqual([document.content[0] for document in result['documents']], ['a', 'b', 'c'])
+        self.assertEqual(len(result['documents'][2].content), (250 - 2 - 200) * 3)
+        self.assertEqual(result['meta']['document_tokens'], 248)
+        # the retrieved documents are not modified
+        self.assertEqual(len(documents[2].content), 300)
+
+    def test_long_documents_are_cut(self):
+        """Test a single document can't take more than max_document_tokens"""
+        packer = ContextPacker(COUNTER, max_document_tokens=20)
+        result = packer.run(documents=[Document(content='x' * 600)], history=['query'])
+        self.assertEqual(COUNTER.count(result['documents'][0].content), 20)
+
+    def test_overlapping_excerpts_are_deduplicated(self):
+        """Test an excerpt mostly contained in a more relevant one is dropped"""
+        text = words(40)
+        documents = [
+            Document(content=text),
+            Document(content=text.rsplit(' ', 2)[0] + ' extra words'),
+            Document(content=words(40, 'other')),
+        ]
+        result = ContextPacker(COUNTER).run(documents=documents, history=['query'])
+        self.assertEqual([document.id for document in result['documents']], [documents[0].id, documents[2].id])
+        self.assertEqual(result['meta']['duplicates'], 1)
+
+    def test_history_keeps_recent_messages(self):
+        """Test older messages are dropped first and the query is always kept"""
+        history = ['o' * 90, 'p' * 90, 'q' * 30]
+        packer = ContextPacker(COUNTER, max_history_tokens=50, min_truncated_tokens=100)
+        result = packer.run(documents=[], history=history)
+        self.assertEqual(result['history'], ['p' * 90, 'q' * 30])
+        self.assertEqual(result['meta']['history_tokens'], 40)
+
+        packer = ContextPacker(COUNTER, max_history_tokens=5)
+        result = packer.run(documents=[], history=history)
+        self.assertEqual(result['history'], ['q' * 30])
+
+    def test_history_budget_counts_against_documents(self):
+        """Test documents only get what the history leaves of max_context_tokens"""
+        packer = ContextPacker(COUNTER, max_context_tokens=100, max_history_tokens=100, min_truncated_tokens=1000)
+        result = packer.run(documents=[Document(content='d' * 150)], history=['h' * 150])
+        self.assertEqual(result['meta']['history_tokens'], 50)
+        self.assertEqual(result['meta']['document_tokens'], 50)
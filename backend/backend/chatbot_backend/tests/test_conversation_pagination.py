@@ -0,0 +1,96 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase, APIClient
+from rest_framework import status
+
+from chatbot_backend.models import User, Conversation, Message
+
+
+class ConversationListQueryTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123',
+            user_type='user'
+        )
+        self.client = APIClient()
+        self.client.login(username='testuser', password='testpass123')
+        self.conversations_url = '/api/conversations/'
+        self.messages_url = lambda conversation_id: f'/api/conversations/{conversation_id}/messages/'
+
+    def create_conversations(self, count, messages_per_conversation=2):
+        conversations = []
+        for i in range(count):
+            conversation = Conversation.objects.create(user=self.user, title=f'Conversation {i}')
+            for j in range(messages_per_conversation):
+                Message.objects.create(conversation=conversation, role='user', content=f'message {j}')
+            conversations.append(conversation)
+        return conversations
+
+    def count_list_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.conversations_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(queries), response
+
+    def test_message_count_query_count_is_constant(self):
+        """Test listing conversations doesn't run one COUNT query per conversation"""
+        self.create_conversations(2)
+        few_queries, _ = self.count_list_queries()
+        self.create_conversations(20)
+        many_queries, response = self.count_list_queries()
+        self.assertEqual(few_queries, many_queries)
+        self.assertTrue(all(item['message_count'] == 2 for item in response.data))
+
+    def test_created_conversation_has_message_count(self):
+        """Test create and retrieve still return message_count"""
+        response = self.client.post(self.conversations_url, {'title': 'New'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['message_count'], 0)
+
+        conversation = self.create_conversations(1, messages_per_conversation=3)[0]
+        response = self.client.get(f'{self.conversations_url}{conversation.id}/')
+        self.assertEqual(response.data['message_count'], 3)
+
+    def test_conversations_cursor_pagination(self):
+        """Test ?page_size= pages through conversations without repeating any"""
+        conversations = self.create_conversations(5, messages_per_conversation=0)
+        response = self.client.get(self.conversations_url, {'page_size': 2})
+        seen = [item['id'] for item in response.data['results']]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            seen += [item['id'] for item in response.data['results']]
+        self.assertEqual(sorted(seen), sorted(c.id for c in conversations))
+        self.assertEqual(len(seen), len(set(seen)))
+
+    def test_conversation_renamed_while_paging_is_not_skipped(self):
+        """Test pages and the unpaginated list share one order, which a conversation saved meanwhile keeps"""
+        conversations = self.create_conversations(4, messages_per_conversation=0)
+        response = self.client.get(self.conversations_url, {'page_size': 2})
+        seen = [item['id'] for item in response.data['results']]
+        self.assertEqual(seen, [conversations[3].id, conversations[2].id])
+        # renaming the oldest conversation moves its updated_at, not its place
+        self.client.patch(f'{self.conversations_url}{conversations[0].id}/', {'title': 'Renamed'}, format='json')
+        response = self.client.get(response.data['next'])
+        seen += [item['id'] for item in response.data['results']]
+        self.assertEqual(seen, [conversation.id for conversation in reversed(conversations)])
+        self.assertEqual([item['id'] for item in self.client.get(self.conversations_url).data], seen)
+
+    def test_unpaginated_list_is_unchanged(self):
+        """Test requests without pagination parameters still get a plain list"""
+        self.create_conversations(3)
+        response = self.client.get(self.conversations_url)
+        self.assertIsInstance(response.data, list)
+        self.assertEqual(len(response.data), 3)
+
+    def test_messages_cursor_pagination(self):
+        """Test message pages start with the newest messages"""
+        conversation = self.create_conversations(1, messages_per_conversation=5)[0]
+        response = self.client.get(self.messages_url(conversation.id), {'page_size': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['content'] for item in response.data['results']], ['message 4', 'message 3'])
+        self.assertIsNotNone(response.data['next'])
+
+        response = self.client.get(self.messages_url(conversation.id))
+        self.assertEqual(len(response.data), 5)
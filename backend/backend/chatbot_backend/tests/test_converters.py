@@ -0,0 +1,106 @@
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from chatbot_backend.services.processing_pipeline.custom import converters
+from chatbot_backend.services.processing_pipeline.custom.converters import PdfToSingleDocumentConverter
+
+# fake pdfs: path -> the "rendered" pixel value of every page
+PAGES = {'a.pdf': [1, 2, 3], 'b.pdf': [4, 2]}
+
+
+def fake_rasterize_page(pdf_path, page_number, dpi):
+    return np.full((2, 2), PAGES[pdf_path][page_number - 1], dtype=np.uint8)
+
+
+class PdfConverterTests(SimpleTestCase):
+    def setUp(self):
+        self.cache_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_path)
+        self.ocr_image = mock.Mock(side_effect=lambda image, language: f"page\n{image[0, 0]}\n\n")
+        for patcher in (
+            mock.patch.object(converters, 'count_pdf_pages', lambda pdf_path: len(PAGES[pdf_path])),
+            mock.patch.object(converters, 'rasterize_page', fake_rasterize_page),
+            mock.patch.object(converters, 'ocr_image', self.ocr_image),
+            mock.patch.object(PdfToSingleDocumentConverter, 'validate'),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_iter_pages_yields_every_page_in_order(self):
+        converter = PdfToSingleDocumentConverter(workers=0)
+        pages = list(converter.iter_pages(['a.pdf', 'b.pdf']))
+
+        self.assertEqual([page.content for page in pages], ['page 1', 'page 2', 'page 3', 'page 4', 'page 2'])
+        self.assertEqual([(page.meta['file_path'], page.meta['page_number']) for page in pages],
+                         [('a.pdf', 1), ('a.pdf', 2), ('a.pdf', 3), ('b.pdf', 1), ('b.pdf', 2)])
+
+    def test_run_joins_pages_into_one_document_per_pdf(self):
+        converter = PdfToSingleDocumentConverter(workers=0)
+        documents = converter.run(['a.pdf', 'b.pdf'])['documents']
+
+        self.assertEqual([document.content for document in documents], ['page 1\n\npage 2\n\npage 3', 'page 4\n\npage 2'])
+        self.assertEqual([document.meta['total_pages'] for document in documents], [3, 2])
+
+    def test_pages_with_the_same_image_are_ocred_once(self):
+        converter = PdfToSingleDocumentConverter(workers=0, cache_path=self.cache_path)
+        converter.run(['a.pdf', 'b.pdf'])
+        self.assertEqual(self.ocr_image.call_count, 4)
+
+        documents = converter.run(['a.pdf', 'b.pdf'])['documents']
+        self.assertEqual(self.ocr_image.call_count, 4)
+        self.assertEqual(documents[1].content, 'page 4\n\npage 2')
+
+    def test_cache_is_per_language(self):
+        converter = PdfToSingleDocumentConverter(workers=0, cache_path=self.cache_path)
+        converter.run(['b.pdf'], language='ara')
+        converter.run(['b.pdf'], language='eng')
+        self.assertEqual(self.ocr_image.call_count, 4)
+
+    def test_pool_is_shared_by_runs_until_closed(self):
+        """Test the OCR pool is started once for every file of an indexer run, and again after close()"""
+        pools = []
+
+        def make_pool(max_workers, mp_context=None, initializer=None):
+            pools.append(ThreadPoolExecutor(max_workers=max_workers))
+            return pools[-1]
+
+        converter = PdfToSingleDocumentConverter(workers=2)
+        with mock.patch.object(converters, 'ProcessPoolExecutor', side_effect=make_pool):
+            self.assertEqual(converter.run([])['documents'], [])
+            self.assertEqual(pools, [])
+            converter.run(['a.pdf'])
+            documents = converter.run(['b.pdf'])['documents']
+            self.assertEqual(documents[0].meta['total_pages'], 2)
+            self.assertLess(documents[0].content.index('4'), documents[0].content.index('2'))
+            self.assertEqual(len(pools), 1)
+            converter.close()
+            self.assertTrue(pools[0]._shutdown)
+            converter.run(['a.pdf'])
+            self.assertEqual(len(pools), 2)
+            converter.close()
+
+    def test_pages_in_flight_are_bounded(self):
+        converter = PdfToSingleDocumentConverter(workers=2, pages_in_flight=1)
+        lock = threading.Lock()
+        running = {'now': 0, 'max': 0}
+
+        def ocr_page(pdf_path, page_number, dpi, language, cache_path=None):
+            with lock:
+                running['now'] += 1
+                running['max'] = max(running['max'], running['now'])
+            threading.Event().wait(0.01)
+            with lock:
+                running['now'] -= 1
+            return str(page_number)
+
+        with mock.patch.object(converters, 'ocr_page', ocr_page), ThreadPoolExecutor(max_workers=8) as executor:
+            texts = list(converter._map_pages(executor, 'a.pdf', 20, 300, 'ara'))
+
+        self.assertEqual(texts, [str(page_number) for page_number in range(1, 21)])
+        self.assertLessEqual(running['max'], 2)
@@ -0,0 +1,121 @@
+import asyncio
+import shutil
+import sqlite3
+import tempfile
+from pathlib import Path
+from typing import List
+
+from django.test import SimpleTestCase
+from haystack import component
+
+from chatbot_backend.services.processing_pipeline.custom.embedding_cache import EmbeddingCache, CachedTextEmbedder
+from chatbot_backend.tests.helpers import FakeClock
+
+MODEL = 'sayed0am/arabic-english-bge-m3'
+
+
+@component
+class CountingEmbedder:
+    def __init__(self):
+        self.calls = 0
+
+    @component.output_types(embedding=List[float])
+    def run(self, text: str):
+        self.calls += 1
+        return {'embedding': [float(len(text)), 0.5]}
+
+
+class EmbeddingCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+
+    def test_normalized_text_shares_entry(self):
+        """Test queries that differ only in case and spacing hit the same entry"""
+        cache = EmbeddingCache()
+        cache.put(MODEL, 'Hello   World ', [1.0, 2.0])
+        self.assertEqual(cache.get(MODEL, 'hello world'), [1.0, 2.0])
+        self.assertIsNone(cache.get('other-model', 'hello world'))
+
+    def test_lru_eviction(self):
+        """Test the least recently used entry is evicted when the cache is full"""
+        cache = EmbeddingCache(max_size=2)
+        cache.put(MODEL, 'a', [1.0])
+        cache.put(MODEL, 'b', [2.0])
+        cache.get(MODEL, 'a')
+        cache.put(MODEL, 'c', [3.0])
+        self.assertIsNone(cache.get(MODEL, 'b'))
+        self.assertEqual(cache.get(MODEL, 'a'), [1.0])
+        self.assertEqual(cache.get(MODEL, 'c'), [3.0])
+
+    def test_ttl_expiry(self):
+        """Test entries older than the ttl are not returned"""
+        clock = FakeClock(1000.0)
+        cache = EmbeddingCache(ttl=60, clock=clock)
+        cache.put(MODEL, 'a', [1.0])
+        clock.now += 59
+        self.assertEqual(cache.get(MODEL, 'a'), [1.0])
+        clock.now += 2
+        self.assertIsNone(cache.get(MODEL, 'a'))
+
+    def test_disk_tier_survives_restart(self):
+        """Test a new cache instance finds entries written by a previous one"""
+        disk_path = self.tmp_dir / 'embeddings.sqlite3'
+        EmbeddingCache(disk_path=disk_path).put(MODEL, 'a', [0.25, 0.5])
+        cache = EmbeddingCache(disk_path=disk_path)
+        self.assertEqual(cache.get(MODEL, 'a'), [0.25, 0.5])
+        self.assertEqual(cache.stats()['disk_hits'], 1)
+
+    def test_disk_tier_is_pruned(self):
+        """Test expired rows and the oldest ones beyond disk_max_size are deleted from disk"""
+        clock = FakeClock(1000.0)
+        disk_path = self.tmp_dir / 'embeddings.sqlite3'
+        cache = EmbeddingCache(ttl=100, disk_path=disk_path, disk_max_size=3, prune_every=1, clock=clock)
+        cache.put(MODEL, 'old', [1.0])
+        clock.now += 150
+        for text in ['a', 'b', 'c', 'd']:
+            cache.put(MODEL, text, [1.0])
+            clock.now += 1
+        keys = {key for key, in cache._db.execute("SELECT key FROM embeddings")}
+        self.assertEqual(keys, {EmbeddingCache.make_key(MODEL, text) for text in ['b', 'c', 'd']})
+
+    def test_disk_errors_are_cache_misses(self):
+        """Test a locked or broken sqlite file doesn't fail the lookup or the write"""
+        cache = EmbeddingCache(disk_path=self.tmp_dir / 'embeddings.sqlite3')
+        cache._db.execute("DROP TABLE embeddings")
+        cache.put(MODEL, 'a', [1.0])
+        # still served from memory
+        self.assertEqual(cache.get(MODEL, 'a'), [1.0])
+        self.assertIsNone(cache.get(MODEL, 'b'))
+        self.assertEqual(cache.stats()['disk_errors'], 2)
+
+    def test_locked_database_is_a_cache_miss(self):
+        disk_path = self.tmp_dir / 'embeddings.sqlite3'
+        cache = EmbeddingCache(disk_path=disk_path)
+        other_worker = sqlite3.connect(str(disk_path))
+        self.addCleanup(other_worker.close)
+        other_worker.execute("BEGIN EXCLUSIVE")
+        self.assertIsNone(cache.get(MODEL, 'a'))
+        self.assertEqual(cache.stats()['disk_errors'], 1)
+
+    def test_hit_rate(self):
+        """Test the hit rate counts hits over all lookups"""
+        cache = EmbeddingCache()
+        cache.get(MODEL, 'a')
+        cache.put(MODEL, 'a', [1.0])
+        cache.get(MODEL, 'a')
+        cache.get(MODEL, 'a')
+        self.assertAlmostEqual(cache.hit_rate, 2 / 3)
+
+    def test_cached_embedder_component(self):
+        """Test the component only calls the wrapped embedder on misses"""
+        embedder = CountingEmbedder()
+        cached = CachedTextEmbedder(embedder, EmbeddingCache(), MODEL)
+        first = cached.run(text='مرحباً')
+        second = cached.run(text=' مرحباً ')
+        third = asyncio.run(cached.run_async(text='مرحباً'))
+        self.assertEqual(embedder.calls, 1)
+        self.assertEqual(first['embedding'], second['embedding'])
+        self.assertEqual(first['embedding'], third['embedding'])
+        self.assertFalse(first['meta']['cache_hit'])
+        self.assertTrue(second['meta']['cache_hit'])
@@ -0,0 +1,64 @@
+from unittest import mock
+
+from django.test import TestCase, AsyncClient
+from rest_framework.test import APIClient
+
+from chatbot_backend.models import User, Conversation, Message
+from chatbot_backend.services import query_processing
+from chatbot_backend.services.history_cache import ConversationHistoryCache
+
+
+class GenerationFailureTests(TestCase):
+    """A failed generation drops the user message from the database and from the buffered history"""
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123',
+            user_type='user'
+        )
+        self.conversation = Conversation.objects.create(user=self.user, title='Failures')
+        Message.objects.create(conversation=self.conversation, role='user', content='first question')
+        self.messages_url = f'/api/conversations/{self.conversation.id}/messages/'
+
+        self.history_cache = ConversationHistoryCache(history_length=3)
+        self.pipeline = mock.Mock()
+        self.pipeline.generate_response.side_effect = RuntimeError('LLM down')
+        self.pipeline.agenerate_response = mock.AsyncMock(side_effect=RuntimeError('LLM down'))
+        self.pipeline.stream_response.side_effect = RuntimeError('LLM down')
+        for patcher in [mock.patch.object(query_processing, 'history_cache', self.history_cache),
+                        mock.patch.object(query_processing, 'get_response_pipeline', return_value=self.pipeline)]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        # buffered, as after an answered turn
+        query_processing.get_user_messages(self.conversation)
+
+    def assert_message_discarded(self):
+        self.assertEqual(list(Message.objects.values_list('content', flat=True)), ['first question'])
+        self.assertIsNone(self.history_cache.get(self.conversation.id))
+        self.assertEqual(query_processing.get_user_messages(self.conversation), ['first question'])
+
+    def test_create(self):
+        client = APIClient(raise_request_exception=False)
+        client.login(username='testuser', password='testpass123')
+        response = client.post(self.messages_url, {'content': 'failing question'}, format='json')
+        self.assertEqual(response.status_code, 500)
+        self.assert_message_discarded()
+
+    def test_stream(self):
+        client = APIClient()
+        client.login(username='testuser', password='testpass123')
+        response = client.post(self.messages_url + 'stream/', {'content': 'failing question'}, format='json')
+        body = b''.join(response.streaming_content).decode()
+        self.assertIn('event: error', body)
+        self.assert_message_discarded()
+
+    async def test_async_create(self):
+        client = AsyncClient(raise_request_exception=False)
+        await client.alogin(username='testuser', password='testpass123')
+        response = await client.post(self.messages_url + 'async/', {'content': 'failing question'},
+                                     content_type='application/json')
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual([content async for content in Message.objects.values_list('content', flat=True)],
+                         ['first question'])
+        self.assertIsNone(self.history_cache.get(self.conversation.id))
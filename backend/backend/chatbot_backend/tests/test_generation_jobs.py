@@ -0,0 +1,162 @@
+import json
+from datetime import timedelta
+from unittest import mock
+
+from django.conf import settings
+from django.utils import timezone
+
+from rest_framework.test import APITestCase, APIClient
+from rest_framework import status
+
+from chatbot_backend.models import User, Conversation, Message, GenerationJob
+from chatbot_backend.services import generation_jobs, job_workers
+from chatbot_backend.services.job_queue import JobQueue
+from chatbot_backend.views.job_views import GenerationJobView
+
+
+class GenerationJobTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123',
+            user_type='user'
+        )
+        self.other_user = User.objects.create_user(
+            username='otheruser',
+            email='other@example.com',
+            password='otherpass123',
+            user_type='user'
+        )
+        self.conversation = Conversation.objects.create(user=self.user, title='Background')
+        self.other_conversation = Conversation.objects.create(user=self.other_user, title='Other')
+
+        # no worker threads in tests, jobs are run with run_once
+        self.queue = JobQueue(GenerationJob, generation_jobs.run_generation_job, workers=0,
+                              max_queued=10, max_queued_per_user=2, max_running_per_user=1)
+        patcher = mock.patch.object(generation_jobs, '_generation_queue', self.queue)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.client = APIClient()
+        self.client.login(username='testuser', password='testpass123')
+        self.messages_url = f'/api/conversations/{self.conversation.id}/messages/?background=1'
+
+    def queue_job(self, conversation, content='a question'):
+        user_message = Message.objects.create(conversation=conversation, role='user', content=content)
+        return generation_jobs.enqueue_generation(conversation, user_message)
+
+    @mock.patch('chatbot_backend.services.generation_jobs.generate_response', return_value='an answer')
+    def test_background_create_and_poll(self, generate_response):
+        """Test a background message returns 202 at once and its job can be polled until done"""
+        response = self.client.post(self.messages_url, {'content': 'a question'})
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['status'], 'queued')
+        self.assertEqual(response.data['user_message']['content'], 'a question')
+        generate_response.assert_not_called()
+
+        job_url = f"/api/jobs/{response.data['id']}/"
+        self.assertEqual(self.client.get(job_url).data['status'], 'queued')
+
+        self.queue.run_once()
+        response = self.client.get(job_url)
+        self.assertEqual(response.data['status'], 'done')
+        self.assertEqual(response.data['assistant_message']['content'], 'an answer')
+
+    @mock.patch('chatbot_backend.services.generation_jobs.generate_response', side_effect=RuntimeError('LLM is down'))
+    def test_failed_job(self, generate_response):
+        """Test a failing generation marks the job failed with its error and drops the unanswered message"""
+        job = self.queue_job(self.conversation)
+        user_message_id = job.user_message_id
+        self.queue.run_once()
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(job.error, 'LLM is down')
+        self.assertIsNotNone(job.finished_at)
+        self.assertIsNone(job.user_message)
+        self.assertFalse(Message.objects.filter(id=user_message_id).exists())
+        response = self.client.get(f'/api/jobs/{job.id}/')
+        self.assertEqual((response.data['status'], response.data['user_message']), ('failed', None))
+
+    def test_backpressure(self):
+        """Test users get 429 once they have max_queued_per_user pending jobs"""
+        for _ in range(2):
+            self.assertEqual(self.client.post(self.messages_url, {'content': 'q'}).status_code, status.HTTP_202_ACCEPTED)
+        response = self.client.post(self.messages_url, {'content': 'q'})
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', response)
+        # refused messages are not saved
+        self.assertEqual(Message.objects.filter(conversation=self.conversation).count(), 2)
+
+    def test_fairness(self):
+        """Test a user with a running job doesn't get a second one before other users are served"""
+        first = self.queue_job(self.conversation)
+        second = self.queue_job(self.conversation)
+        other = self.queue_job(self.other_conversation)
+
+        self.assertEqual(self.queue.claim_next().id, first.id)
+        self.assertEqual(self.queue.claim_next().id, other.id)
+        # max_running_per_user reached for both users
+        self.assertIsNone(self.queue.claim_next())
+        GenerationJob.objects.filter(id=first.id).update(status='done')
+        self.assertEqual(self.queue.claim_next().id, second.id)
+
+    def test_claim_counts_running_jobs(self):
+        """Test a job is not claimed once its user reached max_running_per_user, whatever the caller counted"""
+        first = self.queue_job(self.conversation)
+        second = self.queue_job(self.conversation)
+        # another worker claimed the first job after this one listed the candidates
+        self.assertTrue(self.queue.claim(first.id, self.user.id))
+        self.assertFalse(self.queue.claim(second.id, self.user.id))
+        self.assertFalse(self.queue.claim(first.id, self.user.id))
+        self.assertEqual(GenerationJob.objects.get(id=second.id).status, 'queued')
+        self.queue.max_running_per_user = 2
+        self.assertTrue(self.queue.claim(second.id, self.user.id))
+
+    def test_workers_start_with_the_server(self):
+        """Test wsgi.py / asgi.py start the workers of the queues in use, jobs queued before a restart don't wait for a new one"""
+        for mode, started in [('sync', ['ingestion']), ('background', ['generation', 'ingestion'])]:
+            queues = {name: mock.Mock() for name in job_workers.QUEUES}
+            with mock.patch.dict(job_workers.QUEUES, {name: (lambda queue=queue: queue) for name, queue in queues.items()}), \
+                    mock.patch.dict(settings.GENERATION_QUEUE, {'mode': mode}):
+                job_workers.start_job_workers()
+            self.assertEqual(sorted(name for name, queue in queues.items() if queue.start.called), started)
+
+    def test_stale_jobs_are_requeued_periodically(self):
+        """Test jobs left running by a dead process are queued again, at most every stale_after"""
+        job = self.queue_job(self.conversation)
+        GenerationJob.objects.filter(id=job.id).update(status='running', started_at=timezone.now() - timedelta(hours=1))
+        self.queue.requeue_stale_if_due()
+        self.assertEqual(GenerationJob.objects.get(id=job.id).status, 'running')
+        self.queue._requeued_at -= self.queue.stale_after
+        self.queue.requeue_stale_if_due()
+        self.assertEqual(GenerationJob.objects.get(id=job.id).status, 'queued')
+
+    def test_job_events_timeout(self):
+        """Test the events stream of a job still queued ends after stream_timeout with the URL to poll"""
+        job = self.queue_job(self.conversation)
+        with mock.patch.object(GenerationJobView, 'stream_timeout', 0.05), \
+                mock.patch.object(GenerationJobView, 'poll_interval', 0.01):
+            response = self.client.get(f'/api/jobs/{job.id}/events/', HTTP_ACCEPT='text/event-stream')
+            body = b''.join(response.streaming_content).decode()
+        frames = [frame.split('\n') for frame in body.strip().split('\n\n')]
+        self.assertEqual([frame[0] for frame in frames], ['event: status', 'event: timeout'])
+        timeout = json.loads(frames[-1][1][len('data: '):])
+        self.assertEqual(timeout['status'], 'queued')
+        self.assertTrue(timeout['poll_url'].endswith(f'/api/jobs/{job.id}/'))
+
+    @mock.patch('chatbot_backend.services.generation_jobs.generate_response', return_value='an answer')
+    def test_job_events(self, generate_response):
+        """Test the events endpoint pushes the result of a finished job"""
+        job = self.queue_job(self.conversation)
+        self.queue.run_once()
+        response = self.client.get(f'/api/jobs/{job.id}/events/', HTTP_ACCEPT='text/event-stream')
+        body = b''.join(response.streaming_content).decode()
+        frames = [frame.split('\n') for frame in body.strip().split('\n\n')]
+        self.assertEqual(frames[-1][0], 'event: done')
+        self.assertEqual(json.loads(frames[-1][1][len('data: '):])['content'], 'an answer')
+
+    def test_other_user_job_is_hidden(self):
+        """Test users cannot see other users' jobs"""
+        job = self.queue_job(self.other_conversation)
+        self.assertEqual(self.client.get(f'/api/jobs/{job.id}/').status_code, status.HTTP_404_NOT_FOUND)
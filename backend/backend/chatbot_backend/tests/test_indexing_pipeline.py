@@ -0,0 +1,207 @@
+import shutil
+import tempfile
+from pathlib import Path
+from typing import List
+from unittest import mock
+
+from django.test import SimpleTestCase
+from haystack import component, Document
+from haystack.document_stores.in_memory import InMemoryDocumentStore
+
+from chatbot_backend.services.processing_pipeline import indexing_pipeline
+from chatbot_backend.services.processing_pipeline.indexing_pipeline import IncrementalIndexer, read_index_manifest
+from chatbot_backend.services.processing_pipeline.custom.bulk_embedding import BulkDocumentEmbedder
+from chatbot_backend.services.processing_pipeline.custom.numpy_store import NumpyDocumentStore
+
+
+@component
+class CountingDocumentEmbedder:
+    def __init__(self):
+        self.embedded = []
+
+    @component.output_types(documents=List[Document])
+    def run(self, documents: List[Document]):
+        self.embedded.extend(document.content for document in documents)
+        for document in documents:
+            document.embedding = [float(len(document.content)), 1.0]
+        return {'documents': documents}
+
+
+# the default sentence splitter needs nltk, one chunk per line keeps the tests readable
+INDEXING_CONFIG = {'split_by': 'line', 'split_length': 1, 'split_overlap': 0}
+
+
+@mock.patch.dict(indexing_pipeline.PROCESSING_CONFIG['indexing_config'], INDEXING_CONFIG)
+class IncrementalIndexerTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.documents_path = self.tmp_dir / 'documents'
+        self.vdb_path = self.tmp_dir / 'vectordb'
+        self.documents_path.mkdir()
+        self.vdb_path.mkdir()
+        self.store = InMemoryDocumentStore()
+        self.embedder = CountingDocumentEmbedder()
+        self.indexer = None
+
+    def write(self, name, *passages):
+        path = self.documents_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text('\n'.join(passages), encoding='utf-8')
+
+    def update(self, **kwargs):
+        if self.indexer is None:
+            with mock.patch.object(indexing_pipeline, 'build_document_embedder', return_value=self.embedder):
+                self.indexer = IncrementalIndexer(self.store, self.documents_path, self.vdb_path)
+        self.embedder.embedded.clear()
+        return self.indexer.update(**kwargs)
+
+    def contents(self):
+        return sorted(document.content.strip() for document in self.store.filter_documents())
+
+    def test_first_run_indexes_everything(self):
+        """Test every chunk of every file is embedded and written, with its source"""
+        self.write('a.txt', 'first passage', 'second passage')
+        self.write('sub/b.txt', 'third passage')
+        stats = self.update()
+        self.assertEqual(stats['indexed_files'], 2)
+        self.assertEqual(stats['embedded_chunks'], 3)
+        self.assertEqual(self.contents(), ['first passage', 'second passage', 'third passage'])
+        sources = {document.meta['source'] for document in self.store.filter_documents()}
+        self.assertEqual(sources, {'a.txt', 'sub/b.txt'})
+
+    def test_unchanged_files_are_skipped(self):
+        """Test a second run with no changes embeds nothing"""
+        self.write('a.txt', 'first passage')
+        self.update()
+        stats = self.update()
+        self.assertEqual(stats['unchanged_files'], 1)
+        self.assertEqual(stats['indexed_files'], 0)
+        self.assertEqual(self.embedder.embedded, [])
+
+    def test_changed_file_only_embeds_new_chunks(self):
+        """Test editing a file embeds its new chunks and deletes the ones that are gone"""
+        self.write('a.txt', 'first passage', 'second passage', 'third passage')
+        self.update()
+        self.write('a.txt', 'first passage', 'edited passage', 'third passage')
+        stats = self.update()
+        self.assertEqual([text.strip() for text in self.embedder.embedded], ['edited passage'])
+        self.assertEqual(stats['deleted_chunks'], 1)
+        self.assertEqual(self.contents(), ['edited passage', 'first passage', 'third passage'])
+
+    def test_removed_file_chunks_are_deleted(self):
+        """Test the chunks of a deleted file leave the store and the manifest"""
+        self.write('a.txt', 'first passage')
+        self.write('b.txt', 'second passage')
+        self.update()
+        (self.documents_path / 'b.txt').unlink()
+        stats = self.update()
+        self.assertEqual(stats['removed_files'], 1)
+        self.assertEqual(self.contents(), ['first passage'])
+        self.assertEqual(list(read_index_manifest(self.vdb_path)['files']), ['a.txt'])
+
+    def test_numpy_store_saves_once_per_update(self):
+        """Test the files of an update are written to a NumpyDocumentStore as one generation"""
+        self.store = NumpyDocumentStore(self.vdb_path / 'store')
+        for name in ('a.txt', 'b.txt', 'c.txt'):
+            self.write(name, f'{name} first passage', f'{name} second passage')
+        self.update()
+        self.assertEqual(self.store._state.generation, 1)
+        self.assertEqual(len(self.contents()), 6)
+        self.write('a.txt', 'a.txt edited passage')
+        (self.documents_path / 'b.txt').unlink()
+        self.update()
+        # the changed file, then the removed one
+        self.assertEqual(self.store._state.generation, 3)
+        self.assertEqual(self.contents(), ['a.txt edited passage', 'c.txt first passage', 'c.txt second passage'])
+
+    def test_update_stops_the_ocr_pool(self):
+        """Test the pdf converter's pool is closed once the update is done, even when it failed"""
+        self.write('a.txt', 'first passage')
+        self.update()
+        converter = self.indexer.pipeline.get_component('pdf_converter')
+        with mock.patch.object(converter, 'close') as close:
+            self.update()
+            close.assert_called_once_with()
+            with mock.patch.object(self.indexer, 'scan', side_effect=OSError('disk gone')):
+                with self.assertRaises(OSError):
+                    self.update()
+            self.assertEqual(close.call_count, 2)
+
+    def test_prune_deletes_unknown_chunks(self):
+        """Test --prune removes chunks no source file accounts for"""
+        self.store.write_documents([Document(content='from the notebook')])
+        self.write('a.txt', 'first passage')
+        self.update()
+        self.assertEqual(len(self.contents()), 2)
+        stats = self.update(prune=True)
+        self.assertEqual(stats['deleted_chunks'], 1)
+        self.assertEqual(self.contents(), ['first passage'])
+
+    def test_sources_limit_the_update(self):
+        """Test an update limited to some files leaves the others alone, even removed ones"""
+        self.write('a.txt', 'first passage')
+        self.write('b.txt', 'second passage')
+        self.update()
+        (self.documents_path / 'b.txt').unlink()
+        self.write('a.txt', 'edited passage')
+        self.write('c.txt', 'third passage')
+        stats = self.update(sources=['c.txt'])
+        self.assertEqual(stats['indexed_files'], 1)
+        self.assertEqual(stats['removed_files'], 0)
+        self.assertEqual(self.contents(), ['first passage', 'second passage', 'third passage'])
+
+    def test_interrupted_update_resumes_embedding(self):
+        """Test chunks embedded before a failure are taken from the checkpoint by the next update"""
+        calls = []
+        fail_at = [2]
+
+        def embed(texts):
+            calls.append(texts)
+            if len(calls) == fail_at[0]:
+                raise RuntimeError('embedding server went away')
+            return [[float(len(text)), 1.0] for text in texts]
+
+        self.write('a.txt', 'first passage', 'second passage', 'third passage')
+        with mock.patch.object(indexing_pipeline, 'build_document_embedder',
+                               lambda checkpoint: BulkDocumentEmbedder(embed, checkpoint, max_batch_size=1, workers=1)):
+            indexer = IncrementalIndexer(self.store, self.documents_path, self.vdb_path)
+        with self.assertRaises(RuntimeError):
+            indexer.update()
+        self.assertEqual(self.contents(), [])
+
+        calls.clear()
+        fail_at[0] = None
+        stats = indexer.update()
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(stats['embedded_chunks'], 3)
+        self.assertEqual(stats['resumed_chunks'], 1)
+        self.assertEqual(self.contents(), ['first passage', 'second passage', 'third passage'])
+        self.assertFalse((self.vdb_path / indexing_pipeline.EMBEDDING_CHECKPOINT_NAME).exists())
+
+    def test_chunks_are_tagged(self):
+        """Test chunks carry their source, file type, collection and language"""
+        self.write('a.txt', 'first passage', 'المادة الأولى')
+        self.write('faq/b.txt', 'second passage')
+        self.update()
+        tags = {document.content.strip(): {key: document.meta[key] for key in ('file_type', 'collection', 'language')}
+                for document in self.store.filter_documents()}
+        self.assertEqual(tags, {
+            'first passage': {'file_type': 'text', 'collection': 'default', 'language': 'eng'},
+            'المادة الأولى': {'file_type': 'text', 'collection': 'default', 'language': 'ara'},
+            'second passage': {'file_type': 'text', 'collection': 'faq', 'language': 'eng'},
+        })
+
+    def test_chunks_indexed_before_tagging_are_tagged(self):
+        """Test untagged chunks get their tags on the next update without being embedded again"""
+        self.store.write_documents([Document(id='old', content='from the notebook', embedding=[1.0, 2.0],
+                                             meta={'file_path': '/content/132164a.pdf', 'language': 'ara'})])
+        stats = self.update()
+        self.assertEqual(stats['retagged_chunks'], 1)
+        self.assertEqual(self.embedder.embedded, [])
+        document = self.store.filter_documents()[0]
+        self.assertEqual(document.meta['source'], '132164a.pdf')
+        self.assertEqual(document.meta['file_type'], 'pdf')
+        self.assertEqual(document.meta['language'], 'eng')
+        self.assertEqual(document.embedding, [1.0, 2.0])
+        self.assertEqual(self.update()['retagged_chunks'], 0)
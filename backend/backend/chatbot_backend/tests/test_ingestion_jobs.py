@@ -0,0 +1,195 @@
+import hashlib
+import shutil
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+from django.core.files.uploadedfile import SimpleUploadedFile, TemporaryUploadedFile
+from django.test import override_settings
+from rest_framework.test import APITestCase, APIClient
+from rest_framework import status
+
+from chatbot_backend.models import User, IngestionJob
+from chatbot_backend.services import ingestion_jobs
+from chatbot_backend.services.job_queue import JobQueue
+from chatbot_backend.services.processing_pipeline import knowledge_bases as knowledge_bases_module
+from chatbot_backend.services.processing_pipeline.config import PROCESSING_CONFIG, get_response_config
+from chatbot_backend.services.processing_pipeline.knowledge_bases import KnowledgeBaseRegistry
+from chatbot_backend.services.processing_pipeline.registry import LazyRegistry
+
+UPDATE_INDEX = 'chatbot_backend.services.processing_pipeline.indexing_pipeline.update_index'
+INDEX_STATS = {'unchanged_files': 0, 'indexed_files': 1, 'removed_files': 0, 'embedded_chunks': 12, 'deleted_chunks': 0}
+
+
+def upload_source(name, content):
+    return f"uploads/{hashlib.sha256(content).hexdigest()[:16]}/{name}"
+
+
+class IngestionJobTests(APITestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user(
+            username='staffuser',
+            email='staff@example.com',
+            password='staffpass123',
+            is_staff=True
+        )
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123',
+            user_type='user'
+        )
+
+        self.documents_path = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.documents_path)
+        patcher = mock.patch.dict(PROCESSING_CONFIG['indexing_config'], {'documents_path': self.documents_path})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        # no worker threads in tests, jobs are run with run_once
+        self.queue = JobQueue(IngestionJob, ingestion_jobs.run_ingestion_job, workers=0,
+                              max_queued=10, max_queued_per_user=2, max_running_per_user=1)
+        patcher = mock.patch.object(ingestion_jobs, '_ingestion_queue', self.queue)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.client = APIClient()
+        self.client.login(username='staffuser', password='staffpass123')
+        self.url = '/api/documents/'
+
+    def upload(self, name='notes.txt', content=b'first line\nsecond line'):
+        return self.client.post(self.url, {'files': [SimpleUploadedFile(name, content)]}, format='multipart')
+
+    @mock.patch(UPDATE_INDEX, return_value=INDEX_STATS)
+    def test_upload_is_stored_and_indexed_in_background(self, update_index):
+        """Test an upload is written to the documents directory and indexed by a queued job"""
+        with mock.patch.object(ingestion_jobs, 'store_upload', wraps=ingestion_jobs.store_upload) as store_upload:
+            response = self.upload()
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data[0]['status'], 'queued')
+        source = upload_source('notes.txt', b'first line\nsecond line')
+        self.assertEqual(response.data[0]['source'], source)
+        self.assertEqual(response.data[0]['knowledge_base'], '')
+        self.assertEqual(response.data[0]['file_size'], 22)
+        # streamed to a temporary file, not read into memory
+        self.assertIsInstance(store_upload.call_args.args[0], TemporaryUploadedFile)
+        self.assertEqual((self.documents_path / source).read_bytes(), b'first line\nsecond line')
+        self.assertEqual(list((self.documents_path / source).parent.iterdir()), [self.documents_path / source])
+        update_index.assert_not_called()
+
+        self.queue.run_once()
+        update_index.assert_called_once_with(sources=[source], documents_path=self.documents_path)
+        response = self.client.get(f"{self.url}{response.data[0]['id']}/")
+        self.assertEqual(response.data['status'], 'done')
+        self.assertEqual(response.data['stats']['embedded_chunks'], 12)
+        self.assertGreater(response.data['throughput']['bytes_per_second'], 0)
+
+    @mock.patch(UPDATE_INDEX, return_value=INDEX_STATS)
+    def test_upload_several_files(self, update_index):
+        """Test every uploaded file gets its own job"""
+        response = self.client.post(self.url, {'files': [SimpleUploadedFile('a.txt', b'a'),
+                                                         SimpleUploadedFile('b.txt', b'b')]}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual([job['source'] for job in response.data],
+                         [upload_source('a.txt', b'a'), upload_source('b.txt', b'b')])
+
+    def test_same_name_different_files(self):
+        """Test two files uploaded under the same name are stored apart, the same file only once"""
+        first = self.upload(content=b'first version').data[0]['source']
+        second = self.upload(content=b'second version').data[0]['source']
+        self.assertNotEqual(first, second)
+        self.assertEqual((self.documents_path / first).read_bytes(), b'first version')
+        self.assertEqual((self.documents_path / second).read_bytes(), b'second version')
+        self.assertEqual(self.upload(content=b'first version').status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.queue.max_queued_per_user = 3
+        self.assertEqual(self.upload(content=b'first version').data[0]['source'], first)
+        self.assertEqual(len(list((self.documents_path / 'uploads').iterdir())), 2)
+
+    @mock.patch(UPDATE_INDEX, return_value=INDEX_STATS)
+    def test_upload_to_a_knowledge_base(self, update_index):
+        """Test an upload is indexed into the knowledge base it names, unknown ones are refused"""
+        laws_path = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, laws_path)
+        knowledge_bases = {'default': {}, 'laws': {'documents_path': laws_path,
+                                                   'response_config': {'chat_model': 'laws-model'}}}
+        indexed_into = []
+        update_index.side_effect = lambda **kwargs: indexed_into.append(get_response_config()) or INDEX_STATS
+        with mock.patch.dict(PROCESSING_CONFIG, {'knowledge_bases': knowledge_bases}), \
+                mock.patch.object(knowledge_bases_module, 'knowledge_bases',
+                                  KnowledgeBaseRegistry(knowledge_bases, default_registry=LazyRegistry())):
+            response = self.client.post(self.url, {'files': [SimpleUploadedFile('law.txt', b'article 1')],
+                                                   'knowledge_base': 'laws'}, format='multipart')
+            self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+            self.assertEqual(response.data[0]['knowledge_base'], 'laws')
+            source = response.data[0]['source']
+            self.assertEqual((laws_path / source).read_bytes(), b'article 1')
+            self.assertFalse((self.documents_path / 'uploads').exists())
+            self.queue.run_once()
+
+            response = self.client.post(self.url, {'files': [SimpleUploadedFile('law.txt', b'article 1')],
+                                                   'knowledge_base': 'medicine'}, format='multipart')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn('knowledge_base', response.data)
+        update_index.assert_called_once_with(sources=[source], documents_path=laws_path)
+        self.assertEqual(indexed_into[0]['chat_model'], 'laws-model')
+        self.assertEqual(IngestionJob.objects.count(), 1)
+
+    def test_upload_requires_staff(self):
+        """Test normal users can't add to the shared knowledge base"""
+        self.client.login(username='testuser', password='testpass123')
+        self.assertEqual(self.upload().status_code, status.HTTP_403_FORBIDDEN)
+        self.assertFalse(IngestionJob.objects.exists())
+
+    def test_upload_rejects_unsupported_files(self):
+        """Test files the converters can't read are refused before anything is stored"""
+        response = self.upload(name='script.sh')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(IngestionJob.objects.exists())
+        self.assertFalse((self.documents_path / 'uploads').exists())
+
+    def test_upload_rejects_too_large_requests(self):
+        """Test the request size is checked before the body is read"""
+        with override_settings(INGESTION_QUEUE={**ingestion_jobs.settings.INGESTION_QUEUE, 'max_upload_size': 10}):
+            response = self.upload()
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        self.assertFalse(IngestionJob.objects.exists())
+
+    def test_upload_backpressure(self):
+        """Test uploads are refused once the user has too many queued jobs"""
+        self.upload('a.txt')
+        self.upload('b.txt')
+        response = self.upload('c.txt')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(IngestionJob.objects.count(), 2)
+
+    def test_backpressure_counts_every_file(self):
+        """Test a request with more files than the user may queue is refused as a whole"""
+        self.upload('a.txt')
+        response = self.client.post(self.url, {'files': [SimpleUploadedFile('b.txt', b'b'),
+                                                         SimpleUploadedFile('c.txt', b'c')]}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(IngestionJob.objects.count(), 1)
+
+    @mock.patch(UPDATE_INDEX, side_effect=RuntimeError('Tesseract OCR is not properly installed'))
+    def test_failed_ingestion(self, update_index):
+        """Test a job whose indexing raised is marked failed with the error"""
+        job_id = self.upload().data[0]['id']
+        self.queue.run_once()
+        response = self.client.get(f'{self.url}{job_id}/')
+        self.assertEqual(response.data['status'], 'failed')
+        self.assertIn('Tesseract', response.data['error'])
+        self.assertIsNone(response.data['throughput'])
+
+    @mock.patch(UPDATE_INDEX, return_value=INDEX_STATS)
+    def test_stats(self, update_index):
+        """Test the stats report queued jobs and the throughput of finished ones"""
+        self.upload('a.txt')
+        self.upload('b.txt')
+        self.queue.run_once()
+
+        response = self.client.get(f'{self.url}stats/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['queued'], 1)
+        self.assertEqual(response.data['files'], 1)
+        self.assertEqual(response.data['chunks'], 12)
+        self.assertIsNotNone(response.data['chunks_per_second'])
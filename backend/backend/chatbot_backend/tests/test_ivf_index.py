@@ -0,0 +1,107 @@
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+from django.test import SimpleTestCase
+from haystack import Document
+
+from chatbot_backend.management.commands.bench_ann import synthetic_embeddings
+from chatbot_backend.services.processing_pipeline.custom.ivf_index import IVFIndex
+from chatbot_backend.services.processing_pipeline.custom.numpy_store import NumpyDocumentStore
+from chatbot_backend.tests.helpers import exact_top_k
+
+ANN = {'min_documents': 100, 'nlist': 8, 'nprobe': 8, 'pq_m': None, 'rerank': 50,
+       'train_sample': 1000, 'retrain_growth': 2.0}
+
+
+class IVFIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.embeddings = synthetic_embeddings(2000, 32, clusters=20)
+        self.norms = np.linalg.norm(self.embeddings, axis=1)
+        self.queries = synthetic_embeddings(20, 32, clusters=20, seed=1)
+
+    def build(self, **kwargs):
+        index = IVFIndex(**kwargs)
+        index.train(self.embeddings)
+        index.set_rows(*index.encode(self.embeddings))
+        return index
+
+    def recall(self, index, nprobe, top_k=5):
+        hits = 0
+        for query in self.queries:
+            rows, _ = index.search(query, top_k, self.embeddings, self.norms, nprobe=nprobe)
+            hits += len(set(rows.tolist()) & set(exact_top_k(self.embeddings, query, top_k)))
+        return hits / (top_k * len(self.queries))
+
+    def test_probing_every_list_is_exact(self):
+        index = self.build(nlist=16)
+        for query in self.queries:
+            rows, scores = index.search(query, 5, self.embeddings, self.norms, nprobe=16)
+            self.assertEqual(rows.tolist(), exact_top_k(self.embeddings, query, 5))
+            np.testing.assert_allclose(scores, self.embeddings[rows] @ query, rtol=1e-5)
+
+    def test_recall_grows_with_nprobe(self):
+        index = self.build(nlist=16)
+        self.assertLessEqual(self.recall(index, 1), self.recall(index, 4))
+        self.assertGreaterEqual(self.recall(index, 4), 0.8)
+
+    def test_pq_candidates_are_rescored_exactly(self):
+        index = self.build(nlist=16, pq_m=8, rerank=100)
+        self.assertEqual(index.codes.shape, (2000, 8))
+        self.assertEqual(index.codes.dtype, np.uint8)
+        self.assertGreaterEqual(self.recall(index, 16), 0.9)
+        rows, scores = index.search(self.queries[0], 5, self.embeddings, self.norms, nprobe=16)
+        np.testing.assert_allclose(scores, self.embeddings[rows] @ self.queries[0], rtol=1e-5)
+
+    def test_mask(self):
+        index = self.build(nlist=16)
+        mask = np.arange(2000) % 2 == 0
+        rows, _ = index.search(self.queries[0], 5, self.embeddings, self.norms, nprobe=16, mask=mask)
+        self.assertTrue(all(row % 2 == 0 for row in rows))
+
+
+class NumpyStoreAnnTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.path = self.tmp_dir / 'store'
+        self.embeddings = synthetic_embeddings(300, 16, clusters=10)
+        self.documents = [Document(id=f'd{i}', content=f'document {i}', embedding=self.embeddings[i].tolist())
+                          for i in range(300)]
+
+    def test_small_store_has_no_index(self):
+        store = NumpyDocumentStore(self.path, ann=ANN)
+        store.write_documents(self.documents[:50])
+        self.assertIsNone(store._state.ivf)
+
+    def test_index_is_saved_and_searched(self):
+        NumpyDocumentStore(self.path, ann=ANN).write_documents(self.documents[:200])
+        store = NumpyDocumentStore(self.path, ann=ANN)
+        self.assertIsNotNone(store._state.ivf)
+        self.assertEqual(store._state.ivf.nlist, 8)
+        documents = store.search_embeddings([self.embeddings[5].tolist()], top_k=3)[0]
+        self.assertEqual(documents[0].id, 'd5')
+        self.assertAlmostEqual(documents[0].score, 1.0, places=5)
+        # without ann settings the same files are searched exactly
+        self.assertIsNone(NumpyDocumentStore(self.path)._state.ivf)
+
+    def test_inserts_and_deletes_reuse_the_trained_index(self):
+        store = NumpyDocumentStore(self.path, ann=ANN)
+        store.write_documents(self.documents[:200])
+        centroids = np.array(store._state.ivf.centroids)
+        store.write_documents(self.documents[200:300])
+        store.delete_documents(['d0'])
+        ivf = store._state.ivf
+        np.testing.assert_array_equal(ivf.centroids, centroids)
+        self.assertEqual(len(ivf.list_ids), 299)
+        self.assertEqual(store.search_embeddings([self.embeddings[250].tolist()], top_k=1)[0][0].id, 'd250')
+        self.assertNotIn('d0', [document.id for document in
+                                store.search_embeddings([self.embeddings[0].tolist()], top_k=5)[0]])
+
+    def test_index_is_trained_again_after_growing(self):
+        store = NumpyDocumentStore(self.path, ann={**ANN, 'retrain_growth': 1.2})
+        store.write_documents(self.documents[:200])
+        self.assertEqual(store._state.ivf.trained_size, 200)
+        store.write_documents(self.documents[200:])
+        self.assertEqual(store._state.ivf.trained_size, 300)
@@ -0,0 +1,237 @@
+from unittest import mock
+
+from django.test import SimpleTestCase
+from rest_framework.test import APITestCase, APIClient
+from rest_framework import status
+
+from chatbot_backend.models import User, Conversation
+from chatbot_backend.services import query_processing
+from chatbot_backend.services.processing_pipeline import response_pipeline
+from chatbot_backend.services.processing_pipeline.config import PROCESSING_CONFIG, get_response_config, merge_config
+from chatbot_backend.services.processing_pipeline.custom.batching import MicroBatcher
+from chatbot_backend.services.processing_pipeline.knowledge_bases import KnowledgeBaseRegistry
+from chatbot_backend.services.processing_pipeline.registry import LazyRegistry, registry
+from chatbot_backend.tests.helpers import FakeClock
+
+KNOWLEDGE_BASES = {
+    'default': {},
+    'laws': {'description': 'Laws', 'response_config': {'chat_model': 'laws-model', 'retriever': {'top_k': 9}}},
+    'faq': {'response_config': {'chat_model': 'faq-model'}},
+}
+
+
+class Index:
+    def __init__(self, chat_model, size):
+        self.chat_model = chat_model
+        self.size = size
+
+    def nbytes(self):
+        return self.size
+
+
+class KnowledgeBaseRegistryTests(SimpleTestCase):
+    def setUp(self):
+        sizes = {'laws-model': 100, 'faq-model': 50}
+        self.default_registry = LazyRegistry()
+        # built with the config of the knowledge base being served, like the response_pipeline builders
+        self.default_registry.register('index', lambda: Index(get_response_config()["chat_model"],
+                                                              sizes.get(get_response_config()["chat_model"], 10)))
+        self.default_registry.register('embedding_cache', lambda: object())
+        self.clock = FakeClock()
+        self.knowledge_bases = self.make_registry()
+
+    def make_registry(self, **kwargs):
+        return KnowledgeBaseRegistry(KNOWLEDGE_BASES, default_registry=self.default_registry, clock=self.clock, **kwargs)
+
+    def test_merge_config(self):
+        merged = merge_config({'a': 1, 'b': {'c': 2, 'd': 3}}, {'b': {'c': 4}, 'e': 5})
+        self.assertEqual(merged, {'a': 1, 'b': {'c': 4, 'd': 3}, 'e': 5})
+
+    def test_knowledge_bases_build_their_own_objects(self):
+        with self.knowledge_bases.use('laws') as laws:
+            self.assertEqual(get_response_config()["chat_model"], 'laws-model')
+            self.assertEqual(get_response_config()["retriever"]["top_k"], 9)
+            self.assertEqual(get_response_config()["retriever"]["scope_fields"],
+                             PROCESSING_CONFIG["response_config"]["retriever"]["scope_fields"])
+            # the module level registry of the pipeline modules follows the knowledge base
+            self.assertIs(registry.get.__self__, laws.registry)
+            index = laws.registry.get('index')
+            self.assertEqual(index.chat_model, 'laws-model')
+        self.assertIs(get_response_config(), PROCESSING_CONFIG["response_config"])
+        with self.knowledge_bases.use() as default:
+            self.assertIs(default.registry, self.default_registry)
+            self.assertEqual(default.registry.get('index').chat_model, PROCESSING_CONFIG["response_config"]["chat_model"])
+        # shared objects are built once
+        self.assertIs(self.knowledge_bases.get('laws').registry.get('embedding_cache'),
+                      self.default_registry.get('embedding_cache'))
+        self.assertEqual(self.knowledge_bases.get('laws').resident_bytes(), 100)
+
+    def test_default_knowledge_base_overrides(self):
+        """Test the default knowledge base is served with its own overrides, whichever one it is"""
+        knowledge_bases = KnowledgeBaseRegistry(KNOWLEDGE_BASES, default_name='laws',
+                                                default_registry=self.default_registry, clock=self.clock)
+        with mock.patch.dict(PROCESSING_CONFIG, {'knowledge_bases': KNOWLEDGE_BASES, 'default_knowledge_base': 'laws'}):
+            with knowledge_bases.use() as laws:
+                self.assertEqual(laws.name, 'laws')
+                self.assertIs(laws.registry, self.default_registry)
+                self.assertEqual(laws.registry.get('index').chat_model, 'laws-model')
+            # outside of a request, e.g. warmup() or the management commands
+            self.assertEqual(get_response_config()["chat_model"], 'laws-model')
+            self.assertEqual(get_response_config()["retriever"]["top_k"], 9)
+        self.assertIs(get_response_config(), PROCESSING_CONFIG["response_config"])
+
+    def test_resident_bytes_are_measured_when_objects_change(self):
+        """Test evict() doesn't walk a Chroma store directory at the end of every request"""
+        self.default_registry.register('document_store', lambda: object())
+        laws = self.knowledge_bases.get('laws')
+        with mock.patch('chatbot_backend.services.processing_pipeline.knowledge_bases.directory_size',
+                        return_value=7) as directory_size:
+            for _ in range(3):
+                with self.knowledge_bases.use('laws'):
+                    laws.registry.get('document_store')
+            self.assertEqual(laws.resident_bytes(), 7)
+            self.assertEqual(directory_size.call_count, 1)
+            with self.knowledge_bases.use('laws'):
+                laws.registry.get('index')
+            self.assertEqual(laws.resident_bytes(), 107)
+            self.assertEqual(directory_size.call_count, 2)
+
+    def test_unknown_knowledge_base(self):
+        with self.assertRaises(KeyError):
+            self.knowledge_bases.get('medicine')
+
+    def use(self, knowledge_bases, name):
+        self.clock.now += 1
+        with knowledge_bases.use(name) as knowledge_base:
+            knowledge_base.registry.get('index')
+
+    def test_least_recently_used_are_evicted_over_budget(self):
+        knowledge_bases = self.make_registry(max_resident_bytes=160)
+        for name in ('laws', None, 'faq'):
+            self.use(knowledge_bases, name)
+        # 160 bytes, not over the budget
+        self.assertEqual(knowledge_bases.stats(), {'loaded': {'laws': 100, 'default': 10, 'faq': 50}, 'evictions': 0})
+        knowledge_bases.max_resident_bytes = 120
+        self.use(knowledge_bases, 'laws')
+        # default then faq were used least recently, dropping default leaves 150 bytes, faq 100
+        self.assertEqual(knowledge_bases.stats(), {'loaded': {'laws': 100}, 'evictions': 2})
+        self.use(knowledge_bases, None)
+        self.assertEqual(knowledge_bases.stats()['loaded'], {'laws': 100, 'default': 10})
+
+    def test_last_used_is_kept_over_budget(self):
+        knowledge_bases = self.make_registry(max_resident_bytes=10)
+        with knowledge_bases.use('laws') as laws:
+            laws.registry.get('index')
+        self.assertTrue(laws.is_loaded())
+        self.clock.now = 1
+        with knowledge_bases.use('faq') as faq:
+            faq.registry.get('index')
+        self.assertFalse(laws.is_loaded())
+        self.assertTrue(faq.is_loaded())
+
+    def test_idle_knowledge_bases_are_evicted(self):
+        knowledge_bases = self.make_registry(idle_seconds=60)
+        with knowledge_bases.use('laws') as laws:
+            first_index = laws.registry.get('index')
+        self.clock.now = 30
+        with knowledge_bases.use('faq') as faq:
+            faq.registry.get('index')
+        self.assertTrue(laws.is_loaded())
+        self.clock.now = 70
+        with knowledge_bases.use('faq'):
+            pass
+        self.assertFalse(laws.is_loaded())
+        self.assertTrue(faq.is_loaded())
+        # built again on next use
+        with knowledge_bases.use('laws') as laws:
+            self.assertIsNot(laws.registry.get('index'), first_index)
+
+    def test_knowledge_base_in_use_is_not_evicted(self):
+        knowledge_bases = self.make_registry(max_resident_bytes=1)
+        with knowledge_bases.use('laws') as laws:
+            laws.registry.get('index')
+            self.clock.now = 1
+            with knowledge_bases.use('faq') as faq:
+                faq.registry.get('index')
+            # faq was the last used one
+            self.assertTrue(laws.is_loaded())
+            self.clock.now = 2
+        self.assertFalse(faq.is_loaded())
+        self.assertTrue(laws.is_loaded())
+
+    def test_unload_stops_batchers(self):
+        batcher = MicroBatcher(lambda items: items)
+        self.default_registry.register('batcher', lambda: batcher)
+        knowledge_base = self.knowledge_bases.get('laws')
+        knowledge_base.registry.get('batcher')
+        self.assertEqual(batcher(1), 1)
+        knowledge_base.unload()
+        batcher._thread.join(timeout=1)
+        self.assertFalse(batcher._thread.is_alive())
+        self.assertFalse(knowledge_base.is_loaded())
+
+
+class KnowledgeBasePipelineTests(SimpleTestCase):
+    def setUp(self):
+        self.knowledge_bases = KnowledgeBaseRegistry(KNOWLEDGE_BASES, default_registry=LazyRegistry())
+        patcher = mock.patch.object(response_pipeline, 'knowledge_bases', self.knowledge_bases)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def fake_run(self, messages_history, history_length, streaming_callbacks=None, filters=None):
+        self.chat_models.append(get_response_config()["chat_model"])
+        return {'conditional_router': {'replies': [mock.Mock(text='an answer')]}}
+
+    def test_generation_runs_with_the_knowledge_base_config(self):
+        self.chat_models = []
+        with mock.patch.object(response_pipeline, 'run', self.fake_run):
+            self.assertEqual(response_pipeline.generate_response(['a question'], knowledge_base='faq'), 'an answer')
+            events = list(response_pipeline.stream_response(['a question'], knowledge_base='laws'))
+        self.assertEqual(events[-1], ('done', 'an answer'))
+        self.assertEqual(self.chat_models, ['faq-model', 'laws-model'])
+
+    def test_conversation_picks_the_knowledge_base(self):
+        pipeline = mock.Mock()
+        pipeline.generate_response.return_value = 'an answer'
+        conversation = Conversation(id=1, knowledge_base='laws')
+        with mock.patch.object(query_processing, 'get_response_pipeline', return_value=pipeline), \
+                mock.patch.object(query_processing, 'get_user_messages', return_value=['a question']):
+            query_processing.generate_response(conversation, 'a question')
+            conversation.knowledge_base = ''
+            query_processing.generate_response(conversation, 'a question')
+        self.assertEqual([call.args[2] for call in pipeline.generate_response.call_args_list], ['laws', None])
+
+
+@mock.patch.dict(PROCESSING_CONFIG, {'knowledge_bases': KNOWLEDGE_BASES})
+class ConversationKnowledgeBaseTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123',
+            user_type='user'
+        )
+        self.conversation = Conversation.objects.create(user=self.user, title='Laws')
+        self.client = APIClient()
+        self.client.login(username='testuser', password='testpass123')
+
+    def test_choose_knowledge_base(self):
+        url = f'/api/conversations/{self.conversation.id}/'
+        response = self.client.patch(url, {'knowledge_base': 'laws'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['knowledge_base'], 'laws')
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.knowledge_base, 'laws')
+
+        response = self.client.patch(url, {'knowledge_base': 'medicine'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('knowledge_base', response.data)
+
+    def test_list_knowledge_bases(self):
+        response = self.client.get('/api/conversations/knowledge-bases/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, [
+            {'name': 'default', 'description': '', 'default': True},
+            {'name': 'laws', 'description': 'Laws', 'default': False},
+            {'name': 'faq', 'description': '', 'default': False},
+        ])
@@ -0,0 +1,66 @@
+import asyncio
+import threading
+from unittest import mock
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from chatbot_backend.services.processing_pipeline import response_pipeline
+from chatbot_backend.services.processing_pipeline.custom.local_embedder import LocalEmbeddingModel, LocalTextEmbedder
+
+
+class FakeSentenceTransformer:
+    def __init__(self):
+        self.calls = []
+        self.threads = set()
+
+    def encode(self, texts, **kwargs):
+        self.calls.append((texts, kwargs))
+        self.threads.add(threading.current_thread().name)
+        return np.array([[float(len(text)), 1.0] for text in texts])
+
+
+class LocalEmbedderTests(SimpleTestCase):
+    def setUp(self):
+        self.model = LocalEmbeddingModel('sayed0am/arabic-english-bge-m3', threads=2)
+        # skips loading the real model
+        self.model._model = FakeSentenceTransformer()
+
+    def test_embeds_on_worker_threads(self):
+        """Test queries are encoded normalized on the model's thread pool"""
+        embedder = LocalTextEmbedder(self.model)
+        self.assertEqual(embedder.run(text='abc')['embedding'], [3.0, 1.0])
+        texts, kwargs = self.model._model.calls[0]
+        self.assertEqual(texts, ['abc'])
+        self.assertTrue(kwargs['normalize_embeddings'])
+        self.assertTrue(all(name.startswith('local-embedder') for name in self.model._model.threads))
+
+    def test_async_embedding(self):
+        """Test run_async awaits the thread pool instead of blocking the event loop"""
+        embedder = LocalTextEmbedder(self.model)
+
+        async def embed_all():
+            return await asyncio.gather(*(embedder.run_async(text=text) for text in ['a', 'bb']))
+
+        results = asyncio.run(embed_all())
+        self.assertEqual([result['embedding'] for result in results], [[1.0, 1.0], [2.0, 1.0]])
+
+    def test_threads_are_set_on_the_onnx_session_only(self):
+        """Test intra_op_threads goes to the ONNX Runtime session, torch's process wide thread count is left alone"""
+        torch, onnxruntime = mock.Mock(), mock.Mock()
+        with mock.patch.dict('sys.modules', {'torch': torch, 'onnxruntime': onnxruntime}):
+            model_kwargs = LocalEmbeddingModel('model', backend='onnx', intra_op_threads=3)._model_kwargs()
+            self.assertIs(model_kwargs['session_options'], onnxruntime.SessionOptions.return_value)
+            self.assertEqual(model_kwargs['session_options'].intra_op_num_threads, 3)
+            self.assertEqual(LocalEmbeddingModel('model', backend='torch', intra_op_threads=3)._model_kwargs(), {})
+        torch.set_num_threads.assert_not_called()
+
+    def test_local_embeddings_are_cached_apart(self):
+        """Test local and API embeddings don't share embedding cache entries"""
+        local_config = {**response_pipeline.PROCESSING_CONFIG["response_config"]["local_embedder"],
+                        'file_name': 'onnx/model_qint8_avx512_vnni.onnx'}
+        with mock.patch.dict(response_pipeline.PROCESSING_CONFIG["response_config"], {'local_embedder': local_config}):
+            local_id = response_pipeline.get_embedding_model_id('local')
+            api_id = response_pipeline.get_embedding_model_id('api')
+        self.assertNotEqual(local_id, api_id)
+        self.assertIn('model_qint8_avx512_vnni', local_id)
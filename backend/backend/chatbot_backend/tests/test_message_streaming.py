@@ -0,0 +1,161 @@
+import json
+from unittest import mock
+
+from django.test import TestCase
+from rest_framework.test import APITestCase, APIClient
+from rest_framework import status
+from haystack.dataclasses import ChatMessage, StreamingChunk
+
+from chatbot_backend.models import User, Conversation, Message
+from chatbot_backend.services.processing_pipeline import response_pipeline
+
+
+def parse_sse(body):
+    """Returns the (event, data) pairs of an event stream body"""
+    events = []
+    for frame in body.strip().split('\n\n'):
+        lines = dict(line.split(': ', 1) for line in frame.split('\n'))
+        events.append((lines['event'], json.loads(lines['data'])))
+    return events
+
+
+def fake_stream_response(conversation, query, scope=None):
+    yield 'token', 'Django is '
+    yield 'token', 'a web framework'
+    yield 'done', 'Django is a web framework'
+
+
+def fake_run(replies):
+    """Builds a replacement for response_pipeline.run that streams the given {llm_name: [tokens]}"""
+    def run(messages_history, history_length, streaming_callbacks=None, filters=None):
+        results = {}
+        for llm_name, tokens in replies.items():
+            for token in tokens:
+                streaming_callbacks[llm_name](StreamingChunk(content=token))
+            results[llm_name] = {'replies': [ChatMessage.from_assistant(''.join(tokens))]}
+        if 'fallback_llm' not in replies:
+            results['conditional_router'] = results['main_llm']
+        return results
+    return run
+
+
+class MessageStreamingViewTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123',
+            user_type='user'
+        )
+        self.other_user = User.objects.create_user(
+            username='otheruser',
+            email='other@example.com',
+            password='otherpass123',
+            user_type='user'
+        )
+        self.conversation = Conversation.objects.create(user=self.user, title='Streaming')
+        self.other_conversation = Conversation.objects.create(user=self.other_user, title='Other')
+
+        self.client = APIClient()
+        self.client.login(username='testuser', password='testpass123')
+        self.stream_url = lambda conversation_id: f'/api/conversations/{conversation_id}/messages/stream/'
+
+    @mock.patch('chatbot_backend.views.conversation_views.stream_response', fake_stream_response)
+    def test_stream_message(self):
+        """Test tokens are streamed as events and the assistant message is saved at the end"""
+        response = self.client.post(self.stream_url(self.conversation.id), {'content': 'What is Django?'},
+                                    HTTP_ACCEPT='text/event-stream')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+
+        events = parse_sse(b''.join(response.streaming_content).decode())
+        self.assertEqual([event for event, _ in events], ['user_message', 'token', 'token', 'done'])
+        self.assertEqual(events[0][1]['content'], 'What is Django?')
+        self.assertEqual(''.join(data['content'] for event, data in events if event == 'token'),
+                         'Django is a web framework')
+
+        assistant_msg = Message.objects.get(conversation=self.conversation, role='assistant')
+        self.assertEqual(assistant_msg.content, 'Django is a web framework')
+        self.assertEqual(events[-1][1]['id'], assistant_msg.id)
+
+    @mock.patch('chatbot_backend.views.conversation_views.stream_response')
+    def test_stream_message_failure(self, stream_response):
+        """Test a failing generator ends the stream with an error event and no assistant message"""
+        stream_response.side_effect = RuntimeError('LLM is down')
+        response = self.client.post(self.stream_url(self.conversation.id), {'content': 'Hello'})
+
+        events = parse_sse(b''.join(response.streaming_content).decode())
+        self.assertEqual(events[-1][0], 'error')
+        self.assertFalse(Message.objects.filter(conversation=self.conversation, role='assistant').exists())
+
+    def test_stream_message_in_other_user_conversation(self):
+        """Test that users cannot stream messages into other users' conversations"""
+        response = self.client.post(self.stream_url(self.other_conversation.id), {'content': 'Hello'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class StreamResponseTests(TestCase):
+    def test_main_reply_is_streamed(self):
+        """Test main_llm tokens are forwarded once they can't be a 'no_answer' reply"""
+        with mock.patch.object(response_pipeline, 'run', fake_run({'main_llm': ['no', 'rmal', ' answer']})):
+            events = list(response_pipeline.stream_response(['question']))
+        self.assertEqual(events, [('token', 'normal'), ('token', ' answer'), ('done', 'normal answer')])
+
+    def test_no_answer_is_never_streamed(self):
+        """Test a 'no_answer' reply from main_llm is held back and only the fallback reply is streamed"""
+        replies = {'main_llm': ['no_', 'answer'], 'fallback_llm': ['sorry', '!']}
+        with mock.patch.object(response_pipeline, 'run', fake_run(replies)):
+            events = list(response_pipeline.stream_response(['question']))
+        self.assertEqual(events, [('token', 'sorry'), ('token', '!'), ('done', 'sorry!')])
+
+    def test_late_no_answer_resets_stream(self):
+        """Test the client is told to drop streamed main_llm tokens when the fallback takes over"""
+        replies = {'main_llm': ['maybe ', 'no_answer'], 'fallback_llm': ['sorry']}
+        with mock.patch.object(response_pipeline, 'run', fake_run(replies)):
+            events = list(response_pipeline.stream_response(['question']))
+        self.assertEqual(events, [('token', 'maybe '), ('token', 'no_answer'), ('reset', None),
+                                  ('token', 'sorry'), ('done', 'sorry')])
+
+
+def fake_speculative_run(chunks, is_fallback):
+    """Builds a replacement for response_pipeline.run that streams interleaved (llm_name, token) chunks"""
+    def run(messages_history, history_length, streaming_callbacks=None, filters=None):
+        for llm_name, token in chunks:
+            streaming_callbacks[llm_name](StreamingChunk(content=token))
+        reply = ''.join(token for llm_name, token in chunks
+                        if llm_name == ('fallback_llm' if is_fallback else 'main_llm'))
+        output_name = 'fallback_replies' if is_fallback else 'replies'
+        return {'conditional_router': {output_name: [ChatMessage.from_assistant(reply)]}}
+    return run
+
+
+@mock.patch.dict(response_pipeline.PROCESSING_CONFIG['response_config'], {'fallback': {'mode': 'speculative'}})
+class SpeculativeStreamResponseTests(TestCase):
+    def test_main_reply_drops_fallback_tokens(self):
+        """Test fallback tokens generated next to a real answer are never streamed"""
+        chunks = [('fallback_llm', 'sorry'), ('main_llm', 'an '), ('fallback_llm', '!'), ('main_llm', 'answer')]
+        with mock.patch.object(response_pipeline, 'run', fake_speculative_run(chunks, is_fallback=False)):
+            events = list(response_pipeline.stream_response(['question']))
+        self.assertEqual(events, [('token', 'an '), ('token', 'answer'), ('done', 'an answer')])
+
+    def test_early_exit_on_no_answer(self):
+        """Test fallback tokens are released as soon as main_llm starts with 'no_answer'"""
+        chunks = [('fallback_llm', 'sorry'), ('main_llm', 'no_'), ('main_llm', 'answer'),
+                  ('fallback_llm', '!'), ('main_llm', ' really')]
+        with mock.patch.object(response_pipeline, 'run', fake_speculative_run(chunks, is_fallback=True)):
+            events = list(response_pipeline.stream_response(['question']))
+        self.assertEqual(events, [('token', 'sorry'), ('token', '!'), ('done', 'sorry!')])
+
+    def test_late_no_answer_resets_stream(self):
+        """Test the held back fallback reply follows a reset when 'no_answer' comes late"""
+        chunks = [('main_llm', 'maybe '), ('fallback_llm', 'sorry'), ('main_llm', 'no_answer')]
+        with mock.patch.object(response_pipeline, 'run', fake_speculative_run(chunks, is_fallback=True)):
+            events = list(response_pipeline.stream_response(['question']))
+        self.assertEqual(events, [('token', 'maybe '), ('token', 'no_answer'), ('reset', None),
+                                  ('token', 'sorry'), ('done', 'sorry')])
+
+    def test_fallback_reply_from_router(self):
+        """Test the reply and fallback flag are read from the router in speculative mode"""
+        results = {'conditional_router': {'fallback_replies': [ChatMessage.from_assistant('sorry')]}}
+        self.assertTrue(response_pipeline.get_is_fallback(results))
+        self.assertEqual(response_pipeline.get_reply(results), 'sorry')
@@ -0,0 +1,48 @@
+from unittest import mock
+
+from django.db import connection
+from rest_framework.test import APITransactionTestCase, APIClient
+from rest_framework import status
+
+from chatbot_backend.models import User, Conversation, Message
+
+
+class MessageCreateTransactionTests(APITransactionTestCase):
+    """Transaction test case, so the view's own transactions are the only ones open"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123',
+            user_type='user'
+        )
+        self.conversation = Conversation.objects.create(user=self.user, title='Transactions')
+        self.client = APIClient()
+        self.client.login(username='testuser', password='testpass123')
+        self.messages_url = f'/api/conversations/{self.conversation.id}/messages/'
+
+    def test_generation_runs_outside_transaction(self):
+        """Test the user message is committed and no transaction is open while generating"""
+        seen = {}
+
+        def fake_generate_response(conversation, query, scope=None):
+            seen['in_atomic_block'] = connection.in_atomic_block
+            seen['user_message_saved'] = Message.objects.filter(conversation=conversation, role='user').exists()
+            return 'an answer'
+
+        with mock.patch('chatbot_backend.views.conversation_views.generate_response', fake_generate_response):
+            response = self.client.post(self.messages_url, {'content': 'a question'})
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['content'], 'an answer')
+        self.assertFalse(seen['in_atomic_block'])
+        self.assertTrue(seen['user_message_saved'])
+
+    def test_failed_generation_removes_user_message(self):
+        """Test a failed generation leaves no unanswered user message behind"""
+        self.client.raise_request_exception = False
+        with mock.patch('chatbot_backend.views.conversation_views.generate_response', side_effect=RuntimeError):
+            response = self.client.post(self.messages_url, {'content': 'a question'})
+        self.assertEqual(response.status_code, status.HTTP_500_INTERNAL_SERVER_ERROR)
+        self.assertFalse(Message.objects.filter(conversation=self.conversation).exists())
@@ -0,0 +1,55 @@
+import numpy as np
+from django.test import SimpleTestCase
+from haystack import Document
+from haystack.utils.filters import document_matches_filter
+
+from chatbot_backend.services.processing_pipeline.custom.metadata_index import MetadataIndex
+
+DOCUMENTS = [Document(content=f'document {i}', meta={'collection': ['faq', 'laws', 'news'][i % 3],
+                                                     'language': 'ara' if i % 2 else 'eng',
+                                                     'page': i, **({'tags': ['a']} if i == 4 else {})})
+             for i in range(30)] + [Document(content='untagged')]
+
+
+class MetadataIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.index = MetadataIndex(DOCUMENTS, ['collection', 'language', 'tags'])
+
+    def assert_matches(self, filters):
+        mask, rows = self.index.select(filters)
+        expected = [document_matches_filter(filters, document) for document in DOCUMENTS]
+        self.assertEqual(mask.tolist(), expected)
+        self.assertEqual(rows.tolist(), np.flatnonzero(expected).tolist())
+
+    def test_same_results_as_matching_every_document(self):
+        """Test posting lists give the documents document_matches_filter would"""
+        for filters in [
+            {'field': 'meta.collection', 'operator': '==', 'value': 'faq'},
+            {'field': 'meta.collection', 'operator': '!=', 'value': 'faq'},
+            {'field': 'meta.collection', 'operator': 'in', 'value': ['laws', 'news', 'missing']},
+            {'field': 'meta.language', 'operator': 'not in', 'value': ['ara']},
+            {'operator': 'AND', 'conditions': [
+                {'field': 'meta.collection', 'operator': '==', 'value': 'laws'},
+                {'field': 'meta.language', 'operator': '==', 'value': 'ara'},
+            ]},
+            {'operator': 'OR', 'conditions': [
+                {'field': 'meta.collection', 'operator': '==', 'value': 'news'},
+                {'field': 'meta.page', 'operator': '<', 'value': 3},
+            ]},
+            {'operator': 'NOT', 'conditions': [{'field': 'meta.language', 'operator': '==', 'value': 'eng'}]},
+        ]:
+            with self.subTest(filters=filters):
+                self.assert_matches(filters)
+
+    def test_unindexed_fields_fall_back(self):
+        """Test fields with unhashable values, or not indexed, are matched document by document"""
+        self.assertNotIn('tags', self.index.postings)
+        self.assert_matches({'field': 'meta.tags', 'operator': '==', 'value': ['a']})
+        self.assert_matches({'field': 'meta.page', 'operator': '>=', 'value': 20})
+
+    def test_selections_are_cached(self):
+        filters = {'field': 'meta.collection', 'operator': '==', 'value': 'faq'}
+        mask, rows = self.index.select(filters)
+        self.assertIs(self.index.select(dict(filters))[0], mask)
+        self.assertFalse(rows.flags.writeable)
+        self.assertEqual(self.index.select(None), (None, None))
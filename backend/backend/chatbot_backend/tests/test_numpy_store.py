@@ -0,0 +1,173 @@
+import json
+import shutil
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+from django.test import SimpleTestCase
+from haystack import Document
+from haystack.document_stores.errors import DuplicateDocumentError
+from haystack.document_stores.types import DuplicatePolicy
+
+from chatbot_backend.services.processing_pipeline.custom.numpy_store import NumpyDocumentStore, NumpyEmbeddingRetriever
+
+
+class NumpyDocumentStoreTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.path = self.tmp_dir / 'store'
+        rng = np.random.default_rng(0)
+        self.embeddings = rng.normal(size=(50, 8)).astype(np.float32)
+        self.documents = [Document(id=f'd{i}', content=f'document {i}', meta={'group': i % 3},
+                                   embedding=self.embeddings[i].tolist()) for i in range(50)]
+        self.queries = rng.normal(size=(4, 8)).astype(np.float32)
+
+    def exact_top_k(self, query, top_k, ids=None):
+        scores = self.embeddings @ query / (np.linalg.norm(self.embeddings, axis=1) * np.linalg.norm(query))
+        ranked = [f'd{i}' for i in np.argsort(-scores)]
+        return [id for id in ranked if ids is None or id in ids][:top_k]
+
+    def test_search_matches_brute_force(self):
+        store = NumpyDocumentStore(self.path)
+        store.write_documents(self.documents)
+        results = store.search_embeddings(self.queries.tolist(), top_k=5)
+        for query, documents in zip(self.queries, results):
+            self.assertEqual([document.id for document in documents], self.exact_top_k(query, 5))
+            scores = [document.score for document in documents]
+            self.assertEqual(scores, sorted(scores, reverse=True))
+            self.assertLessEqual(scores[0], 1.0 + 1e-6)
+
+    def test_top_k_larger_than_the_store(self):
+        store = NumpyDocumentStore(self.path)
+        store.write_documents(self.documents[:3])
+        self.assertEqual(len(store.search_embeddings(self.queries[:1].tolist(), top_k=10)[0]), 3)
+
+    def test_filters(self):
+        store = NumpyDocumentStore(self.path)
+        store.write_documents(self.documents)
+        filters = {'field': 'meta.group', 'operator': '==', 'value': 1}
+        documents = store.search_embeddings(self.queries[:1].tolist(), top_k=5, filters=filters)[0]
+        group_ids = {f'd{i}' for i in range(50) if i % 3 == 1}
+        self.assertEqual([document.id for document in documents], self.exact_top_k(self.queries[0], 5, group_ids))
+        self.assertEqual(len(store.filter_documents(filters)), len(group_ids))
+
+    def test_indexed_filters(self):
+        """Test filters on indexed fields, matching few rows (scored alone) or most of them (masked scan)"""
+        for quantization in (None, 'int8'):
+            store = NumpyDocumentStore(self.tmp_dir / f'store-{quantization}', indexed_fields=['group'],
+                                       quantization=quantization, rescore_multiplier=50)
+            store.write_documents(self.documents)
+            for operator, value, ids in (('==', 2, {f'd{i}' for i in range(50) if i % 3 == 2}),
+                                         ('!=', 2, {f'd{i}' for i in range(50) if i % 3 != 2}),
+                                         ('in', [7], set())):
+                filters = {'field': 'meta.group', 'operator': operator, 'value': value}
+                documents = store.search_embeddings(self.queries[:2].tolist(), top_k=5, filters=filters)
+                for query, query_documents in zip(self.queries, documents):
+                    self.assertEqual([document.id for document in query_documents], self.exact_top_k(query, 5, ids))
+            self.assertIn(2, store._state.filter_index.postings['group'])
+
+    def test_store_is_memory_mapped_after_reopening(self):
+        """Test a new instance reads the saved generation without copying it"""
+        NumpyDocumentStore(self.path).write_documents(self.documents)
+        store = NumpyDocumentStore(self.path)
+        self.assertIsInstance(store._state.embeddings, np.memmap)
+        self.assertEqual(store.count_documents(), 50)
+        self.assertEqual(store.filter_documents()[7].meta, {'group': 1})
+        np.testing.assert_allclose(store.filter_documents()[7].embedding, self.embeddings[7])
+
+    def test_write_replaces_the_previous_generation(self):
+        store = NumpyDocumentStore(self.path)
+        store.write_documents(self.documents[:10])
+        store.write_documents(self.documents[10:20])
+        # the previous generation stays for the processes that just read store.json
+        self.assertEqual(sorted(path.name for path in self.path.iterdir()),
+                         ['documents-1.json', 'documents-2.json', 'embeddings-1.npy', 'embeddings-2.npy',
+                          'norms-1.npy', 'norms-2.npy', 'store.json'])
+        store.write_documents(self.documents[20:])
+        self.assertEqual(sorted(path.name for path in self.path.iterdir()),
+                         ['documents-2.json', 'documents-3.json', 'embeddings-2.npy', 'embeddings-3.npy',
+                          'norms-2.npy', 'norms-3.npy', 'store.json'])
+        self.assertEqual(store.count_documents(), 50)
+
+    def test_reader_of_a_deleted_generation_loads_the_current_one(self):
+        store = NumpyDocumentStore(self.path)
+        store.write_documents(self.documents[:10])
+        stale_manifest = {'generation': 1}
+        store.write_documents(self.documents[10:20])
+        store.write_documents(self.documents[20:])
+        reader = NumpyDocumentStore(self.path)
+        with mock.patch('json.load', side_effect=[stale_manifest, *[json.load(open(self.path / name, encoding='utf-8'))
+                                                                    for name in ('store.json', 'documents-3.json')]]):
+            reader.reload()
+        self.assertEqual(reader.count_documents(), 50)
+
+    def test_batch_saves_one_generation(self):
+        store = NumpyDocumentStore(self.path)
+        store.write_documents(self.documents[:10])
+        with store.batch():
+            store.write_documents(self.documents[10:30])
+            store.delete_documents(['d0', 'd10'])
+            store.write_documents(self.documents[30:])
+            # deleted then written again
+            store.write_documents(self.documents[:1])
+            with self.assertRaises(DuplicateDocumentError):
+                store.write_documents(self.documents[5:6])
+            self.assertEqual(store.write_documents(self.documents[30:31], policy=DuplicatePolicy.SKIP), 0)
+            # searches answer from the saved generation meanwhile
+            self.assertEqual(store.count_documents(), 10)
+        self.assertEqual(store._state.generation, 2)
+        self.assertEqual(store.count_documents(), 49)
+        ids = {document.id for document in store.filter_documents()}
+        self.assertEqual(ids, {f'd{i}' for i in range(50)} - {'d10'})
+        for query in self.queries:
+            documents = store.search_embeddings([query.tolist()], top_k=5)[0]
+            self.assertEqual([document.id for document in documents], self.exact_top_k(query, 5, ids))
+
+    def test_failed_batch_saves_nothing(self):
+        store = NumpyDocumentStore(self.path)
+        store.write_documents(self.documents[:10])
+        with self.assertRaises(RuntimeError):
+            with store.batch():
+                store.write_documents(self.documents[10:])
+                raise RuntimeError('embedding failed')
+        self.assertEqual(store.count_documents(), 10)
+        self.assertEqual(NumpyDocumentStore(self.path)._state.generation, 1)
+
+    def test_duplicate_policies(self):
+        store = NumpyDocumentStore(self.path)
+        store.write_documents(self.documents[:2])
+        with self.assertRaises(DuplicateDocumentError):
+            store.write_documents(self.documents[:1])
+        self.assertEqual(store.write_documents(self.documents[:1], policy=DuplicatePolicy.SKIP), 0)
+
+        updated = Document(id='d0', content='updated', embedding=self.embeddings[1].tolist())
+        self.assertEqual(store.write_documents([updated], policy=DuplicatePolicy.OVERWRITE), 1)
+        self.assertEqual(store.count_documents(), 2)
+        top = store.search_embeddings([self.embeddings[1].tolist()], top_k=2)[0]
+        self.assertEqual({document.content for document in top}, {'updated', 'document 1'})
+
+    def test_delete_documents(self):
+        store = NumpyDocumentStore(self.path)
+        store.write_documents(self.documents)
+        store.delete_documents(['d3', 'd4', 'missing'])
+        self.assertEqual(store.count_documents(), 48)
+        documents = store.search_embeddings([self.embeddings[3].tolist()], top_k=50)[0]
+        self.assertNotIn('d3', [document.id for document in documents])
+        self.assertEqual(NumpyDocumentStore(self.path).count_documents(), 48)
+
+    def test_float16(self):
+        store = NumpyDocumentStore(self.path, dtype='float16', block_size=7)
+        store.write_documents(self.documents)
+        self.assertEqual(store._state.embeddings.dtype, np.float16)
+        documents = store.search_embeddings(self.queries[:1].tolist(), top_k=3)[0]
+        self.assertEqual([document.id for document in documents], self.exact_top_k(self.queries[0], 3))
+
+    def test_retriever(self):
+        store = NumpyDocumentStore(self.path)
+        store.write_documents(self.documents)
+        retriever = NumpyEmbeddingRetriever(store, top_k=4)
+        documents = retriever.run(query_embedding=self.queries[0].tolist())['documents']
+        self.assertEqual([document.id for document in documents], self.exact_top_k(self.queries[0], 4))
+        self.assertEqual(len(retriever.run(query_embedding=self.queries[0].tolist(), top_k=2)['documents']), 2)
@@ -0,0 +1,103 @@
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+from django.test import SimpleTestCase
+from haystack import Document
+
+from chatbot_backend.management.commands.bench_ann import synthetic_embeddings
+from chatbot_backend.services.processing_pipeline.custom.numpy_store import NumpyDocumentStore
+from chatbot_backend.services.processing_pipeline.custom.quantization import (
+    DEFAULT_RESCORE_MULTIPLIERS, QuantizedEmbeddings, quantized_search
+)
+from chatbot_backend.tests.helpers import exact_top_k
+
+
+class QuantizedEmbeddingsTests(SimpleTestCase):
+    def setUp(self):
+        self.embeddings = synthetic_embeddings(1000, 64, clusters=10)
+        self.norms = np.linalg.norm(self.embeddings, axis=1)
+        self.queries = synthetic_embeddings(20, 64, clusters=10, seed=1)
+
+    def recall(self, quantized, rescore_multiplier, top_k=5):
+        results = quantized_search(quantized, self.embeddings, self.norms, self.queries, top_k, rescore_multiplier)
+        hits = sum(len(set(rows.tolist()) & set(exact_top_k(self.embeddings, query, top_k)))
+                   for query, (rows, _) in zip(self.queries, results))
+        return hits / (top_k * len(self.queries))
+
+    def test_sizes(self):
+        int8 = QuantizedEmbeddings.build('int8', self.embeddings)
+        binary = QuantizedEmbeddings.build('binary', self.embeddings)
+        self.assertEqual(int8.codes.dtype, np.int8)
+        self.assertEqual(int8.codes.nbytes * 4, self.embeddings.nbytes)
+        self.assertEqual(binary.codes.nbytes * 32, self.embeddings.nbytes)
+
+    def test_int8_scores_approximate_the_dot_product(self):
+        quantized = QuantizedEmbeddings.build('int8', self.embeddings)
+        np.testing.assert_allclose(quantized.scores(self.queries), self.queries @ self.embeddings.T, atol=0.02)
+
+    def test_binary_scores_are_negative_hamming_distances(self):
+        quantized = QuantizedEmbeddings.build('binary', self.embeddings)
+        scores = quantized.scores(self.queries[:1])[0]
+        expected = -((self.embeddings > 0) != (self.queries[0] > 0)).sum(axis=1)
+        np.testing.assert_array_equal(scores, expected)
+
+    def test_rescoring_returns_exact_scores(self):
+        quantized = QuantizedEmbeddings.build('int8', self.embeddings)
+        rows, scores = quantized_search(quantized, self.embeddings, self.norms, self.queries[:1], 5)[0]
+        np.testing.assert_allclose(scores, self.embeddings[rows] @ self.queries[0], rtol=1e-5)
+        self.assertEqual(scores.tolist(), sorted(scores.tolist(), reverse=True))
+
+    def test_recall_grows_with_rescore_multiplier(self):
+        self.assertGreaterEqual(self.recall(QuantizedEmbeddings.build('int8', self.embeddings), 4), 0.95)
+        binary = QuantizedEmbeddings.build('binary', self.embeddings)
+        self.assertLessEqual(self.recall(binary, 1), self.recall(binary, 20))
+        # rescoring every row is exact
+        self.assertEqual(self.recall(binary, len(self.embeddings)), 1.0)
+
+    def test_default_rescore_multiplier_depends_on_the_quantization(self):
+        self.assertGreater(DEFAULT_RESCORE_MULTIPLIERS['binary'], DEFAULT_RESCORE_MULTIPLIERS['int8'])
+        binary = QuantizedEmbeddings.build('binary', self.embeddings)
+        self.assertEqual(self.recall(binary, None), self.recall(binary, DEFAULT_RESCORE_MULTIPLIERS['binary']))
+        self.assertGreaterEqual(self.recall(binary, None), 0.95)
+
+    def test_mask(self):
+        quantized = QuantizedEmbeddings.build('binary', self.embeddings)
+        mask = np.zeros(len(self.embeddings), dtype=bool)
+        mask[::7] = True
+        rows, _ = quantized_search(quantized, self.embeddings, self.norms, self.queries[:1], 500, mask=mask)[0]
+        self.assertEqual(sorted(rows.tolist()), np.flatnonzero(mask).tolist())
+
+
+class QuantizedNumpyDocumentStoreTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.path = self.tmp_dir / 'store'
+        self.embeddings = synthetic_embeddings(200, 32, clusters=10)
+        self.documents = [Document(id=f'd{i}', content=f'document {i}', meta={'group': i % 2},
+                                   embedding=self.embeddings[i].tolist()) for i in range(200)]
+
+    def test_quantized_copy_is_saved_and_searched(self):
+        NumpyDocumentStore(self.path, quantization='int8').write_documents(self.documents)
+        self.assertTrue((self.path / 'quantized-codes-1.npy').exists())
+        store = NumpyDocumentStore(self.path, quantization='int8')
+        self.assertIsInstance(store._state.quantized.codes, np.memmap)
+        documents = store.search_embeddings([self.embeddings[5].tolist()], top_k=3)[0]
+        self.assertEqual(documents[0].id, 'd5')
+        self.assertAlmostEqual(documents[0].score, 1.0, places=5)
+        filters = {'field': 'meta.group', 'operator': '==', 'value': 0}
+        documents = store.search_embeddings([self.embeddings[5].tolist()], top_k=3, filters=filters)[0]
+        self.assertEqual({document.meta['group'] for document in documents}, {0})
+
+    def test_store_saved_without_quantization(self):
+        """Test the quantized copy is built on load when the saved generation has none"""
+        NumpyDocumentStore(self.path).write_documents(self.documents)
+        store = NumpyDocumentStore(self.path, quantization='binary', rescore_multiplier=200)
+        self.assertEqual(store._state.quantized.kind, 'binary')
+        self.assertEqual(store.search_embeddings([self.embeddings[9].tolist()], top_k=1)[0][0].id, 'd9')
+        store.delete_documents(['d0'])
+        self.assertEqual(len(store._state.quantized.codes), 199)
+        self.assertFalse((self.path / 'quantized-codes-1.npy').exists())
+        self.assertTrue((self.path / 'quantized-codes-2.npy').exists())
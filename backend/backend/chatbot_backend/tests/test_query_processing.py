@@ -0,0 +1,98 @@
+from unittest import mock
+
+from django.test import TestCase
+
+from chatbot_backend.models import User, Conversation, Message
+from chatbot_backend.services import query_processing
+from chatbot_backend.services.history_cache import ConversationHistoryCache
+from chatbot_backend.services.processing_pipeline.config import PROCESSING_CONFIG
+
+
+class ConversationHistoryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123',
+            user_type='user'
+        )
+        self.conversation = Conversation.objects.create(user=self.user)
+
+    def add_turn(self, i):
+        Message.objects.create(conversation=self.conversation, role='user', content=f'question {i}')
+        Message.objects.create(conversation=self.conversation, role='assistant', content=f'answer {i}')
+
+    def test_history_is_bounded_and_ordered(self):
+        """Test only the last history_max_length user messages are returned, oldest first"""
+        for i in range(10):
+            self.add_turn(i)
+        with self.assertNumQueries(1):
+            history = query_processing.get_user_messages(self.conversation)
+        self.assertEqual(history, ['question 7', 'question 8', 'question 9'])
+
+    def test_history_length_follows_the_knowledge_base(self):
+        """Test the history length is read from the config of the conversation's knowledge base on every call"""
+        for i in range(10):
+            self.add_turn(i)
+        knowledge_bases = {'default': {}, 'laws': {'response_config': {'history_max_length': 5}}}
+        with mock.patch.dict(PROCESSING_CONFIG, {'knowledge_bases': knowledge_bases}):
+            self.conversation.knowledge_base = 'laws'
+            self.assertEqual(len(query_processing.get_user_messages(self.conversation)), 5)
+            self.conversation.knowledge_base = ''
+            self.assertEqual(len(query_processing.get_user_messages(self.conversation)), 3)
+            with mock.patch.dict(PROCESSING_CONFIG['response_config'], {'history_max_length': 2}):
+                self.assertEqual(query_processing.get_user_messages(self.conversation), ['question 8', 'question 9'])
+            # conversations without a knowledge base are served by default_knowledge_base
+            with mock.patch.dict(PROCESSING_CONFIG, {'default_knowledge_base': 'laws'}):
+                self.assertEqual(len(query_processing.get_user_messages(self.conversation)), 5)
+
+    def test_history_cache_follows_the_history_length(self):
+        """Test a buffer shorter than the history length asked for is read again from the database"""
+        history_cache = ConversationHistoryCache(history_length=3)
+        for i in range(5):
+            self.add_turn(i)
+        with mock.patch.object(query_processing, 'history_cache', history_cache):
+            query_processing.get_user_messages(self.conversation)
+            with mock.patch.dict(PROCESSING_CONFIG['response_config'], {'history_max_length': 2}):
+                Message.objects.create(conversation=self.conversation, role='user', content='question 5')
+                with self.assertNumQueries(0):
+                    history = query_processing.get_user_messages(self.conversation, 'question 5')
+                self.assertEqual(history, ['question 4', 'question 5'])
+            with mock.patch.dict(PROCESSING_CONFIG['response_config'], {'history_max_length': 4}):
+                Message.objects.create(conversation=self.conversation, role='user', content='question 6')
+                with self.assertNumQueries(1):
+                    history = query_processing.get_user_messages(self.conversation, 'question 6')
+                self.assertEqual(history, ['question 3', 'question 4', 'question 5', 'question 6'])
+
+    def test_history_query_uses_index(self):
+        """Test the history query is served by the (conversation, role, timestamp) index"""
+        plan = query_processing.recent_user_messages_query(self.conversation).explain()
+        self.assertIn('message_history_idx', plan)
+
+    def test_history_cache_skips_database(self):
+        """Test buffered conversations get their history without any query"""
+        history_cache = ConversationHistoryCache(history_length=3)
+        with mock.patch.object(query_processing, 'history_cache', history_cache):
+            for i in range(2):
+                self.add_turn(i)
+            Message.objects.create(conversation=self.conversation, role='user', content='question 2')
+            self.assertEqual(query_processing.get_user_messages(self.conversation, 'question 2'),
+                             ['question 0', 'question 1', 'question 2'])
+
+            Message.objects.create(conversation=self.conversation, role='user', content='question 3')
+            with self.assertNumQueries(0):
+                history = query_processing.get_user_messages(self.conversation, 'question 3')
+        self.assertEqual(history, ['question 1', 'question 2', 'question 3'])
+
+
+class ConversationHistoryCacheTests(TestCase):
+    def test_least_recent_conversation_is_evicted(self):
+        """Test the cache keeps at most max_conversations buffers"""
+        history_cache = ConversationHistoryCache(history_length=2, max_conversations=2)
+        history_cache.set(1, ['a'])
+        history_cache.set(2, ['b'])
+        history_cache.append(1, 'c')
+        history_cache.set(3, ['d'])
+        self.assertIsNone(history_cache.get(2))
+        self.assertEqual(history_cache.get(1), ['a', 'c'])
+        self.assertIsNone(history_cache.append(2, 'e'))
@@ -0,0 +1,95 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+from django.test import SimpleTestCase
+
+from chatbot_backend.services.processing_pipeline.registry import LazyRegistry, ActiveRegistry, active_registry
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent.parent
+
+
+class LazyRegistryTests(SimpleTestCase):
+    def setUp(self):
+        self.builds = []
+        self.registry = LazyRegistry()
+        self.registry.register('store', lambda: self.build('store'))
+        self.registry.register('pipeline', lambda: (self.build('pipeline'), self.registry.get('store')))
+        self.registry.register('reranker', lambda: None)
+
+    def build(self, name):
+        self.builds.append(name)
+        return object()
+
+    def test_built_on_first_use_and_shared(self):
+        self.assertEqual(self.builds, [])
+        self.assertFalse(self.registry.is_built('store'))
+        pipeline = self.registry.get('pipeline')
+        self.assertIs(self.registry.get('pipeline'), pipeline)
+        self.assertIs(pipeline[1], self.registry.get('store'))
+        self.assertEqual(self.builds, ['pipeline', 'store'])
+        # disabled objects (None) are built once too
+        self.assertIsNone(self.registry.get('reranker'))
+        self.assertTrue(self.registry.is_built('reranker'))
+
+    def test_built_once_across_threads(self):
+        def slow_factory():
+            time.sleep(0.05)
+            return self.build('slow')
+        self.registry.register('slow', slow_factory)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.registry.get('slow'))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.builds, ['slow'])
+        self.assertEqual(len({id(result) for result in results}), 1)
+
+    def test_reset_and_warmup(self):
+        store = self.registry.get('store')
+        self.registry.reset('store')
+        self.assertIsNot(self.registry.get('store'), store)
+        self.registry.reset()
+        self.assertEqual(self.registry.instances(), {})
+        self.registry.warmup('store')
+        self.assertEqual(set(self.registry.instances()), {'store'})
+        self.registry.warmup()
+        self.assertEqual(set(self.registry.instances()), {'store', 'pipeline', 'reranker'})
+
+    def test_child(self):
+        child = self.registry.child(shared=('store',))
+        self.assertIs(child.get('store'), self.registry.get('store'))
+        self.assertIsNot(child.get('pipeline'), self.registry.get('pipeline'))
+        self.assertEqual(set(child.instances()), {'pipeline'})
+        # factories are shared
+        self.registry.register('tokenizer', lambda: 'tokenizer')
+        self.assertEqual(child.get('tokenizer'), 'tokenizer')
+
+    def test_active_registry(self):
+        registry = ActiveRegistry(self.registry)
+        child = self.registry.child()
+        self.assertIs(registry.get('store'), self.registry.get('store'))
+        token = active_registry.set(child)
+        try:
+            self.assertIs(registry.get('store'), child.get('store'))
+        finally:
+            active_registry.reset(token)
+        self.assertIs(registry.get('store'), self.registry.get('store'))
+
+
+class StartupImportTests(SimpleTestCase):
+    def test_startup_does_not_import_haystack(self):
+        """Test loading the URLs and the WSGI app leaves haystack (and the pipelines) for the first chat message"""
+        code = (
+            "import sys, django; django.setup(); "
+            "import chatbot_backend.urls, backend.wsgi; "
+            "print(sorted({name.split('.')[0] for name in sys.modules} & {'haystack', 'haystack_integrations', 'chromadb'}))"
+        )
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE='backend.settings')
+        output = subprocess.run([sys.executable, '-c', code], cwd=BACKEND_DIR, env=env, capture_output=True, text=True,
+                                check=True).stdout
+        self.assertEqual(output.strip().splitlines()[-1], '[]')
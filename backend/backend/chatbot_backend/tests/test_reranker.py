@@ -0,0 +1,51 @@
+from django.test import SimpleTestCase
+from haystack import Document
+
+from chatbot_backend.services.processing_pipeline.custom.reranker import CrossEncoderModel, CrossEncoderRanker
+
+
+class FakeCrossEncoder:
+    """Scores a pair by how many query words the text contains"""
+    def __init__(self):
+        self.batches = []
+
+    def predict(self, pairs, **kwargs):
+        self.batches.append(len(pairs))
+        return [float(len(set(query.split()) & set(text.split()))) for query, text in pairs]
+
+
+class CrossEncoderRankerTests(SimpleTestCase):
+    def setUp(self):
+        self.model = CrossEncoderModel('cross-encoder/mmarco-mMiniLMv2-L12-H384-v1')
+        # skips loading the real model
+        self.model._model = FakeCrossEncoder()
+        self.documents = [Document(content=content, score=0.5) for content in
+                          ['a', 'a b', 'a b c', 'x', 'a b c d', 'y']]
+
+    def test_keeps_best_candidates(self):
+        """Test candidates are reordered by cross-encoder score and cut to top_k"""
+        ranker = CrossEncoderRanker(self.model, top_k=2, batch_size=4)
+        result = ranker.run(query='a b c d', documents=self.documents)
+        self.assertEqual([document.content for document in result['documents']], ['a b c d', 'a b c'])
+        self.assertEqual(self.model._model.batches, [4, 2])
+        self.assertEqual(result['meta']['candidates'], 6)
+        self.assertEqual(result['meta']['scored'], 6)
+        self.assertIn('latency_ms', result['meta'])
+        # the retrieved documents keep their own scores
+        self.assertEqual(self.documents[4].score, 0.5)
+
+    def test_early_exit(self):
+        """Test the remaining batches are skipped once top_k candidates are good enough"""
+        ranker = CrossEncoderRanker(self.model, top_k=1, batch_size=3, early_exit_score=3)
+        result = ranker.run(query='a b c', documents=self.documents)
+        self.assertEqual(result['documents'][0].content, 'a b c')
+        self.assertEqual(result['meta']['scored'], 3)
+        self.assertEqual(self.model._model.batches, [3])
+
+    def test_score_threshold(self):
+        """Test candidates under the threshold are dropped even if top_k isn't reached"""
+        ranker = CrossEncoderRanker(self.model, top_k=3, score_threshold=2)
+        result = ranker.run(query='a b', documents=self.documents)
+        self.assertEqual({document.content for document in result['documents']}, {'a b', 'a b c', 'a b c d'})
+        result = ranker.run(query='z', documents=self.documents)
+        self.assertEqual(result['documents'], [])
@@ -0,0 +1,254 @@
+import asyncio
+import hashlib
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Callable, List, Optional
+from unittest import mock
+
+import numpy as np
+from django.test import SimpleTestCase
+from haystack import component, Document
+from haystack.dataclasses import ChatMessage, StreamingChunk
+
+from chatbot_backend.services.processing_pipeline import response_pipeline
+from chatbot_backend.services.processing_pipeline.custom.answer_cache import SemanticAnswerCache
+from chatbot_backend.services.processing_pipeline.custom.context_packing import TokenCounter
+from chatbot_backend.services.processing_pipeline.custom.numpy_store import NumpyDocumentStore
+from chatbot_backend.services.processing_pipeline.knowledge_bases import KnowledgeBaseRegistry
+from chatbot_backend.services.processing_pipeline.registry import LazyRegistry, active_registry
+
+DIMENSION = 16
+
+
+def fake_embedding(text):
+    seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:4], 'little')
+    return np.random.default_rng(seed).normal(size=DIMENSION).astype(np.float32).tolist()
+
+
+@component
+class FakeTextEmbedder:
+    @component.output_types(embedding=List[float])
+    def run(self, text: str):
+        return {'embedding': fake_embedding(text)}
+
+
+@component
+class FakeChatGenerator:
+    """Replaces HuggingFaceAPIChatGenerator, built for main_llm then fallback_llm, replies with the tokens of its name"""
+    instances = []
+    tokens = {}
+
+    def __init__(self, api_type=None, api_params=None, token=None):
+        self.name = 'main_llm' if len(FakeChatGenerator.instances) % 2 == 0 else 'fallback_llm'
+        self.prompts = []
+        self.streamed = []
+        FakeChatGenerator.instances.append(self)
+
+    @component.output_types(replies=List[ChatMessage])
+    def run(self, messages: List[ChatMessage], streaming_callback: Optional[Callable] = None):
+        self.prompts.append(messages[0].text)
+        for token in self.tokens[self.name]:
+            if streaming_callback is not None:
+                streaming_callback(StreamingChunk(content=token))
+            self.streamed.append(token)
+        return {'replies': [ChatMessage.from_assistant(''.join(self.tokens[self.name]))]}
+
+    @component.output_types(replies=List[ChatMessage])
+    async def run_async(self, messages: List[ChatMessage], streaming_callback: Optional[Callable] = None):
+        self.prompts.append(messages[0].text)
+        for token in self.tokens[self.name]:
+            await asyncio.sleep(0.005)
+            if streaming_callback is not None:
+                await streaming_callback(StreamingChunk(content=token))
+            self.streamed.append(token)
+        return {'replies': [ChatMessage.from_assistant(''.join(self.tokens[self.name]))]}
+
+
+class FakeCrossEncoder:
+    """Scores documents by the number of query words they contain"""
+    def warm_up(self):
+        pass
+
+    def score(self, query, texts, batch_size=16):
+        words = set(query.split())
+        return [float(len(words & set(text.split()))) for text in texts]
+
+
+class ResponseGraphTestCase(SimpleTestCase):
+    """Builds the real response pipelines around fake generators, embedder and cross-encoder"""
+    config = {}
+
+    def setUp(self):
+        self.tmp_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        FakeChatGenerator.instances = []
+        FakeChatGenerator.tokens = {'main_llm': ['an ', 'answer'], 'fallback_llm': ['sorry']}
+
+        response_config = response_pipeline.PROCESSING_CONFIG['response_config']
+        config = {
+            'document_store': 'numpy',
+            'numpy_store': dict(response_config['numpy_store'], path=self.tmp_dir / 'store'),
+            'fallback': {'mode': 'sequential'},
+            'reranker': dict(response_config['reranker'], enabled=False),
+            'context_packing': dict(response_config['context_packing'], enabled=False),
+            'bm25': dict(response_config['bm25'], enabled=False),
+        }
+        config.update(self.config)
+        for patcher in [mock.patch.dict(response_config, config),
+                        mock.patch.object(response_pipeline, 'HuggingFaceAPIChatGenerator', FakeChatGenerator),
+                        mock.patch.object(response_pipeline, 'build_text_embedder', FakeTextEmbedder),
+                        mock.patch.object(response_pipeline, 'get_hf_token', return_value='token')]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        documents = [Document(id=f'd{i}', content=text, meta={'collection': 'faq'}, embedding=fake_embedding(text))
+                     for i, text in enumerate(['working hours are eight', 'annual leave is thirty days',
+                                               'salary is paid monthly', 'overtime is paid double'])]
+        NumpyDocumentStore(self.tmp_dir / 'store').write_documents(documents)
+
+        # the process registry's builders with the objects that would need models or the network replaced
+        self.registry = LazyRegistry(dict(response_pipeline.registry.default._factories))
+        self.registry.register('embedding_cache', lambda: None)
+        self.registry.register('token_counter', lambda: TokenCounter(None))
+        self.registry.register('cross_encoder', lambda: FakeCrossEncoder() if response_pipeline.get_response_config()["reranker"]["enabled"] else None)
+        self.registry.register('answer_cache', lambda: SemanticAnswerCache(vdb_path=None))
+        token = active_registry.set(self.registry)
+        self.addCleanup(active_registry.reset, token)
+        patcher = mock.patch.object(response_pipeline, 'knowledge_bases',
+                                    KnowledgeBaseRegistry({'default': {}}, default_registry=self.registry))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def llm_calls(self, name):
+        return sum(len(generator.prompts) for generator in FakeChatGenerator.instances if generator.name == name)
+
+    def streamed_tokens(self, name):
+        return sum(len(generator.streamed) for generator in FakeChatGenerator.instances if generator.name == name)
+
+
+class SpeculativeGraphTests(ResponseGraphTestCase):
+    config = {'fallback': {'mode': 'speculative'}}
+
+    def test_cached_answer_skips_the_fallback(self):
+        results = response_pipeline.run(['how long is annual leave'], 3)
+        self.assertEqual(response_pipeline.get_reply(results), 'an answer')
+        # speculation, the fallback ran next to main_llm
+        self.assertEqual((self.llm_calls('main_llm'), self.llm_calls('fallback_llm')), (1, 1))
+
+        results = response_pipeline.run(['how long is annual leave'], 3)
+        self.assertTrue(response_pipeline.get_is_cached(results))
+        self.assertEqual(response_pipeline.get_reply(results), 'an answer')
+        self.assertEqual((self.llm_calls('main_llm'), self.llm_calls('fallback_llm')), (1, 1))
+
+    def test_no_answer_stops_main_llm(self):
+        FakeChatGenerator.tokens = {'main_llm': ['no_', 'answer'] + [' more'] * 50, 'fallback_llm': ['sorry', '!']}
+        events = list(response_pipeline.stream_response(['what is the capital of france']))
+        self.assertEqual(events, [('token', 'sorry'), ('token', '!'), ('done', 'sorry!')])
+        self.assertLess(self.streamed_tokens('main_llm'), 10)
+
+    def test_router_picks_the_main_reply(self):
+        results = response_pipeline.run(['how long is annual leave'], 3)
+        self.assertFalse(response_pipeline.get_is_fallback(results))
+        self.assertEqual(response_pipeline.get_reply(results), 'an answer')
+
+    def test_router_picks_the_fallback_reply(self):
+        FakeChatGenerator.tokens = {'main_llm': ['no_answer'], 'fallback_llm': ['sorry']}
+        results = response_pipeline.run(['what is the capital of france'], 3)
+        self.assertTrue(response_pipeline.get_is_fallback(results))
+        self.assertEqual(response_pipeline.get_reply(results), 'sorry')
+        self.assertEqual(self.llm_calls('fallback_llm'), 1)
+
+
+class SequentialGraphTests(ResponseGraphTestCase):
+    def test_answer(self):
+        results = response_pipeline.run(['earlier question', 'how long is annual leave'], 3)
+        self.assertEqual(response_pipeline.get_reply(results), 'an answer')
+        self.assertFalse(response_pipeline.get_is_fallback(results))
+        self.assertEqual(len(response_pipeline.get_context(results)), 4)
+        prompt = results['main_promptbuilder']['prompt'][0].text
+        self.assertIn('annual leave is thirty days', prompt)
+        self.assertIn('earlier question', prompt)
+        self.assertEqual((self.llm_calls('main_llm'), self.llm_calls('fallback_llm')), (1, 0))
+
+    def test_no_answer_goes_to_the_fallback(self):
+        FakeChatGenerator.tokens = {'main_llm': ['no_answer'], 'fallback_llm': ['sorry']}
+        results = response_pipeline.run(['what is the capital of france'], 3)
+        self.assertTrue(response_pipeline.get_is_fallback(results))
+        self.assertEqual(response_pipeline.get_reply(results), 'sorry')
+        self.assertEqual((self.llm_calls('main_llm'), self.llm_calls('fallback_llm')), (1, 1))
+
+    def test_cached_answer_short_circuits_retrieval_and_generation(self):
+        response_pipeline.run(['how long is annual leave'], 3)
+        results = response_pipeline.run(['how long is annual leave'], 3)
+        self.assertTrue(response_pipeline.get_is_cached(results))
+        self.assertEqual(response_pipeline.get_reply(results), 'an answer')
+        self.assertNotIn('retriever', results)
+        self.assertNotIn('main_promptbuilder', results)
+        self.assertEqual((self.llm_calls('main_llm'), self.llm_calls('fallback_llm')), (1, 0))
+
+    def test_follow_up_answers_are_not_cached(self):
+        response_pipeline.run(['earlier question', 'how long is annual leave'], 3)
+        results = response_pipeline.run(['how long is annual leave'], 3)
+        self.assertFalse(response_pipeline.get_is_cached(results))
+        self.assertEqual(self.llm_calls('main_llm'), 2)
+
+    def test_follow_ups_are_not_answered_from_the_cache(self):
+        response_pipeline.run(['how long is annual leave'], 3)
+        results = response_pipeline.run(['earlier question', 'how long is annual leave'], 3)
+        self.assertFalse(response_pipeline.get_is_cached(results))
+        self.assertEqual(self.llm_calls('main_llm'), 2)
+        self.assertEqual(self.registry.get('answer_cache').stats()['misses'], 1)
+
+    def test_documents_indexed_by_another_process_are_retrieved(self):
+        response_pipeline.run(['how long is annual leave'], 3)
+        pipeline = self.registry.get('pipeline')
+        # written by another process, e.g. an ingestion job of run_job_workers
+        text = 'parental leave is ten weeks'
+        NumpyDocumentStore(self.tmp_dir / 'store').write_documents(
+            [Document(id='d4', content=text, meta={'collection': 'faq'}, embedding=fake_embedding(text))])
+
+        results = response_pipeline.run([text], 3)
+        self.assertEqual(response_pipeline.get_context(results)[0].content, text)
+        self.assertIsNot(self.registry.get('pipeline'), pipeline)
+        # nothing changed since, the pipeline is kept
+        pipeline = self.registry.get('pipeline')
+        response_pipeline.run(['is overtime paid double'], 3)
+        self.assertIs(self.registry.get('pipeline'), pipeline)
+
+    def test_async_pipeline(self):
+        results = asyncio.run(response_pipeline.run_async(['how long is annual leave'], 3))
+        self.assertEqual(response_pipeline.get_reply(results), 'an answer')
+        self.assertEqual(len(response_pipeline.get_context(results)), 4)
+
+
+class RetrievalGraphTests(ResponseGraphTestCase):
+    """BM25 fusion, cross-encoder reranking and context packing between the retriever and the prompt"""
+    def setUp(self):
+        response_config = response_pipeline.PROCESSING_CONFIG['response_config']
+        self.config = {
+            'bm25': dict(response_config['bm25'], enabled=True),
+            'reranker': dict(response_config['reranker'], enabled=True, candidates=4, top_k=2, score_threshold=None,
+                             early_exit_score=None),
+            'context_packing': dict(response_config['context_packing'], enabled=True),
+        }
+        super().setUp()
+
+    def test_hybrid_rerank_and_packing(self):
+        results = response_pipeline.run(['earlier question', 'is overtime paid double'], 3)
+        for name in ('retriever', 'hybrid_retriever', 'reranker', 'context_packer'):
+            self.assertIn(name, results)
+        documents = response_pipeline.get_context(results)
+        self.assertEqual(len(documents), 2)
+        # the fake cross-encoder ranks by shared words
+        self.assertEqual(documents[0].content, 'overtime is paid double')
+        prompt = results['main_promptbuilder']['prompt'][0].text
+        self.assertIn('overtime is paid double', prompt)
+        self.assertIn('earlier question', prompt)
+        self.assertNotIn('working hours are eight', prompt)
+
+    def test_filters_reach_every_retriever(self):
+        filters = {'field': 'meta.collection', 'operator': '==', 'value': 'laws'}
+        results = response_pipeline.run(['is overtime paid double'], 3, filters=filters)
+        self.assertEqual(results['retriever']['documents'], [])
+        self.assertEqual(response_pipeline.get_context(results), [])
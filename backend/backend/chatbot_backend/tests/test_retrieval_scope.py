@@ -0,0 +1,97 @@
+from unittest import mock
+
+from django.test import SimpleTestCase
+from rest_framework.test import APITestCase, APIClient
+from rest_framework import status
+
+from chatbot_backend.models import User, Conversation, Message, GenerationJob
+from chatbot_backend.services import generation_jobs
+from chatbot_backend.services.job_queue import JobQueue
+from chatbot_backend.services.query_processing import parse_scope, scope_filters, retrieval_filters
+from chatbot_backend.services.processing_pipeline import response_pipeline
+
+
+class ScopeTests(SimpleTestCase):
+    def test_parse_scope(self):
+        self.assertEqual(parse_scope({'collection': 'faq'}), {'collection': 'faq'})
+        self.assertEqual(parse_scope('{"language": ["ara", "eng"]}'), {'language': ['ara', 'eng']})
+        self.assertIsNone(parse_scope(None))
+        self.assertIsNone(parse_scope({}))
+        for scope in ['not json', ['faq'], {'author': 'me'}, {'collection': 3}, {'collection': []}]:
+            with self.subTest(scope=scope), self.assertRaises(ValueError):
+                parse_scope(scope)
+
+    def test_scope_filters(self):
+        self.assertIsNone(scope_filters(None))
+        self.assertEqual(scope_filters({'collection': 'faq'}),
+                         {'field': 'meta.collection', 'operator': '==', 'value': 'faq'})
+        self.assertEqual(scope_filters({'language': ['ara'], 'collection': 'faq'}), {'operator': 'AND', 'conditions': [
+            {'field': 'meta.collection', 'operator': '==', 'value': 'faq'},
+            {'field': 'meta.language', 'operator': 'in', 'value': ['ara']},
+        ]})
+
+    def test_message_scope_replaces_the_conversation_scope(self):
+        conversation = Conversation(scope={'collection': 'faq'})
+        self.assertEqual(retrieval_filters(conversation)['value'], 'faq')
+        self.assertEqual(retrieval_filters(conversation, {'collection': 'laws'})['value'], 'laws')
+
+    @mock.patch.object(response_pipeline.registry, 'get', return_value=None)
+    def test_filters_are_sent_to_the_retriever(self, registry_get):
+        filters = {'field': 'meta.collection', 'operator': '==', 'value': 'faq'}
+        data = response_pipeline.build_run_data(['a question'], 3, filters=filters)
+        self.assertEqual(data['retriever'], {'filters': filters})
+        self.assertNotIn('retriever', response_pipeline.build_run_data(['a question'], 3))
+
+
+class ScopedMessageTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123',
+            user_type='user'
+        )
+        self.conversation = Conversation.objects.create(user=self.user, title='Scoped')
+        self.client = APIClient()
+        self.client.login(username='testuser', password='testpass123')
+        self.conversation_url = f'/api/conversations/{self.conversation.id}/'
+        self.messages_url = f'/api/conversations/{self.conversation.id}/messages/'
+
+    def test_conversation_scope(self):
+        response = self.client.patch(self.conversation_url, {'scope': {'collection': 'faq'}}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['scope'], {'collection': 'faq'})
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.scope, {'collection': 'faq'})
+
+        response = self.client.patch(self.conversation_url, {'scope': {'author': 'me'}}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('scope', response.data)
+
+    @mock.patch('chatbot_backend.views.conversation_views.generate_response', return_value='an answer')
+    def test_message_scope(self, generate_response):
+        """Test the scope sent with a message reaches generation and is kept on the user message"""
+        response = self.client.post(self.messages_url, {'content': 'a question', 'scope': {'language': 'ara'}},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(generate_response.call_args.kwargs['scope'], {'language': 'ara'})
+        user_message = Message.objects.get(conversation=self.conversation, role='user')
+        self.assertEqual(user_message.metadata, {'scope': {'language': 'ara'}})
+
+    @mock.patch('chatbot_backend.views.conversation_views.generate_response', return_value='an answer')
+    def test_invalid_message_scope(self, generate_response):
+        response = self.client.post(self.messages_url, {'content': 'a question', 'scope': {'author': 'me'}},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        generate_response.assert_not_called()
+        self.assertFalse(Message.objects.exists())
+
+    @mock.patch('chatbot_backend.services.generation_jobs.generate_response', return_value='an answer')
+    def test_background_job_keeps_the_message_scope(self, generate_response):
+        queue = JobQueue(GenerationJob, generation_jobs.run_generation_job, workers=0)
+        with mock.patch.object(generation_jobs, '_generation_queue', queue):
+            response = self.client.post(self.messages_url + '?background=1',
+                                        {'content': 'a question', 'scope': {'collection': 'faq'}}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+            queue.run_once()
+        self.assertEqual(generate_response.call_args.kwargs['scope'], {'collection': 'faq'})
@@ -0,0 +1,58 @@
+import os
+import shutil
+import tempfile
+import zipfile
+from pathlib import Path
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from chatbot_backend.services.processing_pipeline import config
+
+
+class LoadVdbTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.zip_path = self.tmp_dir / 'vdb.zip'
+        self.vdb_path = self.tmp_dir / 'vectordb'
+        self.write_zip({'chroma.sqlite3': 'v1'})
+
+    def write_zip(self, files):
+        with zipfile.ZipFile(self.zip_path, 'w') as zip_ref:
+            for name, content in files.items():
+                zip_ref.writestr(name, content)
+
+    def test_first_load_extracts(self):
+        """Test the zip is extracted with a manifest next to its content"""
+        self.assertTrue(config.load_vdb(self.zip_path, self.vdb_path))
+        self.assertEqual((self.vdb_path / 'chroma.sqlite3').read_text(), 'v1')
+        manifest = config.read_vdb_manifest(self.vdb_path)
+        self.assertEqual(manifest['checksum'], config.file_checksum(self.zip_path))
+        # no staging or lock leftovers apart from the lock file
+        self.assertEqual(sorted(p.name for p in self.tmp_dir.iterdir()), ['.vectordb.lock', 'vdb.zip', 'vectordb'])
+
+    def test_unchanged_zip_is_not_extracted_again(self):
+        """Test a matching manifest skips extraction"""
+        config.load_vdb(self.zip_path, self.vdb_path)
+        with mock.patch.object(config.zipfile.ZipFile, 'extractall') as extractall:
+            config.load_vdb(self.zip_path, self.vdb_path)
+            # touching the zip only costs a checksum, not an extraction
+            os.utime(self.zip_path, ns=(0, 0))
+            config.load_vdb(self.zip_path, self.vdb_path)
+        extractall.assert_not_called()
+
+    def test_changed_zip_replaces_store(self):
+        """Test a new zip replaces the extracted store, stale files included"""
+        config.load_vdb(self.zip_path, self.vdb_path)
+        (self.vdb_path / 'stale.bin').write_text('old')
+        self.write_zip({'chroma.sqlite3': 'v2'})
+        config.load_vdb(self.zip_path, self.vdb_path)
+        self.assertEqual((self.vdb_path / 'chroma.sqlite3').read_text(), 'v2')
+        self.assertFalse((self.vdb_path / 'stale.bin').exists())
+
+    def test_extracted_store_is_used_without_zip(self):
+        """Test an already extracted store is opened directly when there is no zip"""
+        self.vdb_path.mkdir()
+        self.assertTrue(config.load_vdb(self.tmp_dir / 'missing.zip', self.vdb_path))
+        self.assertFalse(config.load_vdb(self.tmp_dir / 'missing.zip', self.tmp_dir / 'missing'))
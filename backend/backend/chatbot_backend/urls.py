@@ -3,12 +3,16 @@ from rest_framework.routers import DefaultRouter
 from chatbot_backend.views import (
     conversation_views,
     auth_views,
-    
+    async_conversation_views,
+    job_views,
+    ingestion_views,
 )
 
 # Create router for main resources
 router = DefaultRouter()
 router.register(r'conversations', conversation_views.ConversationListView, basename='conversation')
+router.register(r'jobs', job_views.GenerationJobView, basename='generation-job')
+router.register(r'documents', ingestion_views.IngestionJobView, basename='ingestion-job')
 
 urlpatterns = [
     # Authentication endpoints
@@ -21,6 +25,12 @@ urlpatterns = [
     path('conversations/<int:conversation_id>/messages/', 
          conversation_views.MessageListView.as_view({'get': 'list', 'post': 'create'}), 
          name='message-list'),
+    path('conversations/<int:conversation_id>/messages/stream/', 
+         conversation_views.MessageListView.as_view({'post': 'stream'}), 
+         name='message-stream'),
+    path('conversations/<int:conversation_id>/messages/async/', 
+         async_conversation_views.create_message, 
+         name='message-create-async'),
     
     # Include router URLs
     path('', include(router.urls)),
@@ -1,3 +1,4 @@
+import json
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent.parent
@@ -13,3 +14,8 @@ def read_secrets(key):
     kv_pairs = [[kv[0].strip(), kv[1].strip()] for kv in kv_pairs if len(kv)==2]
     check = [kv for kv in kv_pairs if kv[0] == key] 
     return [kv for kv in kv_pairs if kv[0] == key][0][1]
+
+
+def format_sse(event, data):
+    """Formats one Server-Sent Events frame, data is sent as JSON"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
@@ -0,0 +1,68 @@
+import json
+
+from django.http import JsonResponse
+from django.views.decorators.http import require_POST
+
+from chatbot_backend.models import Conversation, Message
+from chatbot_backend.serializers import MessageSerializer
+from chatbot_backend.services.query_processing import agenerate_response, parse_scope, adiscard_user_message
+
+
+@require_POST
+async def create_message(request, conversation_id):
+    """
+    Async counterpart of MessageListView.create.
+    When served through ASGI (backend/asgi.py) the worker is not blocked while the
+    embedder and LLM calls are in flight, so one process can serve many conversations at once.
+    DRF views are sync only, so this is a plain Django view that mirrors the DRF responses.
+    """
+    user = await request.auser()
+    if not user.is_authenticated:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=403)
+
+    try:
+        # Filter to ONLY include conversations owned by the current user
+        conversation = await Conversation.objects.filter(user=user).aget(id=conversation_id)
+    except Conversation.DoesNotExist:
+        return JsonResponse({'detail': 'Conversation not found'}, status=404)
+
+    content = get_content(request)
+    try:
+        scope = parse_scope(get_field(request, 'scope'))
+    except ValueError as e:
+        return JsonResponse({'scope': [str(e)]}, status=400)
+
+    user_message = await Message.objects.acreate(
+        conversation=conversation,
+        role='user',
+        content=content,
+        metadata={'scope': scope} if scope else None
+    )
+
+    try:
+        response_text = await agenerate_response(conversation, user_message.content, scope=scope)
+    except Exception:
+        # nothing will answer this message, same as MessageListView.create
+        await adiscard_user_message(user_message)
+        raise
+
+    assistant_msg = await Message.objects.acreate(
+        conversation=conversation,
+        role='assistant',
+        content=response_text
+    )
+
+    return JsonResponse(MessageSerializer(assistant_msg).data, status=201)
+
+
+def get_content(request):
+    return get_field(request, 'content', '')
+
+
+def get_field(request, name, default=None):
+    if request.content_type == 'application/json':
+        try:
+            return json.loads(request.body or b'{}').get(name, default)
+        except (ValueError, AttributeError):
+            return default
+    return request.POST.get(name, default)
@@ -1,59 +1,169 @@
 from django.db import transaction
+from django.db.models import Count
+from django.http import StreamingHttpResponse
 
 from rest_framework import viewsets, status
+from rest_framework.decorators import action
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from rest_framework.exceptions import PermissionDenied
+from rest_framework.exceptions import PermissionDenied, ValidationError
 from chatbot_backend.models import Conversation, Message 
-from chatbot_backend.serializers import ConversationSerializer, MessageSerializer
-from chatbot_backend.services.query_processing import generate_response
+from chatbot_backend.serializers import ConversationSerializer, MessageSerializer, GenerationJobSerializer
+from chatbot_backend.renderers import EventStreamRenderer
+from chatbot_backend.pagination import ConversationCursorPagination, MessageCursorPagination
+from chatbot_backend.services.query_processing import (generate_response, stream_response, parse_scope,
+                                                        list_knowledge_bases, discard_user_message)
+from chatbot_backend.services.generation_jobs import get_generation_queue, is_background_mode, enqueue_generation
+from chatbot_backend.services.job_queue import QueueFull
+from chatbot_backend.utils import format_sse
 from rest_framework.exceptions import NotFound 
 
 
 class ConversationListView(viewsets.ModelViewSet):
     serializer_class = ConversationSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = ConversationCursorPagination
     
     def get_queryset(self):
-        return Conversation.objects.filter(user=self.request.user)
+        # same order with and without pagination
+        return (Conversation.objects.filter(user=self.request.user).annotate(message_count=Count('messages'))
+                .order_by(*ConversationCursorPagination.ordering))
     
     def perform_create(self, serializer):
         conversation = serializer.save(user=self.request.user)
+        conversation.message_count = 0
         return conversation
 
+    @action(detail=False, methods=['get'], url_path='knowledge-bases')
+    def knowledge_bases(self, request):
+        """Knowledge bases a conversation can be answered from"""
+        return Response(list_knowledge_bases())
+
 class MessageListView(viewsets.ViewSet):
     permission_classes = [IsAuthenticated]
+    pagination_class = MessageCursorPagination
+    
+    def get_renderers(self):
+        if self.action == 'stream':
+            return [JSONRenderer(), EventStreamRenderer()]
+        return super().get_renderers()
     
     def list(self, request, conversation_id=None):
         # Verify user owns the conversation using filtered queryset
         conversation = self.get_conversation(conversation_id)
         messages = Message.objects.filter(conversation=conversation)
+
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(messages, request, view=self)
+        if page is not None:
+            return paginator.get_paginated_response(MessageSerializer(page, many=True).data)
+
         serializer = MessageSerializer(messages, many=True)
         return Response(serializer.data)
         
-    @transaction.atomic
     def create(self, request, conversation_id=None):
         # Verify user owns the conversation
         conversation = self.get_conversation(conversation_id)
         
-        # Create user message
+        scope = self.get_scope(request)
+        if is_background_mode(request):
+            return self.create_in_background(request, conversation, scope)
+        
+        # Create user message, committed right away so no transaction (and on SQLite
+        # no database write lock) is held during the seconds of LLM generation
         user_message = Message.objects.create(
             conversation=conversation,
             role='user',
-            content=request.data.get('content', '')
+            content=request.data.get('content', ''),
+            metadata={'scope': scope} if scope else None
         )
         
-        # Generate mock response (simplified)
-        response_text = generate_response(conversation, user_message.content)
+        try:
+            response_text = generate_response(conversation, user_message.content, scope=scope)
+        except Exception:
+            # nothing will answer this message, drop it as the rollback used to
+            discard_user_message(user_message)
+            raise
+        
+        # Create assistant message in its own short transaction
+        with transaction.atomic():
+            assistant_msg = Message.objects.create(
+                conversation=conversation,
+                role='assistant',
+                content=response_text
+            )
+        
+        return Response(MessageSerializer(assistant_msg).data, status=status.HTTP_201_CREATED)
+    
+    def create_in_background(self, request, conversation, scope=None):
+        """Queues the generation and answers right away with the job, its result is polled at jobs/<id>/"""
+        try:
+            get_generation_queue().check_capacity(request.user)
+        except QueueFull as e:
+            return Response({'detail': str(e)}, status=status.HTTP_429_TOO_MANY_REQUESTS, headers={'Retry-After': '5'})
+        
+        with transaction.atomic():
+            # the worker reads the message's scope from its metadata
+            user_message = Message.objects.create(
+                conversation=conversation,
+                role='user',
+                content=request.data.get('content', ''),
+                metadata={'scope': scope} if scope else None
+            )
+            job = enqueue_generation(conversation, user_message)
         
-        # Create assistant message
-        assistant_msg = Message.objects.create(
+        return Response(GenerationJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+    
+    def stream(self, request, conversation_id=None):
+        """Same as create, but the assistant reply is streamed token by token as Server-Sent Events"""
+        conversation = self.get_conversation(conversation_id)
+        scope = self.get_scope(request)
+        
+        user_message = Message.objects.create(
             conversation=conversation,
-            role='assistant',
-            content=response_text
+            role='user',
+            content=request.data.get('content', ''),
+            metadata={'scope': scope} if scope else None
         )
         
-        return Response(MessageSerializer(assistant_msg).data, status=status.HTTP_201_CREATED)
+        response = StreamingHttpResponse(
+            self.stream_events(conversation, user_message, scope),
+            content_type='text/event-stream'
+        )
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'  # stop proxies (nginx) from buffering the stream
+        return response
+    
+    def stream_events(self, conversation, user_message, scope=None):
+        yield format_sse('user_message', MessageSerializer(user_message).data)
+        try:
+            for event, payload in stream_response(conversation, user_message.content, scope=scope):
+                if event == 'token':
+                    yield format_sse('token', {'content': payload})
+                elif event == 'reset':
+                    yield format_sse('reset', {})
+                elif event == 'done':
+                    # the assistant message is only saved once the whole reply is known
+                    assistant_msg = Message.objects.create(
+                        conversation=conversation,
+                        role='assistant',
+                        content=payload
+                    )
+                    yield format_sse('done', MessageSerializer(assistant_msg).data)
+        except Exception as e:
+            print("streaming failed:", e)
+            # same as create, the unanswered message is dropped
+            user_message_id = user_message.id
+            discard_user_message(user_message)
+            yield format_sse('error', {'detail': 'Failed to generate a response', 'user_message': user_message_id})
+    
+    def get_scope(self, request):
+        """The scope sent with the message, it replaces the conversation's for this answer only"""
+        try:
+            return parse_scope(request.data.get('scope'))
+        except ValueError as e:
+            raise ValidationError({'scope': [str(e)]})
     
     def get_conversation(self, conversation_id):
         try:
@@ -0,0 +1,81 @@
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.utils.text import get_valid_filename
+
+from rest_framework import viewsets, status
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from chatbot_backend.models import IngestionJob
+from chatbot_backend.serializers import IngestionJobSerializer
+from chatbot_backend.services.ingestion_jobs import enqueue_ingestion, get_ingestion_queue, ingestion_stats
+from chatbot_backend.services.job_queue import QueueFull
+from chatbot_backend.services.query_processing import parse_knowledge_base
+
+SUPPORTED_EXTENSIONS = ('.pdf', '.docx', '.doc', '.txt')  # see custom/converters.py
+
+
+class IngestionJobView(viewsets.ReadOnlyModelViewSet):
+    """
+    Document upload: POST multipart 'files' (one or more), every file is stored and queued for
+    indexing into the knowledge base named by the optional 'knowledge_base' field (the default one otherwise),
+    the response lists the created jobs (202).
+    Poll a job until its status is 'done' or 'failed'. Once 'done' the document is queryable, every web process
+    answers from it from its next message on, no restart or reload needed.
+    Knowledge bases are shared by every user, only staff can add to them.
+    """
+    serializer_class = IngestionJobSerializer
+    permission_classes = [IsAdminUser]
+
+    def get_queryset(self):
+        return IngestionJob.objects.filter(user=self.request.user)
+
+    def initialize_request(self, request, *args, **kwargs):
+        # uploads are written to a temporary file chunk by chunk, never kept in memory whatever their size
+        request.upload_handlers = [TemporaryFileUploadHandler(request)]
+        return super().initialize_request(request, *args, **kwargs)
+
+    def create(self, request):
+        content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+        if content_length > settings.INGESTION_QUEUE['max_upload_size']:
+            return Response(
+                {'detail': f"Uploads are limited to {settings.INGESTION_QUEUE['max_upload_size']} bytes per request"},
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+            )
+
+        files = request.FILES.getlist('files') or request.FILES.getlist('file')
+        if not files:
+            return Response({'detail': "No files were uploaded, send them as multipart 'files'"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        unsupported = [file.name for file in files if not file.name.lower().endswith(SUPPORTED_EXTENSIONS)]
+        if unsupported:
+            return Response({'detail': f"Unsupported file types: {', '.join(unsupported)}. "
+                                       f"Supported formats are PDF, DOCX, DOC, and TXT."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        for file in files:
+            try:
+                get_valid_filename(file.name)
+            except SuspiciousFileOperation:
+                return Response({'detail': f"Invalid file name: {file.name}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            knowledge_base = parse_knowledge_base(request.data.get('knowledge_base', ''))
+        except ValueError as e:
+            return Response({'knowledge_base': [str(e)]}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            # every file is a job
+            get_ingestion_queue().check_capacity(request.user, count=len(files))
+        except QueueFull as e:
+            return Response({'detail': str(e)}, status=status.HTTP_429_TOO_MANY_REQUESTS)
+
+        jobs = [enqueue_ingestion(request.user, file, knowledge_base) for file in files]
+        serializer = self.get_serializer(jobs, many=True)
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=False, methods=['get'])
+    def stats(self, request):
+        """Queued, running and failed jobs, and the indexing throughput of the last hour (every user's jobs)"""
+        return Response(ingestion_stats())
@@ -0,0 +1,69 @@
+import time
+
+from django.http import StreamingHttpResponse
+from django.urls import reverse
+
+from rest_framework import viewsets
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
+from chatbot_backend.models import GenerationJob
+from chatbot_backend.serializers import GenerationJobSerializer, MessageSerializer
+from chatbot_backend.renderers import EventStreamRenderer
+from chatbot_backend.utils import format_sse
+
+
+class GenerationJobView(viewsets.ReadOnlyModelViewSet):
+    """Background generation jobs of the current user, poll a job until its status is 'done' or 'failed'"""
+    serializer_class = GenerationJobSerializer
+    permission_classes = [IsAuthenticated]
+    # the job is read again after poll_interval, doubled after every unchanged read up to max_poll_interval
+    poll_interval = 0.5  # seconds
+    max_poll_interval = 5  # seconds
+    # a stream holds a server worker, past this the client is sent the job URL to poll instead
+    stream_timeout = 60  # seconds
+
+    def get_queryset(self):
+        return (GenerationJob.objects.filter(user=self.request.user)
+                .select_related('user_message', 'assistant_message'))
+
+    def get_renderers(self):
+        if self.action == 'events':
+            return [JSONRenderer(), EventStreamRenderer()]
+        return super().get_renderers()
+
+    @action(detail=True, methods=['get'])
+    def events(self, request, pk=None):
+        """
+        Pushes the job status as Server-Sent Events until it is finished, instead of polling.
+        The stream ends with 'done', 'error', or 'timeout' (with the URL to poll) after stream_timeout.
+        """
+        job = self.get_object()
+        poll_url = request.build_absolute_uri(reverse('generation-job-detail', args=[job.id]))
+        response = StreamingHttpResponse(self.job_events(job, poll_url), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    def job_events(self, job, poll_url):
+        last_status = None
+        deadline = time.monotonic() + self.stream_timeout
+        interval = self.poll_interval
+        while True:
+            job.refresh_from_db()
+            if job.status != last_status:
+                last_status = job.status
+                interval = self.poll_interval
+                yield format_sse('status', {'id': job.id, 'status': job.status})
+            if job.status == 'done':
+                yield format_sse('done', MessageSerializer(job.assistant_message).data)
+                return
+            if job.status == 'failed':
+                yield format_sse('error', {'detail': job.error})
+                return
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            time.sleep(min(interval, remaining))
+            interval = min(interval * 2, self.max_poll_interval)
+        yield format_sse('timeout', {'id': job.id, 'status': job.status, 'poll_url': poll_url})